@@ -1,14 +1,117 @@
+import argparse
+import concurrent.futures
 import glob
-import tqdm
 import os
+import shutil
+import subprocess
+import sys
+import time
+
+import tqdm
+
+from fleet import meshformat
 
 GIBSON_V2_MESHES = r'PATH_TO_GIBSONV2_MESHES'
 MESHLABSERVER_EXE = r'PATH_TO_MESHLABSERVER_EXE'
+PARTIAL_SUFFIX = '.partial'
+STALE_HOURS = 6.0 # partials untouched for this long were left by a crashed run, newer ones may be a running converter's
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(description="Converts the GibsonV2 PLY meshes in parallel, to OBJ through MeshLab "
+        "or to the binary mesh format natively. Converted meshes are skipped, so an interrupted run resumes.")
+    parser.add_argument('ply_files', type=str, help='Convert only these meshes (e.g. the mesh of a pipeline item) instead of the whole folder.',\
+        nargs='*')
+    parser.add_argument('--meshes', type=str, help='The GibsonV2 meshes folder.',\
+        default=GIBSON_V2_MESHES)
+    parser.add_argument('--meshlabserver', type=str, help='MeshLab server executable path.',\
+        default=MESHLABSERVER_EXE)
+    parser.add_argument('--format', type=str, help='Convert to .obj (with MeshLab) or to the binary .npz meshes (read natively).',\
+        default='obj', choices=['obj', 'npz'])
+    parser.add_argument('--workers', type=int, help='Meshes converted in parallel.',\
+        default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument('--stale_hours', type=float, help='Age (hours) beyond which partial outputs are taken as left by a crashed run and deleted.',\
+        default=STALE_HOURS)
+    parser.add_argument('--force', help='Convert the meshes again even if they are up to date.',\
+        default=False, action='store_true')
+    return parser.parse_known_args(args)
+
+def get_output_path(ply_file, format):
+    return os.path.splitext(ply_file)[0] + '.' + format
+
+def is_converted(ply_file, format):
+    """Whether the output exists and is newer, a crashed conversion never leaving one behind."""
+    output_path = get_output_path(ply_file, format)
+    return os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(ply_file)
+
+def convert_obj(ply_file, meshlabserver):
+    """
+    Converts in a scratch folder next to the mesh and renames the outputs into
+    place, the .obj last so that it only exists once complete.
+    """
+    start = time.time()
+    folder, name = os.path.dirname(ply_file), os.path.splitext(os.path.basename(ply_file))[0]
+    scratch = os.path.join(folder, f".{name}.{os.getpid()}{PARTIAL_SUFFIX}")
+    os.makedirs(scratch, exist_ok=True)
+    try:
+        obj_file = os.path.join(scratch, name + '.obj')
+        result = subprocess.run([meshlabserver, "-i", ply_file, "-o", obj_file, "-m", "vn", "vt", "wt"],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        if result.returncode != 0 or not os.path.exists(obj_file):
+            raise RuntimeError(f"meshlabserver exited with {result.returncode}: {result.stdout.strip()[-500:]}")
+        for filename in os.listdir(scratch): # the .mtl
+            if filename != name + '.obj':
+                os.replace(os.path.join(scratch, filename), os.path.join(folder, filename))
+        os.replace(obj_file, get_output_path(ply_file, 'obj'))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return time.time() - start
+
+def get_last_write(path):
+    """The latest modification of the path, of the files in it for a scratch folder."""
+    if not os.path.isdir(path):
+        return os.path.getmtime(path)
+    return max([os.path.getmtime(path)] + [os.path.getmtime(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files])
+
+def remove_stale_partials(folder, stale_hours):
+    """Deletes the partial outputs of crashed runs, leaving those of converters still writing to the folder."""
+    for scratch in glob.glob(os.path.join(folder, '.*' + PARTIAL_SUFFIX)) + glob.glob(os.path.join(folder, '*' + PARTIAL_SUFFIX)):
+        try:
+            if time.time() - get_last_write(scratch) < stale_hours * 3600.0:
+                continue
+            if os.path.isdir(scratch):
+                shutil.rmtree(scratch, ignore_errors=True)
+            else:
+                os.remove(scratch)
+        except OSError: # finished and renamed meanwhile
+            pass
 
-ply_files = glob.glob(os.path.join(GIBSON_V2_MESHES, '*.ply'))
+def convert(ply_file, format, meshlabserver):
+    if format == 'npz': # written aside and renamed as well
+        return meshformat.convert(ply_file, get_output_path(ply_file, format))
+    return convert_obj(ply_file, meshlabserver)
 
-for ply_file in tqdm.tqdm(ply_files, desc='Converting GibsonV2'):
-    if os.path.exists(ply_file.replace('ply', 'obj')):
-        continue
-    cmd = f"\"{MESHLABSERVER_EXE}\" -i {ply_file} -o {ply_file.replace('ply', 'obj')} -m vn vt wt"
-    os.system(cmd)
\ No newline at end of file
+if __name__ == "__main__":
+    args, unknown = parse_arguments(sys.argv[1:])
+    remove_stale_partials(args.meshes, args.stale_hours)
+    ply_files = sorted(args.ply_files or glob.glob(os.path.join(args.meshes, '*.ply')))
+    pending = [f for f in ply_files if args.force or not is_converted(f, args.format)]
+    print(f"Converting {len(pending)} of {len(ply_files)} GibsonV2 meshes to .{args.format} with {args.workers} workers.")
+    timings, failed = {}, []
+    started = time.time()
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as pool:
+        futures = { pool.submit(convert, ply_file, args.format, args.meshlabserver): ply_file for ply_file in pending }
+        for future in tqdm.tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc='Converting GibsonV2'):
+            ply_file = futures[future]
+            try:
+                timings[ply_file] = future.result()
+                tqdm.tqdm.write(f"Converted {os.path.basename(ply_file)} in {timings[ply_file]:.1f}s.")
+            except (OSError, RuntimeError, ValueError) as e:
+                failed.append(ply_file)
+                tqdm.tqdm.write(f"!!! - Could not convert {ply_file} ({e}).")
+    if timings:
+        slowest = max(timings, key=timings.get)
+        print(f"Converted {len(timings)} meshes in {time.time() - started:.1f}s ({sum(timings.values()) / len(timings):.1f}s each on average, "
+            f"the slowest {os.path.basename(slowest)} in {timings[slowest]:.1f}s).")
+    if failed:
+        print(f"!!! - {len(failed)} meshes failed, run again to retry them.")
+        sys.exit(1)
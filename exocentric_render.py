@@ -1,18 +1,28 @@
 import os
 import argparse
 import sys
-import subprocess
-import multiprocessing
-import pyexcel
-import itertools
-import nvgpu
+
+from fleet import executor
+from fleet import cost
+from fleet import devices
+from fleet import jobqueue
+from fleet import journal
+from fleet import manifest
+from fleet import meshformat
+from fleet import staging
+from fleet import textures
+from fleet import watchdog
 
 DEFAULT_M3D_PATH = r'PATH_TO_MATTERPORT3D'
 DEFAULT_DRONE_TRAJECTORIES = r'PATH_TO_TRAJECTORY_FOLDERS'
 DEFAULT_BLENDER_PATH = r'PATH_TO_BLENDER_EXE'
 DEFAULT_OUTPUT_PATH = r'PATH_TO_DUMP_RESULTS'
+DEFAULT_LOG_PATH = ".\\logs"
+DEFAULT_TIMINGS_PATH = ".\\timings.json"
+DEFAULT_MANIFEST_PATH = ".\\manifest.json"
 DEFAULT_RENDER_SCRIPT_PATH = ".\\render\\PilotRender.py"
-DEFAULT_RENDERED_TRAJECTORIES_PATH = ".\\pilot.xlsx"
+DEFAULT_RENDERED_TRAJECTORIES_PATH = ".\\pilot.jsonl"
+DEFAULT_EGOCENTRIC_TRAJECTORIES_PATH = ".\\drone.jsonl"
 DEFAULT_DRONE_MODEL_PATH = r'PATH_TO_FBX'
 
 def parse_arguments(args):
@@ -34,39 +44,75 @@ def parse_arguments(args):
     parser.add_argument('--render_script', type=str, help='The render script path.',\
         default=DEFAULT_RENDER_SCRIPT_PATH)
     parser.add_argument('--rendered_trajectories', type=str, 
-        help='The .xlsx file with the already rendered Matterport3D buildings that will be appended to during rendering.',\
+        help='The .jsonl journal of the rendered trajectories that will be appended to during rendering (legacy .xlsx sheets are still read).',\
         default=DEFAULT_RENDERED_TRAJECTORIES_PATH)
     parser.add_argument('--drone_model', type=str, help='The .fbx file of the drone model to be used.',\
         default=DEFAULT_DRONE_MODEL_PATH) #TODO: add model
+    parser.add_argument('--egocentric_path', type=str, 
+        help='Output folder for the egocentric views, when given they are rendered in the same session as the exocentric ones.',\
+        default=None)
+    parser.add_argument('--egocentric_trajectories', type=str, 
+        help='The .jsonl journal of the rendered egocentric trajectories (used along with --egocentric_path).',\
+        default=DEFAULT_EGOCENTRIC_TRAJECTORIES_PATH)
+    parser.add_argument('--persistent', help='Keep one scene-resident Blender worker per GPU instead of a process per trajectory.',\
+        default=False, action='store_true')
+    parser.add_argument('--log_path', type=str, help='Folder where each job\'s Blender output is logged at.',\
+        default=DEFAULT_LOG_PATH)
+    parser.add_argument('--timeout', type=float, help='Seconds after which a job is killed (no limit by default).',\
+        default=None)
+    parser.add_argument('--retries', type=int, help='How many times a failed or timed out job is retried.',\
+        default=2)
+    parser.add_argument('--timings', type=str, help='The .json file with the job timings used to order the jobs longest first.',\
+        default=DEFAULT_TIMINGS_PATH)
+    parser.add_argument('--jobs_per_gpu', type=int, help='Maximum concurrent jobs on a GPU, when their predicted memory fits.',\
+        default=2)
+    parser.add_argument('--cpu_workers', type=int, help='CPU render workers taking jobs when no GPU can (automatic on GPU-less nodes).',\
+        default=0)
+    parser.add_argument('--cpu_threads', type=int, help='Render threads of each CPU worker (shares all cores by default).',\
+        default=None)
+    parser.add_argument('--queue', type=str, help='Shared job queue folder, for several driver instances (or nodes) working together.',\
+        default=None)
+    parser.add_argument('--lease', type=float, help='Seconds after which a claimed job of an unresponsive instance is requeued.',\
+        default=600.0)
+    parser.add_argument('--max_shards', type=int, help='Split jobs that would outlast an even share of the work into at most this many pose shards (defaults to the device count, 1 disables splitting).',\
+        default=None)
+    parser.add_argument('--manifest', type=str, help='The .json manifest caching the dataset folder listings and pose counts between launches.',\
+        default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument('--scene_cache', type=str, help='Folder of the prepared .blend scenes the render scripts open instead of importing the meshes (pre-warmed with fleet/prewarm.py).',\
+        default=None)
+    parser.add_argument('--staging_path', type=str, help='Local scratch folder the scenes are copied to before they are rendered (not staged if not given).',\
+        default=None)
+    parser.add_argument('--staging_size', type=float, help='Size cap of the staged scenes (GB), the least recently used ones are evicted beyond it.',\
+        default=100.0)
+    parser.add_argument('--memory_interval', type=float, help='Seconds between the samples of the resident and device memory of the jobs (0 disables the memory watchdog).',\
+        default=watchdog.DEFAULT_INTERVAL)
+    parser.add_argument('--min_free_memory', type=float, help='Host memory (GB) below which the memory watchdog kills the largest job, to rerun it alone.',\
+        default=watchdog.DEFAULT_MIN_AVAILABLE / 1024.0)
+    parser.add_argument('--binary_meshes', help='Render the binary meshes converted with fleet/meshformat.py instead of the .obj meshes they are up to date with.',\
+        default=False, action='store_true')
+    parser.add_argument('--weld', help='Have the render scripts merge coincident vertices and drop degenerate and duplicate faces when importing the scenes.',\
+        default=False, action='store_true')
+    parser.add_argument('--texture_cache', type=str, help='Local folder of the downscaled textures prepared with fleet/textures.py (full size textures if not given).',\
+        default=None)
+    parser.add_argument('--texture_budget', type=float, help='Memory budget (MB) of the textures of each job, coarser levels are used beyond it.',\
+        default=textures.DEFAULT_BUDGET)
+    parser.add_argument('--crop', help='Have the render scripts delete the faces beyond the far plane of every pose of the trajectories of a job.',\
+        default=False, action='store_true')
     return parser.parse_known_args(args)
 
-COMMAND = (
-    "{0} --background --python {1} -- " # use blender's exe and render script's path
-    "--samples {2} --scene_model {3} --output_path {4} " # 
-    "--camera_path {5} --device_type {6} --dataset matterport3d " # use \pose path and input flag
-    "--width 320 --height 240 --drone_model {7} --drone dji " # currently fixed to DJI and M3D
-    "--log_sheet {8} " # use primary render group flag
-    )
-
-def render_trajectory(t):
-    command, queue = t
-    gpu_id = queue.get()
-    try:
-        command += "--device_id " + str(gpu_id)
-        print(command)
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=None, shell=True)
-        output = process.communicate()
-        print(output[0])
-    finally:
-        queue.put(gpu_id)
-
-def process(t):
-    command, queue = t
-    gpu_id = queue.get()
-    try:
-        command += "--device_id " + str(gpu_id)
-    finally:
-        queue.put(gpu_id)
+def get_render_arguments(args, mesh, trajectory_files):
+    joint_arguments = [
+        "--egocentric", "--ego_output_path", args.egocentric_path,
+        "--ego_journal", args.egocentric_trajectories,
+    ] if args.egocentric_path else []
+    return joint_arguments + [
+        "--samples", "512", "--scene_model", mesh, "--output_path", args.rendered_path,
+        "--camera_path", *trajectory_files, "--dataset", "matterport3d",
+        "--width", "320", "--height", "240", "--drone_model", args.drone_model, "--drone", "dji", # currently fixed to DJI and M3D
+        "--journal", args.rendered_trajectories,
+        "-d", "--normal_map", "-f", "-r", "-m", "--silhouette", "--combined",
+    ] + (["--scene_cache", args.scene_cache] if args.scene_cache else []) + (["--weld"] if args.weld else []) + (["--crop"] if args.crop else []) \
+        + (["--texture_cache", args.texture_cache, "--texture_budget", str(args.texture_budget)] if args.texture_cache else [])
 
 if __name__ == "__main__":
     if 'PROGRAMFILES' in os.environ.keys():
@@ -77,54 +123,43 @@ if __name__ == "__main__":
             )
             if nvidia_smi_path not in os.environ['PATH']:
                 os.environ['PATH'] = os.environ['PATH'] + ";" + nvidia_smi_path
-    gpus = len(nvgpu.available_gpus(max_used_percent=30.0))
     args, unknown = parse_arguments(sys.argv)
     buildings_root = os.path.join(args.m3d, "v1", "scans")
     print("Working on M3D buildings @ %s" % buildings_root)    
-    rendered_trajectories = [] 
-    if args.rendered_trajectories is not None and os.path.exists(args.rendered_trajectories):
-        data = pyexcel.get_sheet(file_name=args.rendered_trajectories)
-        rendered_trajectories.extend(data.column_at(0))
-    commands = []
-    building_hashes = {}
-    for building_folder in os.listdir(buildings_root):
-        building_hash = os.path.join(buildings_root, building_folder, building_folder, "matterport_mesh")
-        for root, dirs, files in os.walk(building_hash, topdown = False):
-            obj = next((s for s in files if 'obj' in s), None)
-            mesh = os.path.join(root, obj)            
-            building_hashes.update({building_folder: mesh})
-            if obj is not None:
-                break
-    for traj in os.listdir(args.generated_trajectories):
-        mesh = building_hashes[traj]
+    rendered_trajectories = journal.load_completed(args.rendered_trajectories)
+    if args.egocentric_path: # a trajectory is only done when both of its views are
+        rendered_trajectories &= journal.load_completed(args.egocentric_trajectories)
+    jobs = []
+    dataset_manifest = manifest.Manifest(args.manifest)
+    for traj in dataset_manifest.get_dirs(args.generated_trajectories):
+        mesh = dataset_manifest.find_file(os.path.join(buildings_root, traj, traj, "matterport_mesh"), 'obj')
+        if mesh is None:
+            print("!!! - No mesh found for building %s." % traj)
+            continue
         trajectory_folder = os.path.join(args.generated_trajectories, traj)
-        for trajectory_date in os.listdir(trajectory_folder):
+        trajectory_files = [] # all dates of a building are rendered within a single scene load
+        for trajectory_date in dataset_manifest.listdir(trajectory_folder):
             if trajectory_date in rendered_trajectories:
-                print("Skipping already rendered building (%s)" % building_hash)
+                print("Skipping already rendered trajectory (%s)" % trajectory_date)
                 continue
-            for root, dirs, files in os.walk(os.path.join(trajectory_folder, trajectory_date), topdown = False):
-                txt = next((s for s in files if 'airsim_rec_blender' in s), None)
-                trajectory_file = os.path.join(root, txt)
-                if txt is None:
-                    break #TODO: check this
-            cmd = COMMAND.format(
-                    args.blender, #1
-                    args.render_script, #2
-                    512, #3
-                    mesh, #4
-                    args.rendered_path, #5
-                    trajectory_file, #6
-                    'GPU', #7
-                    args.drone_model, #8
-                    args.rendered_trajectories, #9,
-                ) + " -d --normal_map -f -r -m --silhouette --combined "
-            commands.extend([cmd])
+            trajectory_file = dataset_manifest.find_file(os.path.join(trajectory_folder, trajectory_date), 'airsim_rec_blender')
+            if trajectory_file is not None:
+                trajectory_files.append(trajectory_file)
+        if trajectory_files:
+            jobs.append(executor.Job(traj, get_render_arguments(args, meshformat.find_binary(mesh) if args.binary_meshes else mesh, trajectory_files)))
 
-    pool = multiprocessing.Pool(processes=gpus)
-    m = multiprocessing.Manager()
-    q = m.Queue()
-    for gpu_ids in range(gpus):
-        q.put(gpu_ids)    
-    pool.map(render_trajectory, zip(commands, itertools.repeat(q, len(commands))))
-    pool.close()
-    pool.join()
\ No newline at end of file
+    memory_watchdog = watchdog.MemoryWatchdog(args.memory_interval, args.min_free_memory * 1024.0) \
+        if args.memory_interval > 0 else None
+    scheduler = devices.DeviceScheduler(max_used_percent=30.0, jobs_per_gpu=args.jobs_per_gpu,
+        cpu_workers=args.cpu_workers, cpu_threads=args.cpu_threads, affinity=args.persistent,
+        host_memory=memory_watchdog.get_budget() if memory_watchdog is not None else None)
+    cost_model = cost.CostModel(args.timings, dataset_manifest)
+    jobs = cost_model.order(jobs, scheduler.get_concurrency(), 
+        args.max_shards if args.max_shards is not None else scheduler.get_concurrency())
+    dataset_manifest.save()
+    render_executor = executor.Executor(args.blender, args.render_script, scheduler,
+        log_path=args.log_path, timeout=args.timeout, retries=args.retries, persistent=args.persistent,
+        cost_model=cost_model, job_queue=jobqueue.JobQueue(args.queue, args.lease) if args.queue else None,
+        staging=staging.StagingCache(args.staging_path, args.staging_size) if args.staging_path else None,
+        watchdog=memory_watchdog)
+    render_executor.run(jobs)
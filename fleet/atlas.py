@@ -0,0 +1,167 @@
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from fleet import meshformat
+
+DEFAULT_MAX_SIZE = 8192 # texels, the side of the largest atlas
+PADDING = 4 # texels of edge replicated around every texture, against bleeding when filtered
+UV_EPSILON = 1e-3 # UVs beyond [0, 1] by more than this wrap, their textures stay out of the atlases
+
+def get_atlas_path(filepath: str, index: int, extension: str) -> str:
+    return f"{os.path.splitext(filepath)[0]}_atlas_{index}{extension}"
+
+def pack(sizes: List[Tuple[int, int]], max_size: int) -> List[Tuple[int, int, int]]:
+    """
+    Shelf packs the padded rectangles, tallest first, into atlases of at most
+    max_size texels a side. Returns the atlas and the offset of each rectangle.
+    """
+    places = [None] * len(sizes)
+    atlas, x, y, shelf = 0, 0, 0, 0
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        width, height = sizes[i][0] + 2 * PADDING, sizes[i][1] + 2 * PADDING
+        if x + width > max_size: # next shelf
+            x, y, shelf = 0, y + shelf, 0
+        if y + height > max_size: # next atlas
+            atlas, x, y, shelf = atlas + 1, 0, 0, 0
+        places[i] = (atlas, x, y)
+        x, shelf = x + width, max(shelf, height)
+    return places
+
+def paste_padded(atlas, image, x: int, y: int):
+    """Pastes the image with its edges replicated PADDING texels around it."""
+    width, height = image.size
+    atlas.paste(image, (x + PADDING, y + PADDING))
+    for box, size, position in [
+        ((0, 0, 1, height), (PADDING, height), (x, y + PADDING)),
+        ((width - 1, 0, width, height), (PADDING, height), (x + PADDING + width, y + PADDING)),
+        ((0, 0, width, 1), (width, PADDING), (x + PADDING, y)),
+        ((0, height - 1, width, height), (width, PADDING), (x + PADDING, y + PADDING + height)),
+        ((0, 0, 1, 1), (PADDING, PADDING), (x, y)),
+        ((width - 1, 0, width, 1), (PADDING, PADDING), (x + PADDING + width, y)),
+        ((0, height - 1, 1, height), (PADDING, PADDING), (x, y + PADDING + height)),
+        ((width - 1, height - 1, width, height), (PADDING, PADDING), (x + PADDING + width, y + PADDING + height)),
+    ]:
+        atlas.paste(image.crop(box).resize(size), position)
+
+def get_shading_key(entry: Optional[dict]) -> Optional[tuple]:
+    """Materials of the same key shade alike once their textures share an atlas."""
+    if entry is None:
+        return None
+    return (tuple(entry.get('diffuse', [])), entry.get('alpha', 1.0))
+
+def build(filepath: str, arrays: Dict[str, numpy.ndarray], materials: List[dict], max_size: int=DEFAULT_MAX_SIZE) \
+    -> Tuple[Dict[str, numpy.ndarray], List[dict]]:
+    """
+    Packs the textures of the mesh into atlases written next to it, remaps the UVs of
+    their faces, and collapses the materials that then shade alike. The original
+    material of every face and the original names are kept as a side table
+    (original_material_ids and material_names) for the label lookups.
+    """
+    material_ids = arrays['material_ids'].astype(numpy.int64)
+    loop_materials = numpy.repeat(material_ids, arrays['loop_total'])
+    uvs = arrays['uvs'].copy() if 'uvs' in arrays else None
+    textures = sorted(set(m['texture'] for m in materials if m and 'texture' in m and os.path.exists(m['texture'])))
+    if uvs is not None:
+        wrapping = set(loop_materials[((uvs < -UV_EPSILON) | (uvs > 1.0 + UV_EPSILON)).any(axis=1)])
+        textures = [t for t in textures if not any(i in wrapping for i, m in enumerate(materials) if m and m.get('texture') == t)]
+    else:
+        textures = []
+    images = {}
+    for texture in textures:
+        with Image.open(texture) as image:
+            images[texture] = image.size if max(image.size) + 2 * PADDING <= max_size else None
+    textures = [t for t in textures if images[t] is not None]
+    places = dict(zip(textures, pack([images[t] for t in textures], max_size)))
+    atlases = []
+    for index in sorted(set(p[0] for p in places.values())):
+        placed = [t for t in textures if places[t][0] == index]
+        width = max(places[t][1] + images[t][0] + 2 * PADDING for t in placed)
+        height = max(places[t][2] + images[t][1] + 2 * PADDING for t in placed)
+        sources = [Image.open(t) for t in placed]
+        alpha = any(s.mode in ('RGBA', 'LA', 'P') for s in sources)
+        atlas = Image.new('RGBA' if alpha else 'RGB', (width, height))
+        for texture, source in zip(placed, sources):
+            paste_padded(atlas, source.convert(atlas.mode), places[texture][1], places[texture][2])
+            source.close()
+        atlas_path = get_atlas_path(filepath, index, '.png' if alpha else '.jpg')
+        temp_path = f"{atlas_path}.{os.getpid()}.partial{os.path.splitext(atlas_path)[1]}"
+        atlas.save(temp_path, **({} if alpha else { 'quality': 95 }))
+        os.replace(temp_path, atlas_path)
+        atlases.append((atlas_path, width, height))
+    collapsed, table, names, remap = {}, [], set(), numpy.zeros(len(materials), dtype=numpy.int64)
+    for i, entry in enumerate(materials):
+        texture = entry.get('texture') if entry else None
+        if texture in places:
+            atlas_path, width, height = atlases[places[texture][0]]
+            _, x, y = places[texture]
+            u, v = images[texture]
+            selected = loop_materials == i
+            uvs[selected, 0] = (x + PADDING + uvs[selected, 0] * u) / width
+            uvs[selected, 1] = 1.0 - (y + PADDING + (1.0 - uvs[selected, 1]) * v) / height
+            key = ('atlas', atlas_path) + get_shading_key(entry)
+            replacement = dict(entry, name=f"atlas_{places[texture][0]}", texture=atlas_path)
+        else:
+            key = ('texture', texture) + (get_shading_key(entry) or ())
+            replacement = entry
+        if key not in collapsed:
+            collapsed[key] = len(table)
+            if replacement is not None:
+                name = replacement['name'] if replacement['name'] not in names else f"{replacement['name']}_{len(table)}"
+                names.add(name)
+                replacement = dict(replacement, name=name)
+            table.append(replacement)
+        remap[i] = collapsed[key]
+    atlased = dict(arrays)
+    if uvs is not None:
+        atlased['uvs'] = uvs.astype(numpy.float32)
+    atlased['material_ids'] = remap[material_ids].astype(arrays['material_ids'].dtype)
+    if 'original_material_ids' not in arrays: # else atlased again, the first side table stands
+        atlased['original_material_ids'] = arrays['material_ids']
+        atlased['material_names'] = numpy.array([m['name'] if m else '' for m in materials])
+    return atlased, table
+
+def convert(filepath: str, max_size: int=DEFAULT_MAX_SIZE) -> Tuple[float, int, int]:
+    """Atlases a source or binary mesh into its binary mesh, returning the time and the material counts."""
+    start = time.time()
+    arrays, materials = meshformat.read_source(filepath)
+    atlased, table = build(filepath, arrays, materials, max_size)
+    meshformat.write(meshformat.get_binary_path(filepath), atlased, table)
+    return time.time() - start, len(materials), len(table)
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(description="Packs the textures of meshes into a few atlases, remapping their UVs and "
+        "collapsing the materials that then shade alike, and writes them as binary meshes that keep a side table of "
+        "the original material names for the label maps.")
+    parser.add_argument('paths', type=str, help='The meshes (source or binary), or folders searched for them.', nargs='+')
+    parser.add_argument('--extension', type=str, help='The meshes searched in the folders.', default='.obj', choices=meshformat.SOURCE_EXTENSIONS + (meshformat.EXTENSION,))
+    parser.add_argument('--max_size', type=int, help='Side (texels) of the largest atlas.', default=DEFAULT_MAX_SIZE)
+    parser.add_argument('--workers', type=int, help='Meshes atlased in parallel.', default=max(1, (os.cpu_count() or 1) // 2))
+    return parser.parse_known_args(args)
+
+if __name__ == "__main__":
+    args, unknown = parse_arguments(sys.argv[1:])
+    if Image is None:
+        print("!!! - Packing the textures needs Pillow (pip install pillow).")
+        sys.exit(1)
+    meshes = meshformat.find_meshes(args.paths, args.extension)
+    print(f"Atlasing {len(meshes)} meshes with {args.workers} workers.")
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as pool:
+        futures = { pool.submit(convert, mesh, args.max_size): mesh for mesh in meshes }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                duration, before, after = future.result()
+                print(f"Atlased {futures[future]} in {duration:.1f}s, {before} -> {after} materials.")
+            except (OSError, ValueError) as e:
+                print(f"!!! - Could not atlas {futures[future]} ({e}).")
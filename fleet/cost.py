@@ -0,0 +1,216 @@
+import argparse
+import csv
+import heapq
+import json
+import math
+import os
+import statistics
+
+from typing import Dict, List, Tuple
+
+IMPORT_SECONDS_PER_TRIANGLE = 2e-5
+IMPORT_SECONDS_PER_TEXTURE = 0.5
+RENDER_SECONDS_PER_SAMPLE = 2.5e-8 # per pixel, per frame
+PASS_OVERHEAD = 0.25 # relative cost of each extra output pass
+BASE_MEGABYTES = 300.0 # Blender and Cycles kernels
+MEGABYTES_PER_TRIANGLE = 250e-6 # geometry and BVH
+MEGABYTES_PER_TEXTURE = 16.0 # a 2k RGBA texture
+TEXTURE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+def parse_render_arguments(args: List[str]):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--scene_model', '--input_file', dest='scene_model', default=None)
+    parser.add_argument('--camera_path', default=[], nargs='+')
+    parser.add_argument('--width', default=320, type=int)
+    parser.add_argument('--height', default=None, type=int)
+    parser.add_argument('--samples', default=256, type=int)
+    parser.add_argument('--angles', default=[0], nargs='*')
+    parser.add_argument('--positions', default=['center'], nargs='*')
+    parser.add_argument('--cameras', default=['perspective'], nargs='*')
+    parser.add_argument('--shard', default=None)
+    parser.add_argument('--pose_range', default=None, nargs=2, type=int)
+    parser.add_argument('-m', '--mask', default=False, action='store_true')
+    parser.add_argument('-e', '--egocentric', default=False, action='store_true')
+    for flags in [('-c', '--color'), ('-r', '--raw'), ('-d', '--depth'), ('-n', '--normals'), ('--normal_map',),
+        ('-f', '--flow'), ('-l', '--labels'), ('-p', '--pretty_labels'), ('-s', '--silhouette'), ('--combined',)]:
+        parser.add_argument(*flags, default=False, action='store_true')
+    parsed, _ = parser.parse_known_args(args)
+    return parsed
+
+def count_poses(camera_path: str) -> int:
+    if os.path.isdir(camera_path): # GibsonV2 pose folders
+        camera_path = os.path.join(camera_path, 'camera_poses.csv')
+        with open(camera_path) as f:
+            return sum(1 for _ in csv.reader(f))
+    with open(camera_path) as f: # AirSim tuples, with a header line
+        return max(sum(1 for _ in f) - 1, 0)
+
+def count_assigned(poses: int, shard: str=None, pose_range: List[int]=None) -> int:
+    indices = range(poses)
+    if shard:
+        index, count = (int(v) for v in shard.split('/'))
+        indices = indices[index::count]
+    if pose_range:
+        indices = [i for i in indices if pose_range[0] <= i < pose_range[1]]
+    return len(indices)
+
+def count_mesh(filepath: str) -> Tuple[int, int]:
+    folder = os.path.dirname(filepath)
+    textures = sum(1 for f in os.listdir(folder) if f.lower().endswith(TEXTURE_EXTENSIONS))
+    if filepath.endswith('.ply'):
+        with open(filepath, 'rb') as f:
+            for line in f:
+                if line.startswith(b'element face'):
+                    return int(line.split()[-1]), textures
+                if line.startswith(b'end_header'):
+                    break
+        return 0, textures
+    if filepath.endswith('.npz'):
+        from fleet import meshformat # needs numpy, only then
+        return meshformat.count_faces(filepath), textures
+    faces, tail = 0, b'\n'
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 24), b''):
+            faces += (tail + chunk).count(b'\nf ')
+            tail = chunk[-2:]
+    return faces, textures
+
+class CostModel(object):
+    """
+    Predicts the duration of render jobs from their scene, poses and output settings,
+    calibrated with the timings of previous runs stored in a json file.
+    """
+    def __init__(self, history_path: str=None, manifest=None):
+        self.history_path = history_path
+        self.manifest = manifest # caches the pose counts, when given
+        self.history = { 'meshes': {}, 'jobs': {}, 'scenes': {} }
+        if history_path and os.path.exists(history_path):
+            with open(history_path) as f:
+                self.history.update(json.load(f))
+
+    def get_mesh_features(self, filepath: str) -> Dict[str, int]:
+        stat = os.stat(filepath)
+        cached = self.history['meshes'].get(filepath)
+        if cached is None or cached['mtime'] != stat.st_mtime or cached['size'] != stat.st_size:
+            triangles, textures = count_mesh(filepath)
+            cached = { 'mtime': stat.st_mtime, 'size': stat.st_size, 'triangles': triangles, 'textures': textures }
+            self.history['meshes'][filepath] = cached
+        return cached
+
+    def get_features(self, args: List[str]) -> Dict[str, float]:
+        parsed = parse_render_arguments(args)
+        mesh = self.get_mesh_features(parsed.scene_model) \
+            if parsed.scene_model and os.path.exists(parsed.scene_model) else { 'triangles': 0, 'textures': 0 }
+        counter = self.manifest.count_poses if self.manifest is not None else count_poses
+        poses = sum(count_assigned(counter(p), parsed.shard, parsed.pose_range) 
+            for p in parsed.camera_path if os.path.exists(p))
+        if 'spherical' in parsed.cameras:
+            height = parsed.width // 2
+            frames_per_pose = len(parsed.cameras) * len(parsed.angles) * len(parsed.positions)
+        else: # AirSim frame pairs, optionally with the drone only and egocentric pairs
+            height = parsed.height or (240 if parsed.mask else 180)
+            frames_per_pose = 2 * (1 + int(parsed.mask) + int(parsed.egocentric))
+        passes = sum(int(getattr(parsed, p)) for p in ['color', 'raw', 'depth', 'normals', 'normal_map', 
+            'flow', 'labels', 'pretty_labels', 'silhouette', 'combined'])
+        return {
+            'triangles': mesh['triangles'], 'textures': mesh['textures'], 'poses': poses, 'frames': poses * frames_per_pose,
+            'pixels': parsed.width * height, 'samples': parsed.samples, 'passes': passes,
+        }
+
+    def get_load_estimate(self, features: Dict[str, float]) -> float:
+        return features['triangles'] * IMPORT_SECONDS_PER_TRIANGLE + features['textures'] * IMPORT_SECONDS_PER_TEXTURE
+
+    def get_raw_estimate(self, features: Dict[str, float]) -> float:
+        load = self.get_load_estimate(features)
+        frame = features['pixels'] * features['samples'] * RENDER_SECONDS_PER_SAMPLE \
+            * (1.0 + PASS_OVERHEAD * max(features['passes'] - 1, 0))
+        return load + features['frames'] * frame
+
+    def get_memory_estimate(self, features: Dict[str, float]) -> float:
+        return BASE_MEGABYTES + features['triangles'] * MEGABYTES_PER_TRIANGLE \
+            + features['textures'] * MEGABYTES_PER_TEXTURE \
+            + features['pixels'] * max(features['passes'], 1) * 16e-6
+
+    def get_calibration(self, name: str=None) -> float:
+        if name in self.history['jobs']: # same job rendered before, e.g. with fewer poses
+            entry = self.history['jobs'][name]
+            return entry['seconds'] / max(self.get_raw_estimate(entry['features']), 1e-6)
+        ratios = [entry['seconds'] / max(self.get_raw_estimate(entry['features']), 1e-6)
+            for entry in self.history['jobs'].values()]
+        return statistics.median(ratios) if ratios else 1.0
+
+    def estimate(self, job) -> float:
+        job.features = self.get_features(job.args)
+        calibration = self.get_calibration(job.name)
+        job.cost = self.get_raw_estimate(job.features) * calibration
+        job.reload = self.get_load_estimate(job.features) * calibration
+        footprint = self.history['scenes'].get(job.scene, {}) # peaks of earlier jobs
+        job.memory = max(self.get_memory_estimate(job.features), footprint.get('vram', 0.0))
+        job.rss = footprint.get('rss', job.memory)
+        return job.cost
+
+    def record(self, job, seconds: float):
+        if getattr(job, 'features', None) is None:
+            job.features = self.get_features(job.args)
+        self.history['jobs'][job.name] = { 'seconds': seconds, 'features': job.features }
+
+    def record_memory(self, job):
+        if job.scene is None or (job.peak_rss is None and job.peak_vram is None):
+            return
+        footprint = self.history['scenes'].setdefault(job.scene, {})
+        for key, peak in [('rss', job.peak_rss), ('vram', job.peak_vram)]:
+            if peak is not None:
+                footprint[key] = max(footprint.get(key, 0.0), peak)
+
+    def save(self):
+        if not self.history_path:
+            return
+        temp_path = self.history_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.history, f, indent=1)
+        os.replace(temp_path, self.history_path)
+
+    def split(self, jobs: List, devices: int, max_shards: int) -> List:
+        """
+        Splits the (estimated) jobs that would outlast an even share of the total
+        work into round robin pose shards, so that a single large scene is rendered
+        by several devices instead of dominating the fleet ETA.
+        """
+        share = sum(job.cost for job in jobs) / max(devices, 1)
+        split = []
+        for job in jobs:
+            count = min(max_shards, job.features.get('poses', 1), int(math.ceil(job.cost / share))) \
+                if share > 0 else 1
+            if count <= 1:
+                split.append(job)
+                continue
+            print(f"Splitting {job} into {count} shards.")
+            for index in range(count):
+                shard = job.get_shard(index, count)
+                self.estimate(shard)
+                split.append(shard)
+        return split
+
+    def order(self, jobs: List, devices: int, max_shards: int=1) -> List:
+        """
+        Sorts the jobs longest-processing-time-first and prints the fleet ETA
+        of dispatching them in that order to the given number of devices,
+        after splitting the oversized ones into up to max_shards shards.
+        """
+        for job in jobs:
+            self.estimate(job)
+        if max_shards > 1:
+            jobs = self.split(jobs, devices, max_shards)
+        self.save() # keep the mesh statistics for the next launch
+        ordered = sorted(jobs, key=lambda job: job.cost, reverse=True)
+        makespan = get_makespan([job.cost for job in ordered], devices)
+        total = sum(job.cost for job in ordered)
+        print(f"Estimated {total / 3600.0:.2f} device hours for {len(jobs)} jobs, "
+            f"fleet ETA {makespan / 3600.0:.2f} hours on {devices} devices.")
+        return ordered
+
+def get_makespan(costs: List[float], devices: int) -> float:
+    loads = [0.0] * max(devices, 1)
+    for cost in costs: # each job goes to the device that frees up first
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
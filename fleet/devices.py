@@ -0,0 +1,195 @@
+import asyncio
+import os
+import time
+
+from typing import List, Optional
+
+try:
+    import nvgpu
+except ImportError:
+    nvgpu = None
+
+DEFAULT_CPU_THREADS = 8
+
+def get_gpu_info() -> List[dict]:
+    if nvgpu is None:
+        return []
+    try:
+        return nvgpu.gpu_info()
+    except Exception as e: # no driver or nvidia-smi on this node
+        print(f"Could not query the GPUs ({e}).")
+        return []
+
+class Device(object):
+    def __init__(self, device_type: str, device_id: int, memory: float=None, threads: int=None, max_jobs: int=1):
+        self.type = device_type
+        self.id = device_id
+        self.memory = memory # MB, GPUs only
+        self.external = 0.0 # MB used by processes that are not ours
+        self.available = True
+        self.threads = threads
+        self.max_jobs = max_jobs
+        self.jobs = []
+        self.idle = [] # (scene, memory, rss) kept loaded by the idle persistent workers of this device
+
+    def __str__(self):
+        return f"{self.type}:{self.id}"
+
+    def get_arguments(self) -> List[str]:
+        arguments = ["--device_type", self.type, "--device_id", str(self.id)]
+        if self.threads:
+            arguments += ["--threads", str(self.threads)]
+        return arguments
+
+    def get_scenes(self) -> List[str]:
+        return [scene for scene, _, _ in self.idle]
+
+    def get_idle(self, scene: Optional[str]=None) -> List[tuple]:
+        """The footprints of the idle workers, but for one holding the scene, which takes its job."""
+        idle = list(self.idle)
+        held = next((entry for entry in idle if scene is not None and entry[0] == scene), None)
+        if held is not None:
+            idle.remove(held)
+        return idle
+
+    def get_reserved(self, scene: Optional[str]=None) -> float:
+        return sum(job.memory or 0.0 for job in self.jobs) + sum(memory or 0.0 for _, memory, _ in self.get_idle(scene))
+
+    def get_free(self, scene: Optional[str]=None) -> float:
+        return (self.memory or 0.0) - self.external - self.get_reserved(scene)
+
+    def get_remaining(self, scene: str, now: float) -> Optional[float]:
+        times = [max((job.cost or 0.0) - (now - job.started), 0.0) for job in self.jobs 
+            if job.scene == scene and job.started is not None]
+        return min(times) if times else None
+
+    def fits(self, job, headroom: float=0.0) -> bool:
+        if not self.available or len(self.jobs) >= self.max_jobs:
+            return False
+        if not self.jobs: # a lone job always gets its chance
+            return True
+        if job.exclusive or any(j.exclusive for j in self.jobs): # killed for running out of memory before
+            return False
+        return self.memory is not None and self.get_free(job.scene) - (job.memory or 0.0) >= self.memory * headroom
+
+class DeviceScheduler(object):
+    """
+    Places jobs on the GPUs whose (re-polled) free memory fits their predicted
+    footprint, sharing a GPU among several small scenes, with optional CPU
+    workers that take jobs when no GPU can, or all of them on GPU-less nodes.
+    With a host memory budget, jobs only start while the (learned) resident
+    footprints of the running ones leave room for theirs.
+    With affinity, a job goes to the device whose persistent worker has its scene
+    loaded, and waits for it when it is busy for less than the scene reload time.
+    Idle persistent workers count with the footprint of the scene they keep loaded.
+    """
+    def __init__(self,
+        max_used_percent: float=30.0,
+        jobs_per_gpu: int=1,
+        cpu_workers: int=0,
+        cpu_threads: Optional[int]=None,
+        poll_interval: float=60.0,
+        headroom: float=0.1,
+        affinity: bool=False,
+        host_memory: Optional[float]=None,
+    ):
+        self.max_used_percent = max_used_percent
+        self.jobs_per_gpu = jobs_per_gpu
+        self.poll_interval = poll_interval
+        self.headroom = headroom
+        self.affinity = affinity
+        self.host_memory = host_memory # MB
+        self.deadlines = {} # until when jobs wait for the busy device holding their scene
+        self.condition = None
+        self.gpus = {}
+        self.poll()
+        if not self.gpus and cpu_workers == 0:
+            cpu_workers = max(1, (os.cpu_count() or 1) // (cpu_threads or DEFAULT_CPU_THREADS))
+            print(f"No GPUs found, falling back to {cpu_workers} CPU workers.")
+        threads = cpu_threads or max(1, (os.cpu_count() or 1) // max(cpu_workers, 1))
+        self.cpus = [Device('CPU', i, threads=threads) for i in range(cpu_workers)]
+
+    def get_devices(self) -> List[Device]:
+        return list(self.gpus.values()) + self.cpus
+
+    def get_concurrency(self) -> int:
+        return max(1, sum(1 for d in self.get_devices() if d.available))
+
+    def poll(self):
+        for info in get_gpu_info():
+            device_id = int(info['index'])
+            if device_id not in self.gpus:
+                self.gpus[device_id] = Device('GPU', device_id, float(info['mem_total']), max_jobs=self.jobs_per_gpu)
+            device = self.gpus[device_id]
+            device.external = max(float(info['mem_used']) - device.get_reserved(), 0.0)
+            available = 100.0 * device.external / device.memory <= self.max_used_percent
+            if available != device.available:
+                print(f"Device {device} is now {'available' if available else 'busy'}.")
+            device.available = available
+        self.last_poll = time.time()
+
+    def __place_affine__(self, job):
+        """
+        Returns the free device that holds the job's scene, False when the job is
+        better off waiting for a busy one than reloading the scene elsewhere, else None.
+        """
+        affine = [d for d in self.get_devices() if job.scene in d.get_scenes()]
+        device = next((d for d in affine if d.fits(job, self.headroom if d.type == 'GPU' else 0.0)), None)
+        if device is not None:
+            return device
+        now = time.time()
+        remaining = [r for r in (d.get_remaining(job.scene, now) for d in self.get_devices()) if r is not None]
+        if not remaining or not job.reload or min(remaining) > job.reload:
+            return None # work stealing
+        deadline = self.deadlines.setdefault(job, now + job.reload)
+        return False if now < deadline else None
+
+    def get_host_free(self, scene: Optional[str]=None) -> Optional[float]:
+        """The host memory budget left by the running jobs and the idle workers (but one holding the scene)."""
+        if self.host_memory is None:
+            return None
+        return self.host_memory - sum(j.rss or 0.0 for d in self.get_devices() for j in d.jobs) \
+            - sum(rss or 0.0 for d in self.get_devices() for _, _, rss in d.get_idle(scene))
+
+    def fits_host(self, job) -> bool:
+        if self.host_memory is None or not any(d.jobs for d in self.get_devices()):
+            return True
+        return self.get_host_free(job.scene) - (job.rss or 0.0) >= 0.0
+
+    def __place__(self, job) -> Optional[Device]:
+        if not self.fits_host(job):
+            return None
+        if self.affinity and job.scene is not None:
+            device = self.__place_affine__(job)
+            if device is not None:
+                return device or None
+        gpus = [d for d in self.gpus.values() if d.fits(job, self.headroom)]
+        if gpus: # spread first, then pack where the most memory is left
+            return min(gpus, key=lambda d: (len(d.jobs), -d.get_free()))
+        return next((d for d in self.cpus if d.fits(job)), None)
+
+    async def acquire(self, job) -> Device:
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        async with self.condition:
+            while True:
+                if time.time() - self.last_poll > self.poll_interval:
+                    self.poll()
+                device = self.__place__(job)
+                if device is not None:
+                    self.deadlines.pop(job, None)
+                    job.started = time.time()
+                    device.jobs.append(job)
+                    return device
+                timeout = self.poll_interval
+                if job in self.deadlines:
+                    timeout = min(timeout, max(self.deadlines[job] - time.time(), 0.0))
+                try:
+                    await asyncio.wait_for(self.condition.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, device: Device, job):
+        device.jobs.remove(job)
+        async with self.condition:
+            self.condition.notify_all()
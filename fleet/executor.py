@@ -0,0 +1,366 @@
+import asyncio
+import os
+import signal
+import sys
+import time
+
+from typing import Dict, List, Optional
+
+from fleet import journal
+from fleet import worker
+from fleet.devices import Device, DeviceScheduler
+
+def get_scene(args: List[str]) -> Optional[str]:
+    for flag in ['--scene_model', '--input_file']:
+        if flag in args[:-1]:
+            return args[args.index(flag) + 1]
+    return None
+
+class Job(object):
+    def __init__(self, name: str, args: List[str]):
+        self.name = name
+        self.args = args
+        self.scene = get_scene(args)
+        self.attempts = 0
+        self.cost = None
+        self.reload = None # seconds spent loading the scene
+        self.memory = None # MB of device memory
+        self.rss = None # MB of host memory
+        self.exclusive = False # runs alone on its device
+        self.peak_rss = None
+        self.peak_vram = None
+        self.features = None
+        self.started = None
+        self.duration = None
+
+    def get_shard(self, index: int, count: int) -> 'Job':
+        shard = f"{index}/{count}"
+        return Job(journal.get_shard_name(self.name, shard), self.args + ["--shard", shard])
+
+    def __str__(self):
+        return self.name
+
+class Executor(object):
+    """
+    Runs render jobs as Blender subprocesses on the devices handed out by the
+    scheduler, streaming their output to per-job log files and retrying failed
+    or timed out jobs. Jobs come either from the given list or, when a shared
+    job queue is set, are claimed from it along with the other driver instances.
+    """
+    def __init__(self,
+        blender: str,
+        render_script: str,
+        scheduler: DeviceScheduler,
+        log_path: Optional[str]=None,
+        timeout: Optional[float]=None,
+        retries: int=0,
+        backoff: float=30.0,
+        persistent: bool=False,
+        cost_model=None,
+        job_queue=None,
+        poll_interval: float=30.0,
+        staging=None,
+        watchdog=None,
+    ):
+        self.blender = blender
+        self.render_script = render_script
+        self.scheduler = scheduler
+        self.log_path = log_path
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.persistent = persistent
+        self.cost_model = cost_model
+        self.job_queue = job_queue
+        self.poll_interval = poll_interval
+        self.staging = staging
+        self.watchdog = watchdog
+        self.processes = {} # of the running jobs, when not persistent
+        self.results = {}
+        self.finished = [] # completed jobs, with their durations
+        self.sessions = {}
+        self.scenes = set() # rendered by this instance, thus cached by the OS or staged locally
+
+    def get_command(self, job: Job, device: Device, args: Optional[List[str]]=None) -> List[str]:
+        return [self.blender, "--background", "--python", self.render_script, "--"] \
+            + (args or job.args) + device.get_arguments()
+
+    def run(self, jobs: List[Job]) -> Dict[str, int]:
+        if self.log_path and not os.path.exists(self.log_path):
+            os.makedirs(self.log_path)
+        if self.job_queue is not None:
+            added = sum(int(self.job_queue.put(job)) for job in jobs)
+            print(f"Queued {added} new jobs @ {self.job_queue.path} ({self.job_queue.get_counts()}).")
+        try:
+            asyncio.run(self.__run__(jobs))
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            print("Cancelled, all running jobs were terminated.")
+        failed = [name for name, returncode in self.results.items() if returncode != 0]
+        total = len(jobs) if self.job_queue is None else len(self.results)
+        print(f"Completed {len(self.results) - len(failed)}/{total} jobs.")
+        for name in failed:
+            print(f"!!! - Job {name} failed with {self.results[name]}.")
+        return self.results
+
+    async def run_job(self, job: Job) -> int:
+        """
+        Renders a single job, retrying it as configured, for callers that run their
+        own event loop (e.g. the pipeline); close() must be awaited once done.
+        """
+        if job.memory is None and self.cost_model is not None:
+            self.cost_model.estimate(job)
+        if self.staging is not None and job.scene is not None:
+            self.staging.prefetch(job.scene)
+        while True:
+            device = await self.scheduler.acquire(job)
+            returncode = await self.__attempt__(job, device)
+            if returncode == 0 or job.attempts > self.retries:
+                self.__record__(job, returncode)
+                return returncode
+            delay = self.backoff * 2 ** (job.attempts - 1)
+            print(f"Retrying {job} in {delay:.0f}s (attempt {job.attempts} returned {returncode}).")
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        for sessions in self.sessions.values():
+            for session in sessions:
+                await session.close()
+        self.sessions = {}
+
+    async def __run__(self, jobs: List[Job]):
+        self.tasks = {}
+        self.held = set()
+        if self.job_queue is None:
+            if not jobs:
+                return
+            self.pending = asyncio.Queue()
+            self.outstanding = len(jobs)
+            for job in jobs:
+                self.pending.put_nowait(job)
+        renewer = asyncio.ensure_future(self.__renew__()) if self.job_queue is not None else None
+        if sys.platform != 'win32': # preempted, stop like on ctrl+c
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        try:
+            while True:
+                job = await self.__next_job__()
+                if job is None:
+                    break
+                if job.memory is None and self.cost_model is not None:
+                    self.cost_model.estimate(job)
+                if self.staging is not None and job.scene is not None: # copied while waiting for a device
+                    self.staging.prefetch(job.scene)
+                device = await self.scheduler.acquire(job)
+                if job not in self.held and self.job_queue is not None: # lost while waiting for a device
+                    await self.scheduler.release(device, job)
+                    continue
+                task = asyncio.ensure_future(self.__dispatch__(job, device))
+                self.tasks[job] = task
+                task.add_done_callback(lambda t, job=job: self.tasks.pop(job) if self.tasks.get(job) is t else None)
+        finally:
+            if renewer is not None:
+                renewer.cancel()
+            running = list(self.tasks.values())
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            for job in list(self.held): # interrupted, their checkpoints let anyone resume them
+                self.held.discard(job)
+                self.job_queue.release(job, 0.0)
+            await self.close()
+
+    async def __next_job__(self) -> Optional[Job]:
+        if self.job_queue is None:
+            return await self.pending.get()
+        while True:
+            job = self.job_queue.claim(self.scenes)
+            if job is not None:
+                self.held.add(job)
+                return job
+            if not self.tasks and self.job_queue.is_drained():
+                return None
+            await asyncio.sleep(self.poll_interval)
+
+    async def __renew__(self):
+        while True:
+            await asyncio.sleep(self.job_queue.lease / 3.0)
+            for job in list(self.held):
+                if not self.job_queue.renew(job):
+                    print(f"!!! - Lost the lease of {job}, it was requeued.")
+                    self.held.discard(job)
+                    if job in self.tasks:
+                        self.tasks[job].cancel()
+
+    async def __attempt__(self, job: Job, device: Device) -> int:
+        args, session, staged = job.args, None, False
+        try:
+            if self.staging is not None and job.scene is not None:
+                local = await self.staging.acquire(job.scene)
+                staged = True
+                args = [local if arg == job.scene else arg for arg in job.args]
+            if self.persistent:
+                idle = self.sessions.setdefault(str(device), [])
+                session = self.__pick_session__(idle, job)
+                self.__update_idle__(device)
+                if session is None:
+                    session = worker.BlenderWorker(self.blender, self.render_script, device.id, device.type, device.threads)
+                await self.__evict__(device)
+            returncode = await self.__execute__(job, device, session, args)
+        finally:
+            if staged:
+                self.staging.release(job.scene)
+            if session is not None:
+                session.scene = job.scene if session.is_alive() else None
+                session.memory, session.rss = job.memory, job.rss
+                self.sessions[str(device)].append(session)
+                self.__update_idle__(device)
+            await self.scheduler.release(device, job)
+        return returncode
+
+    async def __dispatch__(self, job: Job, device: Device):
+        attempts = job.attempts
+        try:
+            returncode = await self.__attempt__(job, device)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e: # e.g. a failed spawn or staging copy, an attempt all the same
+            print(f"!!! - Job {job} could not run ({e!r}).")
+            job.attempts = max(job.attempts, attempts + 1)
+            returncode = None
+        if returncode == 0 or job.attempts > self.retries:
+            self.__complete__(job, returncode)
+        else:
+            delay = self.backoff * 2 ** (job.attempts - 1)
+            print(f"Retrying {job} in {delay:.0f}s (attempt {job.attempts} returned {returncode}).")
+            if self.job_queue is not None: # any instance may pick it up again
+                self.held.discard(job)
+                self.job_queue.release(job, delay)
+            else:
+                asyncio.get_running_loop().call_later(delay, self.pending.put_nowait, job)
+
+    def __pick_session__(self, idle: List[worker.BlenderWorker], job: Job) -> Optional[worker.BlenderWorker]:
+        """
+        Takes the idle worker that has the job's scene loaded, else a fresh one,
+        and only then evicts the scene of another.
+        """
+        if not idle:
+            return None
+        session = next((s for s in idle if s.scene == job.scene and s.is_alive()), None) \
+            or next((s for s in idle if s.scene is None), None) or idle[0]
+        idle.remove(session)
+        return session
+
+    def __update_idle__(self, device: Device):
+        device.idle = [(s.scene, s.memory, s.rss) for s in self.sessions.get(str(device), []) if s.scene is not None]
+
+    async def __evict__(self, device: Device):
+        """
+        Closes idle workers, the largest scenes first, while the scenes they keep
+        loaded leave too little memory for the jobs placed: those of the device for
+        its own memory, those of any device for the host memory budget.
+        """
+        while True:
+            host_free = self.scheduler.get_host_free()
+            if device.memory is not None and device.get_free() < 0.0:
+                devices = [str(device)]
+            elif host_free is not None and host_free < 0.0:
+                devices = list(self.sessions)
+            else:
+                return
+            loaded = [(name, s) for name in devices for s in self.sessions.get(name, []) if s.scene is not None]
+            if not loaded:
+                return
+            name, session = max(loaded, key=lambda entry: (entry[1].memory or 0.0, entry[1].rss or 0.0))
+            self.sessions[name].remove(session)
+            for d in self.scheduler.get_devices():
+                if str(d) == name:
+                    self.__update_idle__(d)
+            print(f"Evicting the idle worker holding {session.scene} from device {name}.")
+            await session.close()
+
+    def __record__(self, job: Job, returncode: int):
+        self.results[job.name] = returncode
+        self.finished.append(job)
+        if returncode == 0 and job.scene is not None:
+            self.scenes.add(job.scene)
+        if returncode == 0 and self.cost_model is not None:
+            self.cost_model.record(job, job.duration)
+            self.cost_model.save()
+
+    def __complete__(self, job: Job, returncode: int):
+        try:
+            self.__record__(job, returncode)
+        finally: # the job is done even if recording it failed
+            if self.job_queue is not None:
+                self.held.discard(job)
+                self.job_queue.complete(job, returncode)
+            else:
+                self.outstanding -= 1
+                if self.outstanding == 0: # release the dispatch loop
+                    self.pending.put_nowait(None)
+
+    async def __execute__(self, job: Job, device: Device, session: Optional[worker.BlenderWorker], args: List[str]) -> int:
+        job.attempts += 1
+        start = time.time()
+        print(f"Starting {job} on device {device} (attempt {job.attempts}).")
+        log = open(os.path.join(self.log_path, f"{job.name}.log"), 'a', buffering=1) \
+            if self.log_path else sys.stdout
+        if self.watchdog is not None:
+            get_pid = (lambda: self.processes[job].pid if job in self.processes else None) if session is None \
+                else (lambda: session.process.pid if session.is_alive() else None)
+            self.watchdog.watch(job, device, get_pid)
+        try:
+            if session is None:
+                command = self.get_command(job, device, args)
+                log.write(" ".join(command) + "\n")
+                returncode = await asyncio.wait_for(self.__spawn__(command, log, job), self.timeout)
+            else:
+                log.write(" ".join(args) + "\n")
+                returncode = await asyncio.wait_for(session.submit(args, log), self.timeout)
+        except asyncio.TimeoutError:
+            log.write(f"Timed out after {self.timeout}s.\n")
+            returncode = None
+        finally:
+            if self.watchdog is not None:
+                self.__check_memory__(job, self.watchdog.unwatch(job), log)
+            if log is not sys.stdout:
+                log.close()
+        job.duration = time.time() - start
+        peaks = f", peak {job.peak_rss or 0.0:.0f}MB resident and {job.peak_vram or 0.0:.0f}MB on device" \
+            if self.watchdog is not None else ""
+        print(f"Finished {job} on device {device} with {returncode} in {job.duration:.1f}s{peaks}.")
+        return returncode
+
+    def __check_memory__(self, job: Job, watch, log):
+        """
+        Learns the memory footprint of the job's scene and, when the watchdog killed
+        the job, reserves its peak for the next attempt, which runs alone on a device
+        and is not counted as a retry the first time.
+        """
+        if self.cost_model is not None:
+            self.cost_model.record_memory(job)
+        if watch.reason is None:
+            return
+        if self.cost_model is not None: # before anything else starts that scene
+            self.cost_model.save()
+        log.write(f"Killed by the memory watchdog, {watch.reason}.\n")
+        job.memory = max(job.memory or 0.0, job.peak_vram or 0.0)
+        job.rss = max(job.rss or 0.0, job.peak_rss or 0.0)
+        if not job.exclusive:
+            job.exclusive = True
+            job.attempts -= 1
+
+    async def __spawn__(self, command: List[str], log, job: Optional[Job]=None) -> int:
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE, 
+            stderr=asyncio.subprocess.STDOUT, limit=worker.STREAM_LIMIT)
+        self.processes[job] = process
+        try:
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                log.write(line.decode(errors='replace'))
+            return await process.wait()
+        finally:
+            del self.processes[job]
+            if process.returncode is None: # timed out or cancelled
+                await worker.terminate(process)
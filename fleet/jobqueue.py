@@ -0,0 +1,131 @@
+import json
+import os
+import socket
+import time
+
+from typing import Dict, Optional, Set
+
+from fleet.executor import Job, get_scene
+
+STATES = ['pending', 'claimed', 'done', 'failed']
+
+def write_atomic(filename: str, content: dict):
+    temp_filename = f"{filename}.{socket.gethostname()}-{os.getpid()}.tmp"
+    with open(temp_filename, 'w') as f:
+        json.dump(content, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
+
+class JobQueue(object):
+    """
+    Durable job queue in a directory on shared storage, with one json file per job
+    moving between the pending/claimed/done/failed folders through atomic renames.
+    A claimed job is leased by touching its file; jobs whose lease is not renewed
+    in time are moved back to pending by any other instance.
+    """
+    def __init__(self, path: str, lease: float=600.0, owner: str=None):
+        self.path = path
+        self.lease = lease
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}"
+        for state in STATES:
+            os.makedirs(os.path.join(path, state), exist_ok=True)
+
+    def get_filename(self, state: str, name: str, owner: str=None) -> str:
+        return os.path.join(self.path, state, f"{name}~{owner}.json" if owner else f"{name}.json")
+
+    def get_names(self, state: str):
+        return [f[:-len('.json')].split('~')[0] for f in os.listdir(os.path.join(self.path, state)) 
+            if f.endswith('.json')]
+
+    def put(self, job: Job) -> bool:
+        if os.path.exists(self.get_filename('failed', job.name)): # retried on every new launch
+            os.remove(self.get_filename('failed', job.name))
+        if any(os.path.exists(self.get_filename(state, job.name)) for state in ['pending', 'done']) \
+            or job.name in self.get_names('claimed'):
+            return False
+        temp_filename = self.get_filename('pending', job.name, self.owner) + '.tmp'
+        with open(temp_filename, 'w') as f:
+            json.dump({ 'name': job.name, 'args': job.args, 'attempts': 0, 'not_before': 0.0, 'cost': job.cost }, f)
+        try: # link fails when another instance enqueued the same job meanwhile
+            os.link(temp_filename, self.get_filename('pending', job.name))
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(temp_filename)
+
+    def requeue_expired(self):
+        claimed_path = os.path.join(self.path, 'claimed')
+        for filename in os.listdir(claimed_path):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                expired = os.path.getmtime(os.path.join(claimed_path, filename)) + self.lease < time.time()
+                if expired:
+                    name = filename.split('~')[0]
+                    os.rename(os.path.join(claimed_path, filename), self.get_filename('pending', name))
+                    print(f"Requeued {name}, its lease ({filename}) expired.")
+            except FileNotFoundError: # completed or requeued by another instance
+                pass
+
+    def claim(self, scenes: Optional[Set[str]]=None) -> Optional[Job]:
+        """
+        Claims the costliest pending job, preferring the ones whose scene is
+        among the given (locally cached) scenes.
+        """
+        self.requeue_expired()
+        scenes = scenes or set()
+        candidates = []
+        for name in self.get_names('pending'):
+            try:
+                with open(self.get_filename('pending', name)) as f:
+                    candidates.append(json.load(f))
+            except (FileNotFoundError, ValueError): # claimed meanwhile or still being written
+                pass
+        now = time.time()
+        for content in sorted(candidates, key=lambda c: (get_scene(c['args']) in scenes, c.get('cost') or 0.0), reverse=True):
+            if content['not_before'] > now:
+                continue
+            pending_filename = self.get_filename('pending', content['name'])
+            claimed_filename = self.get_filename('claimed', content['name'], self.owner)
+            try:
+                os.utime(pending_filename) # the lease starts now, not when it was enqueued
+                os.rename(pending_filename, claimed_filename)
+            except FileNotFoundError: # another instance won this one
+                continue
+            job = Job(content['name'], content['args'])
+            job.attempts = content['attempts']
+            job.cost = content.get('cost')
+            job.exclusive = content.get('exclusive', False)
+            return job
+        return None
+
+    def renew(self, job: Job) -> bool:
+        try:
+            os.utime(self.get_filename('claimed', job.name, self.owner))
+            return True
+        except FileNotFoundError: # lease expired and the job was requeued
+            return False
+
+    def release(self, job: Job, delay: float=0.0):
+        content = { 'name': job.name, 'args': job.args, 'attempts': job.attempts, 
+            'not_before': time.time() + delay, 'cost': job.cost, 'exclusive': job.exclusive }
+        write_atomic(self.get_filename('claimed', job.name, self.owner), content)
+        os.rename(self.get_filename('claimed', job.name, self.owner), self.get_filename('pending', job.name))
+
+    def complete(self, job: Job, returncode: int):
+        state = 'done' if returncode == 0 else 'failed'
+        write_atomic(self.get_filename(state, job.name), { 'name': job.name, 'args': job.args, 
+            'attempts': job.attempts, 'returncode': returncode, 'duration': job.duration, 'owner': self.owner })
+        try:
+            os.remove(self.get_filename('claimed', job.name, self.owner))
+        except FileNotFoundError:
+            pass
+
+    def get_counts(self) -> Dict[str, int]:
+        return { state: len(self.get_names(state)) for state in STATES }
+
+    def is_drained(self) -> bool:
+        counts = self.get_counts()
+        return counts['pending'] == 0 and counts['claimed'] == 0
@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import re
+import socket
+import sys
+import time
+
+from typing import Dict, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError: # windows
+    fcntl = None
+
+SHARD_PATTERN = re.compile(r'^(.*)\.shard(\d+)of(\d+)$')
+SHEET_EXTENSION = '.xlsx' # legacy log sheets
+SHEET_COLUMNS = ['name', 'status', 'scene', 'duration', 'poses', 'outputs', 'host', 'time']
+
+def get_shard_name(name: str, shard: Optional[str]=None, pose_range: Optional[List[int]]=None) -> str:
+    """
+    Journal, checkpoint and job name of a part of a render job, given either as
+    a shard spec ('i/N') or as a [start, end) pose index range.
+    """
+    if shard:
+        index, count = (int(v) for v in shard.split('/'))
+        return f"{name}.shard{index}of{count}"
+    if pose_range:
+        return f"{name}.poses{pose_range[0]}to{pose_range[1]}"
+    return name
+
+def get_journal_path(path: str) -> str:
+    """The journal of a path, the .jsonl one beside a legacy log sheet, which is only read."""
+    return os.path.splitext(path)[0] + '.jsonl' if path.endswith(SHEET_EXTENSION) else path
+
+def read_sheet(path: str) -> Set[str]:
+    """
+    The jobs a log sheet lists as done: those of status done in an exported sheet
+    (with a header), every listed one in a legacy sheet (only ever holding done jobs).
+    """
+    import pyexcel
+    rows = pyexcel.get_array(file_name=path)
+    if rows and [str(cell) for cell in rows[0][:len(SHEET_COLUMNS)]] == SHEET_COLUMNS:
+        status = SHEET_COLUMNS.index('status')
+        return set(row[0] for row in rows[1:] if len(row) > status and row[status] == 'done')
+    return set(row[0] for row in rows if row)
+
+class Journal(object):
+    """
+    Append-only, fsync'd json lines log of the render jobs, one record per status
+    change, shared by concurrent render processes; the latest record of a job wins.
+    Given a legacy log sheet, the journal is kept beside it and both are read.
+    """
+    def __init__(self, path: str):
+        self.sheet = path if path.endswith(SHEET_EXTENSION) else None
+        self.path = get_journal_path(path)
+
+    def append(self, name: str, status: str, **fields):
+        record = { 'name': name, 'status': status, 'time': time.time(), 'host': socket.gethostname() }
+        record.update(fields)
+        line = (json.dumps(record) + "\n").encode()
+        fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None: # O_APPEND alone is not atomic across NFS clients
+                fcntl.lockf(fd, fcntl.LOCK_EX)
+            size = os.fstat(fd).st_size
+            if size > 0:
+                os.lseek(fd, size - 1, os.SEEK_SET)
+                if os.read(fd, 1) != b"\n": # do not glue onto a torn line
+                    line = b"\n" + line
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd) # also releases the lock
+
+    def load(self) -> Dict[str, dict]:
+        records = {}
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError: # torn line of a crashed writer
+                    continue
+                records[record['name']] = record
+        return records
+
+    def get_completed(self) -> Set[str]:
+        completed = set(name for name, record in self.load().items() if record['status'] == 'done')
+        if self.sheet is not None and os.path.exists(self.sheet):
+            completed |= read_sheet(self.sheet)
+        shards = {}
+        for name in completed:
+            match = SHARD_PATTERN.match(name)
+            if match:
+                shards.setdefault((match.group(1), int(match.group(3))), set()).add(int(match.group(2)))
+        for (name, count), indices in shards.items(): # a sharded job is done once all of its shards are
+            if len(indices) == count:
+                completed.add(name)
+        return completed
+
+def load_completed(path: str) -> Set[str]:
+    if path is None:
+        return set()
+    return Journal(path).get_completed()
+
+def export_sheet(journal_path: str, sheet_path: str):
+    """Writes the done jobs of the journal, under a header, so the sheet reads back as done jobs only."""
+    import pyexcel
+    records = Journal(journal_path).load()
+    rows = [[record.get(column, '') for column in SHEET_COLUMNS] for record in records.values() if record['status'] == 'done']
+    pyexcel.save_as(array=[SHEET_COLUMNS] + rows, dest_file_name=sheet_path) # first column stays the job name
+    print(f"Exported {len(rows)} done jobs of {len(records)} to {sheet_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports the done jobs of a render journal to a spreadsheet.")
+    parser.add_argument('journal', type=str, help='The .jsonl journal.')
+    parser.add_argument('sheet', type=str, help='The spreadsheet (e.g. .xlsx) to write.')
+    args = parser.parse_args(sys.argv[1:])
+    export_sheet(args.journal, args.sheet)
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import csv
+import hashlib
+import math
+import os
+import sys
+import time
+
+from typing import Dict, List, Tuple
+
+try:
+    import numpy
+except ImportError: # only building the LODs needs it, not finding them
+    numpy = None
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError: # nearest poses found by brute force
+    cKDTree = None
+
+from fleet import meshformat
+
+DEFAULT_MAX_ERROR = 0.01 # of the distance to the nearest pose, by which a vertex may move
+DEFAULT_MIN_CELL = 0.01 # meters, the finest clustering cell, closer geometry is kept as is
+POSES_FILENAME = 'camera_poses.csv'
+CHUNK = 1 << 14 # vertices measured against all the poses at once, without a tree
+
+def read_poses(filepath: str) -> List[List[float]]:
+    """The positions of a GibsonV2 camera_poses.csv (or of the one in the folder), in mesh coordinates."""
+    if os.path.isdir(filepath):
+        filepath = os.path.join(filepath, POSES_FILENAME)
+    with open(filepath) as f:
+        return [[float(v) for v in row[1:4]] for row in csv.reader(f) if len(row) >= 4]
+
+def get_lod_path(filepath: str, poses_path: str, max_error: float=DEFAULT_MAX_ERROR) -> str:
+    """The LOD mesh beside the source, named after the poses and the error bound it was built for."""
+    if os.path.isdir(poses_path):
+        poses_path = os.path.join(poses_path, POSES_FILENAME)
+    with open(poses_path, 'rb') as f:
+        key = hashlib.sha1(f.read() + repr(max_error).encode()).hexdigest()[:10]
+    return f"{os.path.splitext(filepath)[0]}_lod_{key}{meshformat.EXTENSION}"
+
+def find_lod(filepath: str, poses_path: str, max_error: float=DEFAULT_MAX_ERROR) -> str:
+    """The LOD mesh of the source when it is up to date, else the source itself."""
+    lod_path = get_lod_path(filepath, poses_path, max_error)
+    return lod_path if os.path.exists(lod_path) and os.path.getmtime(lod_path) >= os.path.getmtime(filepath) else filepath
+
+def get_distances(vertices: numpy.ndarray, poses: numpy.ndarray) -> numpy.ndarray:
+    """The distance of every vertex to its nearest pose."""
+    if cKDTree is not None:
+        return cKDTree(poses).query(vertices)[0]
+    distances = numpy.empty(len(vertices))
+    for start in range(0, len(vertices), CHUNK):
+        chunk = vertices[start:start + CHUNK]
+        distances[start:start + CHUNK] = numpy.sqrt(((chunk[:, None, :] - poses[None, :, :]) ** 2).sum(axis=2).min(axis=1))
+    return distances
+
+def build(arrays: Dict[str, numpy.ndarray], poses: List[List[float]], max_error: float=DEFAULT_MAX_ERROR,
+    min_cell: float=DEFAULT_MIN_CELL) -> Tuple[Dict[str, numpy.ndarray], Dict[str, int]]:
+    """
+    Decimates the mesh by clustering its vertices in grids coarser with their distance
+    to the nearest pose, of power-of-two multiples of min_cell, the coarsest that moves
+    no vertex by more than max_error of that distance (the cell diagonal). Vertices
+    nearer than a min_cell grid allows are kept as they are.
+    """
+    vertices = arrays['vertices'].astype(numpy.float64)
+    distances = get_distances(vertices, numpy.array(poses, dtype=numpy.float64).reshape(-1, 3))
+    cell = max_error * distances / math.sqrt(3.0)
+    levels = numpy.floor(numpy.log2(numpy.maximum(cell, 1e-12) / min_cell)).astype(numpy.int64)
+    cells = numpy.empty((len(vertices), 4), dtype=numpy.int64)
+    cells[:, 0] = levels
+    cells[:, 1:] = numpy.floor(vertices / (min_cell * numpy.exp2(numpy.maximum(levels, 0)))[:, None])
+    kept = levels < 0
+    cells[kept, 0], cells[kept, 1], cells[kept, 2:] = -1, numpy.flatnonzero(kept), 0 # each its own cell
+    return meshformat.collapse(arrays, cells)
+
+def convert(filepath: str, poses_path: str, max_error: float=DEFAULT_MAX_ERROR, min_cell: float=DEFAULT_MIN_CELL) -> Tuple[float, Dict[str, int]]:
+    start = time.time()
+    arrays, materials = meshformat.read_source(filepath)
+    arrays, report = build(arrays, read_poses(poses_path), max_error, min_cell)
+    meshformat.write(get_lod_path(filepath, poses_path, max_error), arrays, materials)
+    return time.time() - start, report
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(description="Builds level-of-detail meshes of the GibsonV2 meshes of a split, decimated by "
+        "their distance to the panorama poses of the split within a depth error bound, and writes them beside the meshes.")
+    parser.add_argument('--gibson', type=str, help='GibsonV2 root path.', required=True)
+    parser.add_argument('--split', type=str, help='GibsonV2 split, the folder of the camera poses of each mesh.', required=True)
+    parser.add_argument('--extension', type=str, help='The meshes decimated.', default='.obj', choices=meshformat.SOURCE_EXTENSIONS + (meshformat.EXTENSION,))
+    parser.add_argument('--max_error', type=float, help='Depth error bound, as a fraction of the distance to the nearest pose.', default=DEFAULT_MAX_ERROR)
+    parser.add_argument('--min_cell', type=float, help='Finest clustering cell (meters).', default=DEFAULT_MIN_CELL)
+    parser.add_argument('--workers', type=int, help='Meshes decimated in parallel.', default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument('--force', help='Build the LOD meshes again even if they are up to date.', default=False, action='store_true')
+    return parser.parse_known_args(args)
+
+if __name__ == "__main__":
+    args, unknown = parse_arguments(sys.argv[1:])
+    meshes_root, poses_root = os.path.join(args.gibson, "meshes"), os.path.join(args.gibson, args.split)
+    meshes = {}
+    for filename in sorted(os.listdir(meshes_root)):
+        poses_path = os.path.join(poses_root, filename.split('_')[0], POSES_FILENAME)
+        if filename.endswith(args.extension) and '_lod_' not in filename and os.path.exists(poses_path):
+            mesh = os.path.join(meshes_root, filename)
+            if args.force or find_lod(mesh, poses_path, args.max_error) == mesh:
+                meshes[mesh] = poses_path
+    print(f"Building the LOD meshes of {len(meshes)} meshes with {args.workers} workers.")
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as pool:
+        futures = { pool.submit(convert, mesh, poses_path, args.max_error, args.min_cell): mesh for mesh, poses_path in meshes.items() }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                duration, report = future.result()
+                print(f"Built the LOD mesh of {futures[future]} in {duration:.1f}s, {meshformat.format_report(report)}.")
+            except (OSError, ValueError) as e:
+                print(f"!!! - Could not build the LOD mesh of {futures[future]} ({e}).")
@@ -0,0 +1,93 @@
+import json
+import os
+
+from typing import Iterator, List, Optional, Tuple
+
+from fleet import cost
+
+VERSION = 1
+
+class Manifest(object):
+    """
+    Persistent listing of the dataset and trajectory folders plus the pose counts
+    of the trajectory files, revalidated by their (nanosecond) mtimes, so a launch
+    stats the folders it visits instead of listing them again over the network.
+    """
+    def __init__(self, path: Optional[str]=None):
+        self.path = path
+        self.folders = {}
+        self.poses = {}
+        self.dirty = False
+        if path and os.path.exists(path):
+            with open(path) as f:
+                content = json.load(f)
+            if content.get('version') == VERSION:
+                self.folders = content['folders']
+                self.poses = content['poses']
+
+    def scan(self, folder: str) -> dict:
+        mtime = os.stat(folder).st_mtime_ns # changes whenever an entry is added, removed or renamed
+        entry = self.folders.get(folder)
+        if entry is None or entry['mtime'] != mtime:
+            dirs, files = [], []
+            with os.scandir(folder) as entries:
+                for e in entries:
+                    (dirs if e.is_dir() else files).append(e.name)
+            entry = { 'mtime': mtime, 'dirs': sorted(dirs), 'files': sorted(files) }
+            self.folders[folder] = entry
+            self.dirty = True
+        return entry
+
+    def listdir(self, folder: str) -> List[str]:
+        entry = self.scan(folder)
+        return entry['dirs'] + entry['files']
+
+    def get_dirs(self, folder: str) -> List[str]:
+        return self.scan(folder)['dirs']
+
+    def get_files(self, folder: str) -> List[str]:
+        return self.scan(folder)['files']
+
+    def exists(self, path: str) -> bool:
+        folder, name = os.path.split(path)
+        try:
+            entry = self.scan(folder)
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+        return name in entry['files'] or name in entry['dirs']
+
+    def walk(self, folder: str) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """Bottom-up os.walk over the cached listings."""
+        entry = self.scan(folder)
+        for name in entry['dirs']:
+            yield from self.walk(os.path.join(folder, name))
+        yield folder, entry['dirs'], entry['files']
+
+    def find_file(self, folder: str, pattern: str) -> Optional[str]:
+        """The first file (bottom-up) whose name contains the pattern."""
+        if not os.path.isdir(folder):
+            return None
+        for root, dirs, files in self.walk(folder):
+            name = next((f for f in files if pattern in f), None)
+            if name is not None:
+                return os.path.join(root, name)
+        return None
+
+    def count_poses(self, camera_path: str) -> int:
+        filename = os.path.join(camera_path, 'camera_poses.csv') if os.path.isdir(camera_path) else camera_path
+        stat = os.stat(filename)
+        cached = self.poses.get(filename)
+        if cached is None or cached['mtime'] != stat.st_mtime_ns or cached['size'] != stat.st_size:
+            cached = { 'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'poses': cost.count_poses(camera_path) }
+            self.poses[filename] = cached
+            self.dirty = True
+        return cached['poses']
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({ 'version': VERSION, 'folders': self.folders, 'poses': self.poses }, f)
+        os.replace(temp_path, self.path)
+        self.dirty = False
@@ -0,0 +1,453 @@
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy
+except ImportError: # only the conversion and the loading need it, not the drivers
+    numpy = None
+
+VERSION = 1
+EXTENSION = '.npz'
+TEXTURE_KEYS = ('map_kd', 'map_ka') # the OBJ importer only wires the diffuse (else ambient) map
+SOURCE_EXTENSIONS = ('.obj', '.ply')
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+PLY_ENDIANNESS = { 'binary_little_endian': '<', 'binary_big_endian': '>' }
+PLY_UV_PROPERTIES = [('s', 't'), ('u', 'v'), ('texture_u', 'texture_v')]
+WELD_TOLERANCE = 1e-4 # vertices closer than this (in scene units, meters for the datasets) are merged
+LOOP_ARRAYS = ('loop_vertices', 'uvs', 'normals')
+FACE_ARRAYS = ('loop_total', 'material_ids', 'original_material_ids')
+NEIGHBOUR_OFFSETS = [(0, 0, 0)] + [(x, y, z) for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1) if (x, y, z) > (0, 0, 0)] # each cell pair once
+
+def get_binary_path(filepath: str) -> str:
+    return os.path.splitext(filepath)[0] + EXTENSION
+
+def find_binary(filepath: str) -> str:
+    """The binary mesh of the source when it is up to date, else the source itself."""
+    return get_binary_path(filepath) if is_converted(filepath) else filepath
+
+def is_converted(filepath: str) -> bool:
+    """Whether the binary mesh of the source exists and is not older than it."""
+    binary_path = get_binary_path(filepath)
+    return os.path.exists(binary_path) and os.path.getmtime(binary_path) >= os.path.getmtime(filepath)
+
+def parse_floats(lines: List[bytes], columns: int) -> numpy.ndarray:
+    if not lines:
+        return numpy.zeros((0, columns), numpy.float32)
+    rows = [line.split()[1:columns + 1] for line in lines]
+    return numpy.array(rows, dtype=numpy.float32) if any(len(r) != columns for r in rows) \
+        else numpy.fromstring(b' '.join(b' '.join(r) for r in rows), dtype=numpy.float32, sep=' ').reshape(-1, columns)
+
+def parse_materials(filepath: str) -> Dict[str, dict]:
+    materials, current = {}, None
+    with open(filepath, 'r', errors='replace') as f:
+        for line in f:
+            parts = line.strip().split(None, 1)
+            if len(parts) < 2:
+                continue
+            key = parts[0].lower()
+            if key == 'newmtl':
+                current = materials.setdefault(parts[1].strip(), { 'name': parts[1].strip() })
+            elif current is None:
+                continue
+            elif key == 'kd':
+                current['diffuse'] = [float(v) for v in parts[1].split()[:3]]
+            elif key == 'd':
+                current['alpha'] = float(parts[1].split()[0])
+            elif key in TEXTURE_KEYS and (key == 'map_kd' or 'texture' not in current):
+                current['texture'] = os.path.join(os.path.dirname(filepath), parts[1].split()[-1])
+    return materials
+
+def read_obj(filepath: str) -> Tuple[Dict[str, numpy.ndarray], List[dict]]:
+    """
+    Parses an OBJ (and its MTL files) into the arrays of the binary layout: the
+    vertices, the per loop vertex indices, UVs and normals, the loop start and size of
+    every face and its index in the material table.
+    """
+    with open(filepath, 'rb') as f:
+        lines = f.read().split(b'\n')
+    vertices, uvs, normals, faces, face_materials, names, libraries = [], [], [], [], [], [], []
+    material = -1
+    for line in lines:
+        if line.startswith(b'v '):
+            vertices.append(line)
+        elif line.startswith(b'vt '):
+            uvs.append(line)
+        elif line.startswith(b'vn '):
+            normals.append(line)
+        elif line.startswith(b'f '):
+            faces.append(line)
+            face_materials.append(material)
+        elif line.startswith(b'usemtl '):
+            name = line[len(b'usemtl '):].strip().decode(errors='replace')
+            if name not in names:
+                names.append(name)
+            material = names.index(name)
+        elif line.startswith(b'mtllib '):
+            libraries.append(os.path.join(os.path.dirname(filepath), line[len(b'mtllib '):].strip().decode(errors='replace')))
+    del lines
+    tokens = [line.split()[1:] for line in faces]
+    loop_total = numpy.array([len(t) for t in tokens], dtype=numpy.int32)
+    layout = tokens[0][0].count(b'/') + 1 if tokens else 1 # v, v/vt or v/vt/vn
+    indices = b' '.join(b' '.join(t) for t in tokens).replace(b'//', b'/0/').replace(b'/', b' ')
+    indices = numpy.fromstring(indices, dtype=numpy.int64, sep=' ').reshape(-1, layout)
+    if (indices < 0).any():
+        raise ValueError(f"{filepath} uses relative indices, which are not supported.")
+    arrays = {
+        'vertices': parse_floats(vertices, 3),
+        'loop_vertices': (indices[:, 0] - 1).astype(numpy.int32),
+        'loop_start': (numpy.cumsum(loop_total) - loop_total).astype(numpy.int32),
+        'loop_total': loop_total,
+    }
+    if layout > 1 and uvs and indices[:, 1].min() > 0:
+        arrays['uvs'] = parse_floats(uvs, 2)[indices[:, 1] - 1]
+    if layout > 2 and normals and indices[:, 2].min() > 0:
+        arrays['normals'] = parse_floats(normals, 3)[indices[:, 2] - 1]
+    face_materials = numpy.array(face_materials, dtype=numpy.int32)
+    table = {}
+    for library in libraries:
+        if os.path.exists(library):
+            table.update(parse_materials(library))
+    materials = [table.get(name, { 'name': name }) for name in names]
+    if (face_materials < 0).any(): # faces before any usemtl have no material
+        materials.insert(0, None)
+        face_materials += 1
+    arrays['material_ids'] = face_materials.astype(numpy.int16 if len(materials) < 2 ** 15 else numpy.int32)
+    return arrays, materials
+
+def read_ply_header(f) -> Tuple[str, List[tuple], List[str]]:
+    """
+    The format, the elements (name, count and properties, a property being a name and
+    a type or, for lists, a name, a count type and an item type) and the comments.
+    """
+    if f.readline().strip() != b'ply':
+        raise ValueError(f"{f.name} is not a PLY file.")
+    format, elements, comments = None, [], []
+    for line in iter(f.readline, b''):
+        parts = line.decode(errors='replace').split()
+        if not parts:
+            continue
+        if parts[0] == 'format':
+            format = parts[1]
+        elif parts[0] in ('comment', 'obj_info'):
+            comments.append(' '.join(parts[1:]))
+        elif parts[0] == 'element':
+            elements.append((parts[1], int(parts[2]), []))
+        elif parts[0] == 'property' and parts[1] == 'list':
+            elements[-1][2].append((parts[4], PLY_TYPES[parts[2]], PLY_TYPES[parts[3]]))
+        elif parts[0] == 'property':
+            elements[-1][2].append((parts[2], PLY_TYPES[parts[1]]))
+        elif parts[0] == 'end_header':
+            return format, elements, comments
+    raise ValueError(f"{f.name} has no PLY header end.")
+
+def get_ply_textures(filepath: str) -> List[str]:
+    """The textures a PLY references in its TextureFile comments, in texnumber order."""
+    with open(filepath, 'rb') as f:
+        _, _, comments = read_ply_header(f)
+    return [os.path.join(os.path.dirname(filepath), c.split(None, 1)[1]) for c in comments
+        if c.startswith('TextureFile ') and len(c.split(None, 1)) > 1]
+
+def split_rows(table: numpy.ndarray, properties: List[tuple]) -> Optional[Dict[str, object]]:
+    """The columns of fixed size rows, lists as their counts and flattened items, None if their sizes vary."""
+    columns, column = {}, 0
+    for prop in properties:
+        if len(prop) == 2:
+            columns[prop[0]] = table[:, column].astype(prop[1])
+            column += 1
+        else:
+            count = int(table[0, column]) if len(table) else 0
+            if (table[:, column] != count).any(): # parsed row by row instead
+                return None
+            columns[prop[0]] = (table[:, column].astype(numpy.int32), table[:, column + 1:column + 1 + count].astype(prop[2]).ravel())
+            column += 1 + count
+    return columns
+
+def read_ply_rows(rows: List[numpy.ndarray], properties: List[tuple]) -> Dict[str, object]:
+    """The columns of rows of varying list sizes, parsed one by one."""
+    values = { prop[0]: [] for prop in properties }
+    for row in rows:
+        column = 0
+        for prop in properties:
+            if len(prop) == 2:
+                values[prop[0]].append(row[column])
+                column += 1
+            else:
+                count = int(row[column])
+                values[prop[0]].append(row[column + 1:column + 1 + count])
+                column += 1 + count
+    return { prop[0]: numpy.array(values[prop[0]], dtype=prop[1]) if len(prop) == 2 else
+        (numpy.array([len(v) for v in values[prop[0]]], dtype=numpy.int32),
+        numpy.concatenate(values[prop[0]]).astype(prop[2]) if values[prop[0]] else numpy.zeros(0, prop[2]))
+        for prop in properties }
+
+def read_ply_binary(data: bytes, offset: int, count: int, properties: List[tuple], endian: str) -> Tuple[Dict[str, object], int]:
+    """
+    The columns of a binary element and the offset past it, read at once as a record
+    array when all its lists have the size of the first row's (e.g. triangles).
+    """
+    fields, position = [], offset
+    for prop in properties:
+        if len(prop) == 2:
+            fields.append((prop[0], endian + prop[1]))
+        else:
+            size = int(numpy.frombuffer(data, endian + prop[1], 1, position)[0]) if count else 0
+            fields += [(prop[0] + ' count', endian + prop[1]), (prop[0], endian + prop[2], (size,))]
+        position = offset + numpy.dtype(fields).itemsize
+    dtype = numpy.dtype(fields)
+    if offset + count * dtype.itemsize <= len(data):
+        table = numpy.frombuffer(data, dtype, count, offset)
+        lists = [prop for prop in properties if len(prop) == 3]
+        if all((table[p[0] + ' count'] == table.dtype[p[0]].shape[0]).all() for p in lists):
+            return { prop[0]: table[prop[0]] if len(prop) == 2 else (table[prop[0] + ' count'].astype(numpy.int32),
+                table[prop[0]].reshape(-1)) for prop in properties }, offset + count * dtype.itemsize
+    rows = []
+    for _ in range(count):
+        row = []
+        for prop in properties:
+            if len(prop) == 2:
+                row.append(numpy.frombuffer(data, endian + prop[1], 1, offset)[0])
+                offset += numpy.dtype(prop[1]).itemsize
+            else:
+                size = int(numpy.frombuffer(data, endian + prop[1], 1, offset)[0])
+                offset += numpy.dtype(prop[1]).itemsize
+                row.append(size)
+                row.extend(numpy.frombuffer(data, endian + prop[2], size, offset))
+                offset += size * numpy.dtype(prop[2]).itemsize
+        rows.append(row)
+    return read_ply_rows(rows, properties), offset
+
+def read_ply(filepath: str) -> Tuple[Dict[str, numpy.ndarray], List[dict]]:
+    """
+    Parses an ASCII or binary PLY into the arrays of the binary layout, with the UVs of
+    its faces (texcoord lists) or vertices and the textures of its TextureFile comments
+    as materials named like the ones of MeshLab's OBJ export.
+    """
+    with open(filepath, 'rb') as f:
+        format, elements, comments = read_ply_header(f)
+        data = f.read()
+    columns, offset, lines = {}, 0, None
+    for name, count, properties in elements:
+        if format in PLY_ENDIANNESS:
+            columns[name], offset = read_ply_binary(data, offset, count, properties, PLY_ENDIANNESS[format])
+            continue
+        if lines is None:
+            lines = iter(line for line in data.split(b'\n') if line.strip())
+        rows = [next(lines) for _ in range(count)]
+        widths = set(len(row.split()) for row in rows)
+        columns[name] = split_rows(numpy.fromstring(b' '.join(rows), dtype=numpy.float64, sep=' ').reshape(count, widths.pop()),
+            properties) if len(widths) == 1 else None
+        if columns[name] is None:
+            columns[name] = read_ply_rows([numpy.array(row.split(), dtype=numpy.float64) for row in rows], properties)
+    vertex, face = columns.get('vertex', {}), columns.get('face', {})
+    loop_total, loop_vertices = face.get('vertex_indices', face.get('vertex_index', (numpy.zeros(0, numpy.int32),) * 2))
+    arrays = {
+        'vertices': numpy.stack([vertex['x'], vertex['y'], vertex['z']], axis=1).astype(numpy.float32),
+        'loop_vertices': loop_vertices.astype(numpy.int32),
+        'loop_start': (numpy.cumsum(loop_total) - loop_total).astype(numpy.int32),
+        'loop_total': loop_total.astype(numpy.int32),
+    }
+    if 'texcoord' in face and len(face['texcoord'][1]) == 2 * len(loop_vertices):
+        arrays['uvs'] = face['texcoord'][1].reshape(-1, 2).astype(numpy.float32)
+    else:
+        uv = next((p for p in PLY_UV_PROPERTIES if p[0] in vertex and p[1] in vertex), None)
+        if uv is not None:
+            arrays['uvs'] = numpy.stack([vertex[uv[0]], vertex[uv[1]]], axis=1).astype(numpy.float32)[arrays['loop_vertices']]
+    if all(n in vertex for n in ('nx', 'ny', 'nz')):
+        arrays['normals'] = numpy.stack([vertex['nx'], vertex['ny'], vertex['nz']], axis=1).astype(numpy.float32)[arrays['loop_vertices']]
+    folder = os.path.dirname(filepath)
+    textures = [os.path.join(folder, c.split(None, 1)[1]) for c in comments if c.startswith('TextureFile ') and len(c.split(None, 1)) > 1]
+    materials = [{ 'name': f"material_{i}", 'texture': texture } for i, texture in enumerate(textures)] or [{ 'name': 'material_0' }]
+    material_ids = face['texnumber'] if 'texnumber' in face and len(textures) > 1 else numpy.zeros(len(loop_total))
+    arrays['material_ids'] = numpy.clip(material_ids, 0, len(materials) - 1).astype(numpy.int16)
+    return arrays, materials
+
+def read_source(filepath: str) -> Tuple[Dict[str, numpy.ndarray], List[dict]]:
+    """The arrays and the material table of a source (.obj or .ply) or binary mesh."""
+    if filepath.lower().endswith('.ply'):
+        return read_ply(filepath)
+    if filepath.lower().endswith('.obj'):
+        return read_obj(filepath)
+    return read(filepath)
+
+def as_rows(cells: numpy.ndarray) -> numpy.ndarray:
+    """The rows of integer cell keys as single comparable (and sortable) records."""
+    return numpy.ascontiguousarray(cells, dtype=numpy.int64).view([('x', numpy.int64), ('y', numpy.int64), ('z', numpy.int64)]).reshape(-1)
+
+def get_close_pairs(vertices: numpy.ndarray, tolerance: float) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    The pairs of vertices closer than the tolerance, found among the vertices of the
+    same and of the neighbouring cells of a grid of the tolerance, so that the pairs
+    across a cell boundary are found as well.
+    """
+    cells, cell_ids = numpy.unique(numpy.floor(vertices / tolerance).astype(numpy.int64), axis=0, return_inverse=True)
+    cell_ids = cell_ids.reshape(-1)
+    order = numpy.argsort(cell_ids, kind='stable')
+    counts = numpy.bincount(cell_ids, minlength=len(cells))
+    starts = numpy.cumsum(counts) - counts
+    keys = as_rows(cells)
+    sorted_keys, key_order = numpy.sort(keys), numpy.argsort(keys)
+    firsts, seconds = [], []
+    for offset in NEIGHBOUR_OFFSETS:
+        targets = as_rows(cells + numpy.array(offset, dtype=numpy.int64))
+        positions = numpy.minimum(numpy.searchsorted(sorted_keys, targets), len(keys) - 1)
+        neighbours = numpy.where(sorted_keys[positions] == targets, key_order[positions], -1)[cell_ids]
+        repeats = numpy.where(neighbours >= 0, counts[neighbours], 0)
+        first = numpy.repeat(numpy.arange(len(vertices)), repeats)
+        within = numpy.arange(len(first)) - numpy.repeat(numpy.cumsum(repeats) - repeats, repeats)
+        second = order[numpy.repeat(starts[numpy.maximum(neighbours, 0)], repeats) + within]
+        close = ((vertices[first] - vertices[second]) ** 2).sum(axis=1) <= tolerance ** 2
+        if offset == (0, 0, 0): # each pair of the same cell once
+            close &= second > first
+        firsts.append(first[close])
+        seconds.append(second[close])
+    return numpy.concatenate(firsts), numpy.concatenate(seconds)
+
+def weld(arrays: Dict[str, numpy.ndarray], tolerance: float=WELD_TOLERANCE) -> Tuple[Dict[str, numpy.ndarray], Dict[str, int]]:
+    """
+    Merges the vertices closer than the tolerance, transitively, into the first of
+    each group, see collapse().
+    """
+    first, second = get_close_pairs(arrays['vertices'].astype(numpy.float64), tolerance)
+    groups = numpy.arange(len(arrays['vertices']))
+    while True: # the lowest vertex of each group, spread along the pairs
+        lowest = numpy.minimum(groups[first], groups[second])
+        spread = groups.copy()
+        numpy.minimum.at(spread, first, lowest)
+        numpy.minimum.at(spread, second, lowest)
+        spread = spread[spread]
+        if (spread == groups).all():
+            break
+        groups = spread
+    return collapse(arrays, groups.reshape(-1, 1))
+
+def collapse(arrays: Dict[str, numpy.ndarray], cells: numpy.ndarray) -> Tuple[Dict[str, numpy.ndarray], Dict[str, int]]:
+    """
+    Merges the vertices of the same cell (rows of integer keys) into the first of
+    them, drops the faces collapsed below three vertices and the faces repeating the
+    vertices and the materials of another, and compacts the unreferenced vertices away. UVs and normals
+    stay per loop, so UV seams and split normals survive the merge.
+    Returns the collapsed arrays and the counts before and after.
+    """
+    report = { 'vertices': len(arrays['vertices']), 'faces': len(arrays['loop_total']) }
+    _, first, remap = numpy.unique(cells, axis=0, return_index=True, return_inverse=True)
+    loop_vertices = remap.reshape(-1)[arrays['loop_vertices']]
+    loop_total, loop_start = arrays['loop_total'], arrays['loop_start']
+    face_ids = numpy.repeat(numpy.arange(len(loop_total)), loop_total)
+    following = numpy.arange(len(loop_vertices)) + 1
+    last = loop_start + loop_total - 1
+    following[last[loop_total > 0]] = loop_start[loop_total > 0]
+    keep_loops = loop_vertices != loop_vertices[following] # consecutive repeats collapse
+    totals = numpy.bincount(face_ids[keep_loops], minlength=len(loop_total)).astype(numpy.int32)
+    keep_faces = totals >= 3
+    report['degenerate'] = int((~keep_faces).sum())
+    keep_loops &= keep_faces[face_ids]
+    kept_totals = numpy.where(keep_faces, totals, 0)
+    starts = numpy.cumsum(kept_totals) - kept_totals
+    kept_vertices = loop_vertices[keep_loops]
+    for size in numpy.unique(totals[keep_faces]): # faces of the same vertex set and materials, whatever their winding
+        faces = numpy.flatnonzero(keep_faces & (totals == size))
+        corners = numpy.sort(kept_vertices[(starts[faces, None] + numpy.arange(size)).reshape(-1)].reshape(-1, size), axis=1)
+        materials = [arrays[key][faces, None].astype(numpy.int64) for key in FACE_ARRAYS[1:] if key in arrays] # also the labels
+        _, unique_faces = numpy.unique(numpy.hstack([corners.astype(numpy.int64)] + materials), axis=0, return_index=True)
+        duplicates = numpy.setdiff1d(numpy.arange(len(faces)), unique_faces)
+        keep_faces[faces[duplicates]] = False
+    report['duplicates'] = report['faces'] - report['degenerate'] - int(keep_faces.sum())
+    keep_loops &= keep_faces[face_ids]
+    welded = { key: value for key, value in arrays.items() if key not in LOOP_ARRAYS + FACE_ARRAYS + ('vertices', 'loop_start') }
+    used, loop_vertices = numpy.unique(loop_vertices[keep_loops], return_inverse=True)
+    welded['vertices'] = arrays['vertices'][first[used]]
+    welded['loop_vertices'] = loop_vertices.reshape(-1).astype(numpy.int32)
+    for key in LOOP_ARRAYS[1:]:
+        if key in arrays:
+            welded[key] = arrays[key][keep_loops]
+    welded['loop_total'] = totals[keep_faces]
+    welded['loop_start'] = (numpy.cumsum(welded['loop_total']) - welded['loop_total']).astype(numpy.int32)
+    for key in FACE_ARRAYS[1:]:
+        if key in arrays:
+            welded[key] = arrays[key][keep_faces]
+    report['welded_vertices'], report['welded_faces'] = len(welded['vertices']), len(welded['loop_total'])
+    return welded, report
+
+def format_report(report: Dict[str, int]) -> str:
+    return (f"{report['vertices']} -> {report['welded_vertices']} vertices, {report['faces']} -> {report['welded_faces']} faces "
+        f"({report['degenerate']} degenerate, {report['duplicates']} duplicates)")
+
+def write(filepath: str, arrays: Dict[str, numpy.ndarray], materials: List[dict]):
+    """Writes the binary mesh aside and renames it into place, texture paths relative to it."""
+    folder = os.path.dirname(os.path.abspath(filepath))
+    table = [dict(m, texture=os.path.relpath(m['texture'], folder)) if m and 'texture' in m else m for m in materials]
+    temp_path = f"{filepath}.{os.getpid()}.partial"
+    with open(temp_path, 'wb') as f: # uncompressed, loading is a plain read
+        numpy.savez(f, version=numpy.array(VERSION), materials=numpy.array(json.dumps(table)), **arrays)
+    os.replace(temp_path, filepath)
+
+def read(filepath: str) -> Tuple[Dict[str, numpy.ndarray], List[dict]]:
+    """The arrays and the material table of a binary mesh, texture paths made absolute."""
+    with numpy.load(filepath) as content:
+        if int(content['version']) != VERSION:
+            raise ValueError(f"{filepath} is a version {int(content['version'])} binary mesh, convert it again.")
+        arrays = { key: content[key] for key in content.files if key not in ('version', 'materials') }
+    return arrays, read_materials(filepath)
+
+def read_materials(filepath: str) -> List[dict]:
+    with numpy.load(filepath) as content:
+        materials = json.loads(str(content['materials']))
+    folder = os.path.dirname(os.path.abspath(filepath))
+    return [dict(m, texture=os.path.join(folder, m['texture'])) if m and 'texture' in m else m for m in materials]
+
+def count_faces(filepath: str) -> int:
+    with numpy.load(filepath) as content:
+        return int(content['loop_total'].shape[0])
+
+def convert(filepath: str, output_path: Optional[str]=None, tolerance: Optional[float]=None) -> float:
+    start = time.time()
+    arrays, materials = read_source(filepath)
+    if tolerance:
+        arrays, report = weld(arrays, tolerance)
+        print(f"Welded {filepath}: {format_report(report)}")
+    write(output_path or get_binary_path(filepath), arrays, materials)
+    return time.time() - start
+
+def find_meshes(paths: List[str], extension: str='.obj') -> List[str]:
+    meshes = []
+    for path in paths:
+        if os.path.isdir(path):
+            meshes.extend(os.path.join(root, f) for root, _, files in os.walk(path) for f in files if f.endswith(extension))
+        else:
+            meshes.append(path)
+    return sorted(meshes)
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(description="Converts OBJ (and their MTL material tables) or PLY meshes once to a binary "
+        "layout of NumPy arrays, written next to them, that the render scripts load with bulk foreach_set calls.")
+    parser.add_argument('paths', type=str, help='The meshes, or folders searched for them.', nargs='+')
+    parser.add_argument('--extension', type=str, help='The meshes searched in the folders.', default='.obj', choices=SOURCE_EXTENSIONS)
+    parser.add_argument('--workers', type=int, help='Meshes converted in parallel.', default=max(1, (os.cpu_count() or 1) // 2))
+    parser.add_argument('--force', help='Convert the meshes again even if they are up to date.', default=False, action='store_true')
+    parser.add_argument('--weld', type=float, help=f'Weld the meshes with this tolerance (e.g. {WELD_TOLERANCE}), not welded if not given.', default=None)
+    return parser.parse_known_args(args)
+
+if __name__ == "__main__":
+    args, unknown = parse_arguments(sys.argv[1:])
+    meshes = [m for m in find_meshes(args.paths, args.extension) if args.force or not is_converted(m)]
+    print(f"Converting {len(meshes)} meshes with {args.workers} workers.")
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as pool:
+        futures = { pool.submit(convert, mesh, None, args.weld): mesh for mesh in meshes }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                print(f"Converted {futures[future]} in {future.result():.1f}s.")
+            except (OSError, ValueError) as e:
+                print(f"!!! - Could not convert {futures[future]} ({e}).")
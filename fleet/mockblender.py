@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the Blender executable, taking the same command line
+(blender --background --python SCRIPT -- ARGS), that sleeps for the time the
+cost model predicts instead of rendering, writes empty output files and appends
+the journal records of the render scripts. Pass it as --blender to the drivers.
+
+Tuned through environment variables:
+    MOCK_BLENDER_TIME_SCALE     scales the predicted durations (default 0.01)
+    MOCK_BLENDER_NOISE          sigma of the log-normal duration noise (default 0.2)
+    MOCK_BLENDER_FAILURE_RATE   probability of a job failing midway (default 0)
+    MOCK_BLENDER_OUTPUTS        write the dummy output files (default 1)
+    MOCK_BLENDER_MEMORY_SCALE   scales the predicted memory held while rendering (default 0)
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import cost
+from fleet import journal
+from fleet import worker
+
+TIME_SCALE = float(os.environ.get('MOCK_BLENDER_TIME_SCALE', 0.01))
+NOISE = float(os.environ.get('MOCK_BLENDER_NOISE', 0.2))
+FAILURE_RATE = float(os.environ.get('MOCK_BLENDER_FAILURE_RATE', 0.0))
+OUTPUTS = os.environ.get('MOCK_BLENDER_OUTPUTS', '1') != '0'
+MEMORY_SCALE = float(os.environ.get('MOCK_BLENDER_MEMORY_SCALE', 0.0))
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--scene_model', '--input_file', dest='scene_model', default=None)
+    parser.add_argument('--camera_path', default=[], nargs='+')
+    parser.add_argument('--output_path', default=None)
+    parser.add_argument('--journal', default=None)
+    parser.add_argument('--shard', default=None)
+    parser.add_argument('--pose_range', default=None, nargs=2, type=int)
+    parser.add_argument('--worker', default=False, action='store_true')
+    parsed, _ = parser.parse_known_args(args)
+    return parsed
+
+class MockRenderer(object):
+    def __init__(self):
+        self.cost_model = cost.CostModel()
+        self.scene = None
+        self.memory = None
+
+    def get_noise(self, name):
+        seed = int(hashlib.md5(name.encode()).hexdigest()[:8], 16) # the same job always takes as long
+        return random.Random(seed).lognormvariate(0.0, NOISE) if NOISE > 0.0 else 1.0
+
+    def render(self, args):
+        parsed = parse_arguments(args)
+        features = self.cost_model.get_features(args)
+        noise = self.get_noise(" ".join(args))
+        if parsed.scene_model != self.scene: # a persistent worker keeps its scene
+            time.sleep(self.cost_model.get_load_estimate(features) * TIME_SCALE * noise)
+            self.scene = parsed.scene_model
+        frame_seconds = (self.cost_model.get_raw_estimate(features) - self.cost_model.get_load_estimate(features)) \
+            / max(features['frames'], 1) * TIME_SCALE * noise
+        self.memory = b'\x01' * int(self.cost_model.get_memory_estimate(features) * MEMORY_SCALE * 2 ** 20)
+        for camera_path in parsed.camera_path:
+            self.render_trajectory(parsed, camera_path, features, frame_seconds)
+
+    def render_trajectory(self, parsed, camera_path, features, frame_seconds):
+        trajectory = os.path.basename(os.path.dirname(camera_path)) if os.path.isfile(camera_path) \
+            else os.path.basename(camera_path)
+        job_name = journal.get_shard_name(trajectory, parsed.shard, parsed.pose_range)
+        started = time.time()
+        if parsed.journal:
+            journal.Journal(parsed.journal).append(job_name, 'started', scene=parsed.scene_model)
+        journal_wait = time.time() - started
+        poses = cost.count_assigned(cost.count_poses(camera_path), parsed.shard, parsed.pose_range) \
+            if os.path.exists(camera_path) else 0
+        frames = features['frames'] // max(features['poses'], 1)
+        for pose in range(poses):
+            if random.random() < FAILURE_RATE / max(poses, 1):
+                raise RuntimeError(f"Mock failure at pose {pose} of {job_name}.")
+            time.sleep(frame_seconds * frames)
+            if OUTPUTS and parsed.output_path:
+                os.makedirs(parsed.output_path, exist_ok=True)
+                for frame in range(frames):
+                    open(os.path.join(parsed.output_path, f"{pose}_{job_name}_{frame}.png"), 'wb').close()
+        if parsed.journal:
+            now = time.time()
+            journal.Journal(parsed.journal).append(job_name, 'done', scene=parsed.scene_model,
+                duration=now - started, poses=poses, outputs=poses * frames, journal_wait=journal_wait + time.time() - now)
+
+if __name__ == "__main__":
+    arguments_vector = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    renderer = MockRenderer()
+    if parse_arguments(arguments_vector).worker:
+        worker.serve(lambda job_vector: renderer.render(arguments_vector + job_vector))
+    else:
+        try:
+            renderer.render(arguments_vector)
+        except RuntimeError as e:
+            print(f"!!! - {e}")
+            sys.exit(1)
@@ -0,0 +1,236 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+
+from typing import Dict, List
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+from fleet import cost
+from fleet import devices
+from fleet import executor
+from fleet import journal
+from fleet import staging
+from fleet import watchdog
+from fleet import worker
+
+DEFAULT_CPU_POOL = max(1, (os.cpu_count() or 1) // 2)
+
+def load_spec(filename: str) -> dict:
+    with open(filename) as f:
+        if filename.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise RuntimeError("PyYAML is required for .yaml pipeline specs, use a .json one instead.")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def expand(value, variables: Dict[str, str]):
+    """
+    Formats the strings of a spec value with the variables; a {"glob": PATTERN}
+    entry expands to its sorted matches within a list (only the first with
+    "first": true) and to its first match elsewhere.
+    """
+    if isinstance(value, str):
+        return value.format(**variables)
+    if isinstance(value, list):
+        expanded = []
+        for entry in value:
+            if isinstance(entry, dict) and 'glob' in entry:
+                matches = sorted(glob.glob(expand(entry['glob'], variables)))
+                expanded.extend(matches[:1] if entry.get('first') else matches)
+            else:
+                expanded.append(expand(entry, variables))
+        return expanded
+    if isinstance(value, dict):
+        if 'glob' in value:
+            return next(iter(sorted(glob.glob(expand(value['glob'], variables)))), None)
+        return { key: expand(entry, variables) for key, entry in value.items() }
+    return value
+
+def discover(spec: dict, variables: Dict[str, str]) -> List[Dict[str, str]]:
+    """
+    Finds the items (e.g. buildings or meshes) the pipeline runs on, with the
+    path, folder, stem and name variables of each, plus the item variables of the
+    spec; items missing any of their required files or variables are skipped.
+    """
+    items_spec = spec['items']
+    items, names = [], set()
+    for path in sorted(glob.glob(expand(items_spec['glob'], variables))):
+        stem = os.path.splitext(os.path.basename(path.rstrip('/\\')))[0]
+        separator = items_spec.get('separator')
+        item = dict(variables, path=path, folder=os.path.dirname(path), stem=stem,
+            name=stem.split(separator)[0] if separator else stem)
+        if item['name'] in names: # e.g. several files of the same mesh
+            continue
+        for key, value in items_spec.get('variables', {}).items():
+            item[key] = expand(value, item)
+        missing = [key for key in items_spec.get('variables', {}) if not item[key]] \
+            + [r for r in expand(items_spec.get('requires', []), item) if not os.path.exists(r)]
+        if missing:
+            print(f"Skipping {item['name']}, missing {missing}.")
+            continue
+        names.add(item['name'])
+        items.append(item)
+    return items
+
+class Pipeline(object):
+    """
+    Runs a DAG of stages for every item of a job spec; the command and pack stages
+    run on their own (CPU) worker pools and the render stages on the device
+    scheduler, so that preparing the next building and packing the previous one
+    overlap the render of the current one. Completed stages are journaled and skipped
+    when the pipeline is run again.
+    """
+    def __init__(self, spec: dict, variables: Dict[str, str], log_path: str):
+        self.spec = spec
+        self.variables = variables
+        self.log_path = log_path
+        self.stages = spec['stages']
+        self.check_stages()
+        render = expand(spec.get('render', {}), variables)
+        self.watchdog = watchdog.MemoryWatchdog(render.get('memory_interval', watchdog.DEFAULT_INTERVAL)) \
+            if render.get('memory_interval', watchdog.DEFAULT_INTERVAL) > 0 else None
+        self.scheduler = devices.DeviceScheduler(max_used_percent=30.0, jobs_per_gpu=render.get('jobs_per_gpu', 2),
+            cpu_workers=render.get('cpu_workers', 0), cpu_threads=render.get('cpu_threads'),
+            affinity=render.get('persistent', False),
+            host_memory=self.watchdog.get_budget() if self.watchdog is not None else None)
+        self.cost_model = cost.CostModel(render.get('timings'))
+        self.render = render
+        self.staging = staging.StagingCache(render['staging_path'], render.get('staging_size', 100.0)) \
+            if render.get('staging_path') else None
+        self.executors = {}
+        self.journal = journal.Journal(expand(spec.get('journal', 'pipeline.jsonl'), variables))
+        self.completed = self.journal.get_completed() if os.path.exists(self.journal.path) else set()
+        self.failed = []
+
+    def check_stages(self):
+        names = [stage['name'] for stage in self.stages]
+        for index, stage in enumerate(self.stages):
+            for dependency in stage.get('after', []):
+                if dependency not in names[:index]: # also rules out cycles
+                    raise ValueError(f"Stage {stage['name']} runs after {dependency}, which is not listed before it.")
+            if sum(int(kind in stage) for kind in ['command', 'render', 'pack']) != 1:
+                raise ValueError(f"Stage {stage['name']} needs exactly one of command, render or pack.")
+
+    def get_executor(self, render_script: str) -> executor.Executor:
+        if render_script not in self.executors: # all render scripts share the devices
+            self.executors[render_script] = executor.Executor(self.render['blender'], render_script, self.scheduler,
+                log_path=self.log_path, timeout=self.render.get('timeout'), retries=self.render.get('retries', 2),
+                persistent=self.render.get('persistent', False), cost_model=self.cost_model, staging=self.staging,
+                watchdog=self.watchdog)
+        return self.executors[render_script]
+
+    def run(self, items: List[Dict[str, str]]):
+        if not os.path.exists(self.log_path):
+            os.makedirs(self.log_path)
+        try:
+            asyncio.run(self.__run__(items))
+        except KeyboardInterrupt:
+            print("Cancelled, all running stages were terminated.")
+        print(f"Completed {len(items) * len(self.stages) - len(self.failed)}/{len(items) * len(self.stages)} stages.")
+        for name in self.failed:
+            print(f"!!! - Stage {name} failed.")
+
+    async def __run__(self, items: List[Dict[str, str]]):
+        self.pools = { name: asyncio.Semaphore(size) for name, size in self.spec.get('pools', {}).items() }
+        self.pools.setdefault('cpu', asyncio.Semaphore(DEFAULT_CPU_POOL))
+        try:
+            await asyncio.gather(*[self.__run_item__(item) for item in items])
+        finally:
+            for render_executor in self.executors.values():
+                await render_executor.close()
+
+    async def __run_item__(self, item: Dict[str, str]):
+        tasks = {}
+        for stage in self.stages:
+            tasks[stage['name']] = asyncio.ensure_future(self.__run_stage__(stage, item, tasks))
+        await asyncio.gather(*tasks.values())
+
+    async def __run_stage__(self, stage: dict, item: Dict[str, str], tasks: Dict[str, asyncio.Future]) -> bool:
+        dependencies = [await tasks[name] for name in stage.get('after', [])]
+        name = f"{item['name']}:{stage['name']}"
+        if not all(dependencies):
+            self.failed.append(name)
+            return False
+        outputs = expand(stage.get('outputs', []), item)
+        if name in self.completed or (outputs and all(os.path.exists(o) for o in outputs)):
+            return True
+        start = time.time()
+        if 'render' in stage:
+            success = await self.__render__(stage, item)
+        else:
+            async with self.pools[stage.get('pool', 'cpu')]:
+                print(f"Starting {name}.")
+                success = await (self.__command__(stage, item) if 'command' in stage else self.__pack__(stage, item))
+        self.journal.append(name, 'done' if success else 'failed', duration=time.time() - start)
+        if not success:
+            self.failed.append(name)
+        print(f"Finished {name} {'successfully' if success else 'with errors'} in {time.time() - start:.1f}s.")
+        return success
+
+    async def __render__(self, stage: dict, item: Dict[str, str]) -> bool:
+        render = expand(stage['render'], item)
+        job = executor.Job(f"{item['name']}.{stage['name']}", render['args'])
+        return await self.get_executor(render['script']).run_job(job) == 0
+
+    async def __command__(self, stage: dict, item: Dict[str, str]) -> bool:
+        command = expand(stage['command'], item)
+        with open(os.path.join(self.log_path, f"{item['name']}.{stage['name']}.log"), 'a') as log:
+            log.write(" ".join(command) + "\n")
+            log.flush()
+            process = await asyncio.create_subprocess_exec(*command, stdout=log, stderr=asyncio.subprocess.STDOUT)
+            try:
+                return await process.wait() == 0
+            finally:
+                if process.returncode is None: # cancelled
+                    await worker.terminate(process)
+
+    async def __pack__(self, stage: dict, item: Dict[str, str]) -> bool:
+        pack = expand(stage['pack'], item)
+        archive_format = pack.get('format', 'zip')
+        def make_archive(): # written aside and renamed, a partial archive never looks complete
+            filename = shutil.make_archive(pack['archive'] + '.partial', archive_format, pack['source'])
+            os.replace(filename, filename.replace('.partial', ''))
+            if pack.get('remove_source'):
+                shutil.rmtree(pack['source'])
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, make_archive)
+            return True
+        except OSError as e:
+            print(f"!!! - Could not pack {pack['source']} ({e}).")
+            return False
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(description="Runs the convert/prepare, render and pack stages of a "
+        "json (or yaml) job spec for every discovered building or mesh, overlapping the stages of different items.")
+    parser.add_argument('spec', type=str, help='The pipeline job spec.')
+    parser.add_argument('--set', type=str, help='Overrides a spec variable, e.g. --set blender=PATH_TO_BLENDER_EXE',\
+        default=[], nargs='*')
+    parser.add_argument('--items', type=str, help='Only run the items with these names.', default=None, nargs='*')
+    parser.add_argument('--log_path', type=str, help='Folder where the output of each stage is logged at.',\
+        default=".\\logs")
+    parser.add_argument('--dry_run', help='Only list the discovered items and their stages.', default=False, action='store_true')
+    return parser.parse_known_args(args)
+
+if __name__ == "__main__":
+    args, unknown = parse_arguments(sys.argv[1:])
+    spec = load_spec(args.spec)
+    variables = dict(spec.get('variables', {}))
+    variables.update(dict(assignment.split('=', 1) for assignment in args.set))
+    items = discover(spec, variables)
+    if args.items is not None:
+        items = [item for item in items if item['name'] in args.items]
+    print(f"Running {len(spec['stages'])} stages on {len(items)} items of {args.spec}.")
+    if args.dry_run:
+        for item in items:
+            print(item['name'], [stage['name'] for stage in spec['stages']])
+    else:
+        Pipeline(spec, variables, args.log_path).run(items)
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+
+from typing import List, Optional, Set
+
+from fleet import cost
+from fleet import devices
+from fleet import executor
+from fleet import manifest
+from fleet import textures
+
+SCENE_CACHE_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'render', 'scenecache.py')
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(description="Pre-warms the scene cache of the render scripts, importing and "
+        "preparing every scene of a dataset split once and saving it as a .blend file the render jobs open instead.")
+    parser.add_argument('--scenes_path', type=str, help='The folder of the scenes, e.g. the Matterport3D v1/scans folder or the GibsonV2 meshes folder.',\
+        required=True)
+    parser.add_argument('--dataset', type=str, help='Which dataset the scenes belong to.',\
+        default='matterport3d', choices=['suncg', 'matterport3d', 'stanford2d3d', 'gibsonv2'])
+    parser.add_argument('--split', type=str, help='A text file with the names of the buildings (or meshes) of the split, one per line (all of them if not given).',\
+        default=None)
+    parser.add_argument('--scene_cache', type=str, help='Folder of the prepared .blend scenes.',\
+        required=True)
+    parser.add_argument('--preparations', type=str, help='Preparations of the scenes, they have to match the passes of the render jobs '
+        '(-r/--raw: emission, -n/--normals: normals, none of -c/-r/-n/--combined: geometry, --weld: weld, PilotRender.py: merge as well).',\
+        default=['emission'], nargs='*', choices=['merge', 'emission', 'normals', 'geometry', 'weld'])
+    parser.add_argument('--texture_cache', type=str, help='Local folder of the downscaled textures, the same as the render jobs use (full size textures if not given).',\
+        default=None)
+    parser.add_argument('--texture_budget', type=float, help='Memory budget (MB) of the textures of each scene, the same as the render jobs use.',\
+        default=textures.DEFAULT_BUDGET)
+    parser.add_argument('--resolution', type=int, help='Largest output dimension of the render jobs, which picks the texture level '
+        '(DroneRender.py: the larger of --width and --height, OmniRender.py: --width, PilotRender.py: the largest of the drone and egocentric sizes).',\
+        default=None)
+    parser.add_argument("--blender", type=str, help="Blender executable path.",\
+        default=r'PATH_TO_BLENDER_EXE')
+    parser.add_argument('--workers', type=int, help='Concurrent Blender processes on the CPUs, besides one per GPU.',\
+        default=max(1, (os.cpu_count() or 1) // devices.DEFAULT_CPU_THREADS))
+    parser.add_argument('--log_path', type=str, help='Folder where the Blender output of each scene is logged at.',\
+        default=".\\logs")
+    parser.add_argument('--manifest', type=str, help='The .json manifest caching the dataset folder listings between launches.',\
+        default=".\\manifest.json")
+    return parser.parse_known_args(args)
+
+def read_split(filename: Optional[str]) -> Optional[Set[str]]:
+    if filename is None:
+        return None
+    with open(filename) as f:
+        return set(line.strip() for line in f if line.strip())
+
+def find_scenes(args, dataset_manifest: manifest.Manifest) -> List[str]:
+    names = read_split(args.split)
+    if args.dataset == 'matterport3d':
+        meshes = [dataset_manifest.find_file(os.path.join(args.scenes_path, building, building, "matterport_mesh"), 'obj')
+            for building in dataset_manifest.get_dirs(args.scenes_path) if names is None or building in names]
+        return [mesh for mesh in meshes if mesh is not None]
+    meshes = []
+    for root, dirs, files in dataset_manifest.walk(args.scenes_path):
+        for filename in files:
+            if not filename.endswith('.obj'):
+                continue
+            parts = set(os.path.normpath(root).split(os.sep) + [filename.split('_')[0], os.path.splitext(filename)[0]])
+            if names is None or names & parts:
+                meshes.append(os.path.join(root, filename))
+    return sorted(meshes)
+
+if __name__ == "__main__":
+    args, unknown = parse_arguments(sys.argv[1:])
+    if args.texture_cache and args.resolution is None:
+        print("!!! - The texture level depends on the output resolution, give the --resolution of the render jobs.")
+        sys.exit(1)
+    dataset_manifest = manifest.Manifest(args.manifest)
+    scenes = find_scenes(args, dataset_manifest)
+    dataset_manifest.save()
+    print(f"Pre-warming {len(scenes)} scenes @ {args.scene_cache}")
+    jobs = [executor.Job(f"prewarm_{os.path.splitext(os.path.basename(scene))[0]}", ["--scene_model", scene,
+        "--dataset", args.dataset, "--scene_cache", args.scene_cache, "--preparations", *args.preparations]
+        + (["--texture_cache", args.texture_cache, "--texture_budget", str(args.texture_budget), "--resolution", str(args.resolution)] if args.texture_cache else []))
+        for scene in scenes]
+    scheduler = devices.DeviceScheduler(max_used_percent=30.0, cpu_workers=args.workers)
+    jobs = cost.CostModel().order(jobs, scheduler.get_concurrency()) # the largest scenes first
+    executor.Executor(args.blender, SCENE_CACHE_SCRIPT, scheduler, log_path=args.log_path, retries=1).run(jobs)
@@ -0,0 +1,107 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from fleet import cost
+from fleet import devices
+from fleet import executor
+from fleet import journal
+from fleet import jobqueue
+
+MOCK_BLENDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mockblender.py')
+
+class SimulatedGPUs(object):
+    """Stands in for nvgpu, reporting identical idle GPUs."""
+    def __init__(self, count: int, memory: float):
+        self.count = count
+        self.memory = memory
+
+    def gpu_info(self):
+        return [{ 'index': str(i), 'mem_total': self.memory, 'mem_used': 0.0 } for i in range(self.count)]
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(description="Replays synthetic render jobs through the fleet executor "
+        "with the mock blender, reporting the scheduling efficiency, idle device time and journal contention.")
+    parser.add_argument('--jobs', type=int, help='Number of synthetic jobs.', default=1000)
+    parser.add_argument('--scenes', type=int, help='Number of distinct scenes the jobs render.', default=100)
+    parser.add_argument('--mean_poses', type=float, help='Mean number of poses of a job (log-normally distributed).', default=200.0)
+    parser.add_argument('--mean_triangles', type=float, help='Mean number of triangles of a scene (log-normally distributed).', default=1e6)
+    parser.add_argument('--gpus', type=int, help='Number of simulated GPUs.', default=8)
+    parser.add_argument('--gpu_memory', type=float, help='Memory of each simulated GPU (MB).', default=11000.0)
+    parser.add_argument('--jobs_per_gpu', type=int, help='Maximum concurrent jobs per GPU.', default=2)
+    parser.add_argument('--cpu_workers', type=int, help='Number of CPU workers.', default=0)
+    parser.add_argument('--persistent', help='Keep one mock blender per device alive.', default=False, action='store_true')
+    parser.add_argument('--max_shards', type=int, help='Split oversized jobs into at most this many shards.', default=1)
+    parser.add_argument('--time_scale', type=float, help='Scales the predicted job durations.', default=0.001)
+    parser.add_argument('--noise', type=float, help='Sigma of the log-normal duration noise.', default=0.2)
+    parser.add_argument('--failure_rate', type=float, help='Probability of a job failing.', default=0.0)
+    parser.add_argument('--retries', type=int, help='Retries of failed jobs.', default=1)
+    parser.add_argument('--queue', help='Run through a shared job queue at this path.', default=False, action='store_true')
+    parser.add_argument('--work_path', type=str, help='Where the synthetic scenes, journal and outputs are written (a temporary folder if not given).', default=None)
+    parser.add_argument('--seed', type=int, help='Random seed of the synthetic workload.', default=0)
+    return parser.parse_known_args(args)
+
+def write_scene(filename: str, triangles: int):
+    with open(filename, 'w') as f: # only the header is read by the cost model
+        f.write(f"ply\nformat ascii 1.0\nelement vertex 0\nelement face {triangles}\nend_header\n")
+
+def write_trajectory(filename: str, poses: int):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'w') as f:
+        f.write("header\n" + "pose\n" * poses)
+
+def make_jobs(args, work_path: str):
+    generator = random.Random(args.seed)
+    scenes_path = os.path.join(work_path, 'scenes')
+    os.makedirs(scenes_path, exist_ok=True)
+    scenes = []
+    for i in range(args.scenes):
+        scene = os.path.join(scenes_path, f"scene{i}.ply")
+        write_scene(scene, int(generator.lognormvariate(0.0, 1.0) * args.mean_triangles / 1.65))
+        scenes.append(scene)
+    jobs = []
+    for i in range(args.jobs):
+        trajectory = os.path.join(work_path, 'trajectories', f"job{i}", 'airsim_rec_blender.txt')
+        write_trajectory(trajectory, max(1, int(generator.lognormvariate(0.0, 1.0) * args.mean_poses / 1.65)))
+        jobs.append(executor.Job(f"job{i}", ["--scene_model", generator.choice(scenes), "--camera_path", trajectory,
+            "--output_path", os.path.join(work_path, 'renders'), "--journal", os.path.join(work_path, 'journal.jsonl'),
+            "--width", "320", "--height", "180", "--samples", "256", "-r", "-d", "-n", "-f"]))
+    return jobs
+
+def report(jobs, scheduler, makespan: float, journal_path: str):
+    durations = [job.duration for job in jobs if job.duration is not None]
+    slots = sum(device.max_jobs for device in scheduler.get_devices())
+    busy = sum(durations)
+    lower_bound = max(busy / max(slots, 1), max(durations, default=0.0))
+    print(f"Makespan {makespan:.1f}s for {len(durations)} jobs on {slots} device slots.")
+    print(f"Scheduling efficiency {100.0 * lower_bound / max(makespan, 1e-6):.1f}% "
+        f"(lower bound {lower_bound:.1f}s), idle device time {max(slots * makespan - busy, 0.0):.1f}s "
+        f"({100.0 * max(1.0 - busy / max(slots * makespan, 1e-6), 0.0):.1f}%).")
+    records = [r for r in journal.Journal(journal_path).load().values() if 'journal_wait' in r]
+    if records:
+        waits = sorted(r['journal_wait'] for r in records)
+        print(f"Journal appends of {len(records)} jobs took {1000.0 * sum(waits) / len(waits):.2f}ms on average, "
+            f"{1000.0 * waits[int(0.99 * (len(waits) - 1))]:.2f}ms at p99 and {1000.0 * waits[-1]:.2f}ms at most.")
+
+if __name__ == "__main__":
+    args, unknown = parse_arguments(sys.argv)
+    work_path = args.work_path or tempfile.mkdtemp(prefix='fleet-simulation-')
+    print(f"Simulating {args.jobs} jobs @ {work_path}")
+    os.environ.update({ 'MOCK_BLENDER_TIME_SCALE': str(args.time_scale), 'MOCK_BLENDER_NOISE': str(args.noise),
+        'MOCK_BLENDER_FAILURE_RATE': str(args.failure_rate), 'MOCK_BLENDER_OUTPUTS': '0' })
+    devices.nvgpu = SimulatedGPUs(args.gpus, args.gpu_memory)
+    jobs = make_jobs(args, work_path)
+    scheduler = devices.DeviceScheduler(max_used_percent=30.0, jobs_per_gpu=args.jobs_per_gpu,
+        cpu_workers=args.cpu_workers, affinity=args.persistent)
+    jobs = cost.CostModel().order(jobs, scheduler.get_concurrency(), args.max_shards)
+    for job in jobs: # the mock sleeps for the scaled down predictions
+        job.cost, job.reload = job.cost * args.time_scale, job.reload * args.time_scale
+    render_executor = executor.Executor(MOCK_BLENDER, "render/DroneRender.py", scheduler,
+        log_path=os.path.join(work_path, 'logs'), retries=args.retries, backoff=0.0, persistent=args.persistent,
+        job_queue=jobqueue.JobQueue(os.path.join(work_path, 'queue')) if args.queue else None, poll_interval=0.1)
+    start = time.time()
+    render_executor.run(jobs)
+    report(render_executor.finished, scheduler, time.time() - start, os.path.join(work_path, 'journal.jsonl'))
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from typing import Dict, List
+
+MARKER = "staged.json"
+MIRRORED_DEPTH = 3 # trailing source folders kept, the render scripts name the scenes after them
+HEADER_BYTES = 1 << 16 # where an obj lists its mtllib
+
+def get_scene_files(filepath: str) -> List[str]:
+    """
+    The mesh file with the materials and textures it references, or None when
+    any of them is outside of the mesh folder (it could not be relocated).
+    """
+    files = [filepath]
+    folder = os.path.dirname(filepath)
+    if filepath.endswith('.npz'): # binary meshes keep their material table
+        from fleet import meshformat # needs numpy, only then
+        files += sorted(set(m['texture'] for m in meshformat.read_materials(filepath)
+            if m and 'texture' in m and os.path.exists(m['texture'])))
+        return None if any(os.path.relpath(f, folder).startswith('..') for f in files) else files
+    if filepath.lower().endswith('.ply'):
+        from fleet import meshformat
+        files += [t for t in meshformat.get_ply_textures(filepath) if os.path.exists(t)]
+        return None if any(os.path.relpath(f, folder).startswith('..') for f in files) else files
+    if not filepath.lower().endswith('.obj'):
+        return files
+    with open(filepath, 'rb') as f:
+        header = f.read(HEADER_BYTES).decode(errors='replace').splitlines()
+    materials = [os.path.join(folder, line.split(None, 1)[1].strip()) for line in header
+        if line.startswith('mtllib ') and len(line.split(None, 1)) > 1]
+    for material in materials:
+        if not os.path.exists(material):
+            continue
+        files.append(material)
+        with open(material, 'r', errors='replace') as f:
+            for line in f:
+                parts = line.strip().split()
+                if parts and parts[0].lower().startswith(('map_', 'bump', 'disp', 'decal', 'refl')):
+                    texture = os.path.join(os.path.dirname(material), parts[-1])
+                    if os.path.exists(texture) and texture not in files:
+                        files.append(texture)
+    if any(os.path.relpath(f, folder).startswith('..') for f in files):
+        return None
+    return files
+
+class StagingCache(object):
+    """
+    Copies the scene files of the render jobs (the mesh with its materials and
+    textures) from shared storage to a local scratch folder, where the following
+    jobs of the same scene reuse them. Scenes are prefetched while their jobs wait
+    for a device and evicted least recently used beyond the size cap.
+    """
+    def __init__(self, root: str, capacity_gb: float=100.0, copies: int=2):
+        self.root = os.path.abspath(root)
+        self.capacity = capacity_gb * 2 ** 30
+        self.entries = {}
+        self.pins = {}
+        self.tasks = {}
+        self.semaphore = None
+        self.copies = copies
+        os.makedirs(root, exist_ok=True)
+        self.__load__()
+
+    def __load__(self):
+        for key in os.listdir(self.root):
+            folder = os.path.join(self.root, key)
+            marker = os.path.join(folder, MARKER)
+            if os.path.exists(marker):
+                with open(marker) as f:
+                    self.entries[key] = json.load(f)
+                self.entries[key]['used'] = os.path.getmtime(marker)
+            elif os.path.isdir(folder) and os.path.getmtime(folder) < time.time() - 3600.0: # interrupted copy
+                shutil.rmtree(folder, ignore_errors=True)
+
+    def get_key(self, source: str) -> str:
+        return hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:16]
+
+    def get_local(self, source: str) -> str:
+        parts = os.path.normpath(os.path.abspath(source)).split(os.sep)
+        return os.path.join(self.root, self.get_key(source), *parts[-(MIRRORED_DEPTH + 1):])
+
+    def get_size(self) -> float:
+        return sum(entry['size'] for entry in self.entries.values())
+
+    def is_valid(self, key: str, source: str) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and entry['mtime'] == os.stat(source).st_mtime_ns
+
+    def prefetch(self, source: str):
+        key = self.get_key(source)
+        if key not in self.tasks and not self.is_valid(key, source):
+            self.tasks[key] = asyncio.ensure_future(self.__stage__(source, key))
+
+    async def acquire(self, source: str) -> str:
+        """Pins the staged copy of the scene (staging it first) and returns its path, or the source on failure."""
+        key = self.get_key(source)
+        self.pins[key] = self.pins.get(key, 0) + 1
+        if not self.is_valid(key, source):
+            self.prefetch(source)
+            await asyncio.shield(self.tasks[key])
+        if not self.is_valid(key, source):
+            return source
+        self.entries[key]['used'] = time.time()
+        os.utime(os.path.join(self.root, key, MARKER))
+        return self.get_local(source)
+
+    def release(self, source: str):
+        key = self.get_key(source)
+        self.pins[key] -= 1
+        if self.pins[key] == 0:
+            del self.pins[key]
+
+    def __evict__(self, size: float) -> bool:
+        for key in sorted(self.entries, key=lambda k: self.entries[k]['used']):
+            if self.get_size() + size <= self.capacity:
+                break
+            if key not in self.pins:
+                print(f"Evicting {self.entries[key]['source']} from {self.root}.")
+                del self.entries[key]
+                shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+        return self.get_size() + size <= self.capacity
+
+    async def __stage__(self, source: str, key: str):
+        loop = asyncio.get_running_loop()
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.copies) # spares the shared storage
+        try:
+            async with self.semaphore:
+                files = await loop.run_in_executor(None, get_scene_files, source)
+                if files is None:
+                    print(f"!!! - Not staging {source}, it references files outside of its folder.")
+                    return
+                size = sum(os.path.getsize(f) for f in files)
+                if key in self.entries: # stale copy of a modified scene
+                    del self.entries[key]
+                    shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+                if not self.__evict__(size):
+                    print(f"!!! - Not staging {source}, it does not fit in {self.root}.")
+                    return
+                start = time.time()
+                entry = await loop.run_in_executor(None, self.__copy__, source, key, files, size)
+                self.entries[key] = entry
+                print(f"Staged {source} ({size / 2 ** 20:.0f}MB) in {time.time() - start:.1f}s.")
+        except OSError as e:
+            print(f"!!! - Could not stage {source} ({e}).")
+        finally:
+            del self.tasks[key]
+
+    def __copy__(self, source: str, key: str, files: List[str], size: float) -> Dict:
+        folder = os.path.join(self.root, key)
+        temp_folder = f"{folder}.{os.getpid()}.partial"
+        shutil.rmtree(temp_folder, ignore_errors=True)
+        local = os.path.join(temp_folder, os.path.relpath(self.get_local(source), folder))
+        for filename in files:
+            target = os.path.join(os.path.dirname(local), os.path.relpath(filename, os.path.dirname(source)))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(filename, target)
+        entry = { 'source': source, 'mtime': os.stat(source).st_mtime_ns, 'size': size, 'used': time.time() }
+        with open(os.path.join(temp_folder, MARKER), 'w') as f:
+            json.dump(entry, f)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(temp_folder, folder) # complete copies only
+        return entry
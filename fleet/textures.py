@@ -0,0 +1,151 @@
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+import time
+
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from PIL import Image
+except ImportError: # only preparing the variants needs it, not selecting them
+    Image = None
+
+from fleet import staging
+
+TEXTURE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+SAMPLE_BYTES = 1 << 20 # hashed at both ends of every texture
+DEFAULT_LEVELS = 3 # halvings prepared, 2048 down to 256 texels
+MIN_SIZE = 64 # texels, no level goes below it
+TEXELS_PER_PIXEL = 2.0 # texture resolution kept above the output resolution, against visible blur
+BYTES_PER_TEXEL = 4 # RGBA bytes in device memory
+DEFAULT_BUDGET = 2048.0 # MB of textures of a job
+
+def get_key(filepath: str) -> str:
+    """Content key of a texture, from its size and sampled contents, so staged copies share the variants."""
+    stat = os.stat(filepath)
+    digest = hashlib.sha1(str(stat.st_size).encode())
+    with open(filepath, 'rb') as f:
+        digest.update(f.read(SAMPLE_BYTES))
+        if stat.st_size > 2 * SAMPLE_BYTES:
+            f.seek(-SAMPLE_BYTES, os.SEEK_END)
+            digest.update(f.read())
+    return digest.hexdigest()[:20]
+
+def get_entry_path(cache_path: str, key: str) -> str:
+    return os.path.join(cache_path, key[:2], key + '.json')
+
+def get_variant_path(cache_path: str, key: str, level: int, extension: str) -> str:
+    return os.path.join(cache_path, key[:2], f"{key}_{level}{extension}")
+
+def read_entry(cache_path: str, key: str) -> Optional[Dict]:
+    """The size and the prepared levels of a texture, None if it was not prepared."""
+    try:
+        with open(get_entry_path(cache_path, key)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def get_textures(filepath: str) -> List[str]:
+    """The textures a scene mesh references."""
+    return [f for f in staging.get_scene_files(filepath) or [] if f.lower().endswith(TEXTURE_EXTENSIONS)]
+
+def prepare_texture(filepath: str, cache_path: str, levels: int=DEFAULT_LEVELS) -> float:
+    """
+    Writes the power-of-two downscaled variants of a texture, each aside and renamed
+    into place, and its entry last, which marks the texture as prepared.
+    """
+    start = time.time()
+    key, extension = get_key(filepath), os.path.splitext(filepath)[1].lower()
+    entry = read_entry(cache_path, key)
+    if entry is not None and entry['levels'] >= levels:
+        return 0.0
+    os.makedirs(os.path.dirname(get_entry_path(cache_path, key)), exist_ok=True)
+    with Image.open(filepath) as image:
+        width, height = image.size
+        variant, level = image, 0
+        while level < levels and min(width, height) >> (level + 1) >= MIN_SIZE:
+            level += 1
+            variant = variant.reduce(2) # box filtered halving of the previous level
+            variant_path = get_variant_path(cache_path, key, level, extension)
+            temp_path = f"{variant_path}.{os.getpid()}.partial{extension}"
+            if extension == '.png':
+                variant.save(temp_path)
+            else:
+                variant.convert('RGB').save(temp_path, quality=95)
+            os.replace(temp_path, variant_path)
+    entry_path = get_entry_path(cache_path, key)
+    with open(f"{entry_path}.{os.getpid()}.partial", 'w') as f:
+        json.dump({ 'width': width, 'height': height, 'levels': level, 'extension': extension }, f)
+    os.replace(f"{entry_path}.{os.getpid()}.partial", entry_path)
+    return time.time() - start
+
+def select_level(sizes: List[Tuple[int, int]], resolution: int, budget: float, levels: int) -> int:
+    """
+    The level of a scene's textures, the coarsest still above the output resolution
+    (by TEXELS_PER_PIXEL), coarser still until the textures fit the budget (MB).
+    """
+    if not sizes:
+        return 0
+    largest, level = max(max(size) for size in sizes), 0
+    while level < levels and (largest >> (level + 1)) >= TEXELS_PER_PIXEL * resolution:
+        level += 1
+    while level < levels and sum((w >> level) * (h >> level) for w, h in sizes) * BYTES_PER_TEXEL / 2 ** 20 > budget:
+        level += 1
+    return level
+
+def get_variants(filepath: str, cache_path: str, resolution: int, budget: float=DEFAULT_BUDGET) -> Dict[str, str]:
+    """
+    The downscaled variant of each prepared texture of the scene, for the level picked
+    from the render resolution (the largest output dimension) and the texture budget.
+    Textures that were not prepared are left out, at their full size.
+    """
+    entries = {}
+    for texture in get_textures(filepath):
+        key = get_key(texture)
+        entries[texture] = (key, read_entry(cache_path, key))
+    prepared = [entry for _, entry in entries.values() if entry is not None]
+    if not prepared:
+        return {}
+    level = select_level([(e['width'], e['height']) for e in prepared], resolution, budget, max(e['levels'] for e in prepared))
+    variants = {}
+    for texture, (key, entry) in entries.items():
+        if entry is not None and min(level, entry['levels']) > 0:
+            variants[os.path.normpath(os.path.abspath(texture))] = get_variant_path(cache_path, key, min(level, entry['levels']), entry['extension'])
+    print(f"Using level {level} of {len(variants)} of the {len(entries)} textures of {filepath}.")
+    return variants
+
+def find_meshes(paths: List[str]) -> List[str]:
+    meshes = []
+    for path in paths:
+        if os.path.isdir(path):
+            meshes.extend(os.path.join(root, f) for root, _, files in os.walk(path) for f in files if f.endswith(('.obj', '.ply', '.npz')))
+        else:
+            meshes.append(path)
+    return sorted(meshes)
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(description="Prepares power-of-two downscaled variants of the textures of scene meshes in a "
+        "local texture cache, keyed by the texture contents, which the render scripts pick a level of for their resolution.")
+    parser.add_argument('paths', type=str, help='The meshes, or folders searched for them (e.g. a building).', nargs='+')
+    parser.add_argument('--cache', type=str, help='The texture cache folder, on local disk.', required=True)
+    parser.add_argument('--levels', type=int, help='Halvings of the textures prepared.', default=DEFAULT_LEVELS)
+    parser.add_argument('--workers', type=int, help='Textures downscaled in parallel.', default=max(1, (os.cpu_count() or 1) // 2))
+    return parser.parse_known_args(args)
+
+if __name__ == "__main__":
+    args, unknown = parse_arguments(sys.argv[1:])
+    if Image is None:
+        print("!!! - Downscaling the textures needs Pillow (pip install pillow).")
+        sys.exit(1)
+    textures = sorted(set(t for mesh in find_meshes(args.paths) for t in get_textures(mesh)))
+    print(f"Preparing {args.levels} levels of {len(textures)} textures with {args.workers} workers.")
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as pool:
+        futures = { pool.submit(prepare_texture, texture, args.cache, args.levels): texture for texture in textures }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                print(f"Prepared {futures[future]} in {future.result():.1f}s.")
+            except (OSError, ValueError) as e:
+                print(f"!!! - Could not prepare {futures[future]} ({e}).")
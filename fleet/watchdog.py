@@ -0,0 +1,157 @@
+import asyncio
+import os
+import signal
+import subprocess
+
+from typing import Dict, Optional
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+DEFAULT_INTERVAL = 5.0
+DEFAULT_MIN_AVAILABLE = 2048.0 # MB of host memory below which the largest job is killed
+VRAM_MARGIN = 0.03 # of the device memory, below which the largest overrun on the device is killed
+NVIDIA_SMI_QUERY = ["nvidia-smi", "--query-compute-apps=pid,used_memory", "--format=csv,noheader,nounits"]
+
+def read_meminfo(key: str) -> Optional[float]:
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith(key + ':'):
+                    return float(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+def get_total_memory() -> Optional[float]:
+    """Host memory (MB), None when it cannot be queried."""
+    if psutil is not None:
+        return psutil.virtual_memory().total / 2 ** 20
+    return read_meminfo('MemTotal')
+
+def get_available_memory() -> Optional[float]:
+    if psutil is not None:
+        return psutil.virtual_memory().available / 2 ** 20
+    return read_meminfo('MemAvailable')
+
+def get_rss(pid: int) -> Optional[float]:
+    """Resident memory (MB) of the process and its children."""
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            return sum(p.memory_info().rss for p in [process] + process.children(recursive=True)) / 2 ** 20
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return float(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+def get_gpu_memory() -> Dict[int, float]:
+    """Device memory (MB) used by each process, empty when nvidia-smi is not available."""
+    try:
+        output = subprocess.run(NVIDIA_SMI_QUERY, capture_output=True, text=True, timeout=10.0).stdout
+    except (OSError, subprocess.SubprocessError):
+        return {}
+    used = {}
+    for line in output.splitlines():
+        parts = [p.strip() for p in line.split(',')]
+        if len(parts) == 2 and parts[0].isdigit() and parts[1].replace('.', '', 1).isdigit():
+            used[int(parts[0])] = used.get(int(parts[0]), 0.0) + float(parts[1])
+    return used
+
+def kill(pid: int):
+    try:
+        os.kill(pid, getattr(signal, 'SIGKILL', signal.SIGTERM))
+    except OSError: # already gone
+        pass
+
+class Watch(object):
+    def __init__(self, job, device, get_pid):
+        self.job = job
+        self.device = device
+        self.get_pid = get_pid
+        self.rss = None
+        self.vram = None
+        self.reason = None # set when the job was killed
+
+class MemoryWatchdog(object):
+    """
+    Samples the resident and device memory of the running render processes,
+    keeping the peak of each job, and kills the largest job when the host runs out
+    of memory (or a GPU, for the jobs exceeding their reservation) before the
+    kernel or the driver takes down its neighbours.
+    """
+    def __init__(self, interval: float=DEFAULT_INTERVAL, min_available: float=DEFAULT_MIN_AVAILABLE):
+        self.interval = interval
+        self.min_available = min_available
+        self.watches = {}
+        self.task = None
+        if get_available_memory() is None:
+            print("!!! - Could not query the host memory (install psutil), only device memory is watched.")
+
+    def get_budget(self) -> Optional[float]:
+        """Host memory (MB) the render jobs may reserve, None when unknown."""
+        total = get_total_memory()
+        return total - self.min_available if total is not None else None
+
+    def watch(self, job, device, get_pid) -> Watch:
+        job.peak_rss, job.peak_vram = None, None
+        watch = Watch(job, device, get_pid)
+        self.watches[job] = watch
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.__run__())
+        return watch
+
+    def unwatch(self, job) -> Watch:
+        watch = self.watches.pop(job)
+        if not self.watches and self.task is not None:
+            self.task.cancel()
+        return watch
+
+    async def __run__(self):
+        loop = asyncio.get_running_loop()
+        while self.watches:
+            await loop.run_in_executor(None, self.sample)
+            await asyncio.sleep(self.interval)
+
+    def sample(self):
+        gpu_memory = get_gpu_memory()
+        watches = list(self.watches.values()) # (un)watched meanwhile by the event loop
+        for watch in watches:
+            pid = watch.get_pid()
+            if pid is None:
+                watch.rss, watch.vram = None, None
+                continue
+            watch.rss, watch.vram = get_rss(pid), gpu_memory.get(pid)
+            job = watch.job
+            if watch.rss is not None:
+                job.peak_rss = max(job.peak_rss or 0.0, watch.rss)
+            if watch.vram is not None:
+                job.peak_vram = max(job.peak_vram or 0.0, watch.vram)
+        available = get_available_memory()
+        running = [w for w in watches if w.rss is not None and w.reason is None]
+        if available is not None and available < self.min_available and running:
+            self.__kill__(max(running, key=lambda w: w.rss),
+                f"only {available:.0f}MB of host memory left")
+        for device in set(w.device for w in watches if w.device.memory):
+            on_device = [w for w in watches if w.device is device and w.vram is not None and w.reason is None]
+            used = device.external + sum(w.vram for w in on_device)
+            overruns = [w for w in on_device if w.vram > (w.job.memory or 0.0)]
+            if overruns and device.memory - used < device.memory * VRAM_MARGIN:
+                self.__kill__(max(overruns, key=lambda w: w.vram - (w.job.memory or 0.0)),
+                    f"{device} is out of memory")
+
+    def __kill__(self, watch: Watch, reason: str):
+        pid = watch.get_pid()
+        if pid is None:
+            return
+        watch.reason = f"{reason} (job at {watch.rss or 0.0:.0f}MB resident, {watch.vram or 0.0:.0f}MB on device)"
+        print(f"!!! - Killing {watch.job}, {watch.reason}.")
+        kill(pid)
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import sys
+import traceback
+
+from typing import Callable, List, TextIO
+
+JOB_DONE = "##worker:done"
+JOB_FAILED = "##worker:failed"
+STREAM_LIMIT = 2 ** 20 # blender may print long lines
+TERMINATE_GRACE = 120.0 # seconds a stopped blender gets to finish its current frame
+
+async def terminate(process, grace: float=TERMINATE_GRACE):
+    """
+    Asks the process to stop with SIGTERM, the render scripts then exit after
+    their current frame, and kills it if it is still running after the grace period.
+    """
+    if process.returncode is not None:
+        return
+    process.terminate()
+    try:
+        await asyncio.wait_for(process.wait(), grace)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+def serve(handler: Callable[[List[str]], None], stream=None):
+    """
+    Blender side of the persistent worker, reads one json encoded job per line
+    ({"id": ..., "args": [...]}) and reports its completion status on stdout.
+    """
+    stream = stream or sys.stdin
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        job = json.loads(line)
+        try:
+            handler(job['args'])
+        except Exception:
+            traceback.print_exc()
+            print(f"{JOB_FAILED} {job['id']}", flush=True)
+        else:
+            print(f"{JOB_DONE} {job['id']}", flush=True)
+
+class BlenderWorker(object):
+    def __init__(self, blender: str, render_script: str, device_id: int, device_type: str='GPU', threads: int=None):
+        self.blender = blender
+        self.render_script = render_script
+        self.device_id = device_id
+        self.device_type = device_type
+        self.threads = threads
+        self.process = None
+        self.scene = None # of the last job, kept loaded by the worker
+        self.memory = None # MB of device memory the scene keeps
+        self.rss = None # MB of host memory the scene keeps
+        self.jobs = 0
+
+    def get_command(self) -> List[str]:
+        return [
+            self.blender, "--background", "--python", self.render_script, "--",
+            "--worker", "--device_type", self.device_type, "--device_id", str(self.device_id),
+        ] + (["--threads", str(self.threads)] if self.threads else [])
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(*self.get_command(), 
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, 
+            stderr=asyncio.subprocess.STDOUT, limit=STREAM_LIMIT)
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def submit(self, job_args: List[str], log: TextIO) -> int:
+        if not self.is_alive():
+            log.write(" ".join(self.get_command()) + "\n")
+            await self.start()
+        self.jobs += 1
+        job_id = f"{self.device_id}-{self.jobs}"
+        try:
+            self.process.stdin.write((json.dumps({'id': job_id, 'args': job_args}) + "\n").encode())
+            await self.process.stdin.drain()
+            while True:
+                line = (await self.process.stdout.readline()).decode(errors='replace')
+                if not line: # the worker died along with its scene
+                    returncode = await self.process.wait()
+                    log.write(f"Worker @ {self.device_type}:{self.device_id} exited with {returncode}\n")
+                    return returncode or -1
+                if line.startswith(JOB_DONE) and line.split()[-1] == job_id:
+                    return 0
+                if line.startswith(JOB_FAILED) and line.split()[-1] == job_id:
+                    return 1
+                log.write(line)
+        except asyncio.CancelledError: # a half rendered job leaves the worker in an unknown state
+            await self.kill()
+            raise
+
+    async def kill(self):
+        if self.is_alive():
+            await terminate(self.process)
+
+    async def close(self):
+        if self.is_alive():
+            self.process.stdin.close()
+            await self.process.wait()
+        self.process = None
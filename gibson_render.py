@@ -1,17 +1,26 @@
 import os
 import argparse
 import sys
-import subprocess
-import multiprocessing
-import pyexcel
-import itertools
-import glob
+
+from fleet import executor
+from fleet import cost
+from fleet import devices
+from fleet import jobqueue
+from fleet import journal
+from fleet import manifest
+from fleet import meshformat
+from fleet import staging
+from fleet import textures
+from fleet import watchdog
 
 DEFAULT_GV2_PATH = r'PATH_TO_GIBSONV2'
 DEFAULT_BLENDER_PATH = r'PATH_TO_BLENDER_EXE'
 DEFAULT_OUTPUT_PATH = r'PATH_TO_DUMP_RESULTS'
+DEFAULT_LOG_PATH = ".\\logs"
+DEFAULT_TIMINGS_PATH = ".\\timings.json"
+DEFAULT_MANIFEST_PATH = ".\\manifest.json"
 DEFAULT_RENDER_SCRIPT_PATH = ".\\render\\OmniRender.py"
-DEFAULT_RENDERED_TRAJECTORIES_PATH = ".\\fullplus.xlsx"
+DEFAULT_RENDERED_TRAJECTORIES_PATH = ".\\fullplus.jsonl"
 
 def parse_arguments(args):
     usage_text = (
@@ -27,45 +36,72 @@ def parse_arguments(args):
         choices=['gibson_fullplus', 'gibson_full', 'gibson_medium', 'gibson_tiny'],
         default="gibson_fullplus")
     parser.add_argument('--width', type=int, help='Panorama width.',\
-        type=int, default=512)        
+        default=512)        
     parser.add_argument("--blender", type=str, help="Blender executable path.",\
         default=DEFAULT_BLENDER_PATH)
     parser.add_argument("--rendered_path", type=str, help="Output folder.",\
         default=DEFAULT_OUTPUT_PATH)
     parser.add_argument('--render_script', help='The render script path.',\
         default=DEFAULT_RENDER_SCRIPT_PATH)
-    parser.add_argument('--rendered_meshes', type=str, help='The .xlsx file contained already rendered GibsonV2 meshes.',\
+    parser.add_argument('--rendered_meshes', type=str, help='The .jsonl journal of the rendered GibsonV2 meshes (legacy .xlsx sheets are still read).',\
         default=DEFAULT_RENDERED_TRAJECTORIES_PATH)
+    parser.add_argument('--persistent', help='Keep one scene-resident Blender worker per GPU instead of a process per mesh.',\
+        default=False, action='store_true')
+    parser.add_argument('--log_path', type=str, help='Folder where each job\'s Blender output is logged at.',\
+        default=DEFAULT_LOG_PATH)
+    parser.add_argument('--timeout', type=float, help='Seconds after which a job is killed (no limit by default).',\
+        default=None)
+    parser.add_argument('--retries', type=int, help='How many times a failed or timed out job is retried.',\
+        default=2)
+    parser.add_argument('--timings', type=str, help='The .json file with the job timings used to order the jobs longest first.',\
+        default=DEFAULT_TIMINGS_PATH)
+    parser.add_argument('--jobs_per_gpu', type=int, help='Maximum concurrent jobs on a GPU, when their predicted memory fits.',\
+        default=2)
+    parser.add_argument('--cpu_workers', type=int, help='CPU render workers taking jobs when no GPU can (automatic on GPU-less nodes).',\
+        default=0)
+    parser.add_argument('--cpu_threads', type=int, help='Render threads of each CPU worker (shares all cores by default).',\
+        default=None)
+    parser.add_argument('--queue', type=str, help='Shared job queue folder, for several driver instances (or nodes) working together.',\
+        default=None)
+    parser.add_argument('--lease', type=float, help='Seconds after which a claimed job of an unresponsive instance is requeued.',\
+        default=600.0)
+    parser.add_argument('--max_shards', type=int, help='Split jobs that would outlast an even share of the work into at most this many pose shards (defaults to the device count, 1 disables splitting).',\
+        default=None)
+    parser.add_argument('--manifest', type=str, help='The .json manifest caching the dataset folder listings and pose counts between launches.',\
+        default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument('--scene_cache', type=str, help='Folder of the prepared .blend scenes the render scripts open instead of importing the meshes (pre-warmed with fleet/prewarm.py).',\
+        default=None)
+    parser.add_argument('--staging_path', type=str, help='Local scratch folder the scenes are copied to before they are rendered (not staged if not given).',\
+        default=None)
+    parser.add_argument('--staging_size', type=float, help='Size cap of the staged scenes (GB), the least recently used ones are evicted beyond it.',\
+        default=100.0)
+    parser.add_argument('--memory_interval', type=float, help='Seconds between the samples of the resident and device memory of the jobs (0 disables the memory watchdog).',\
+        default=watchdog.DEFAULT_INTERVAL)
+    parser.add_argument('--min_free_memory', type=float, help='Host memory (GB) below which the memory watchdog kills the largest job, to rerun it alone.',\
+        default=watchdog.DEFAULT_MIN_AVAILABLE / 1024.0)
+    parser.add_argument('--binary_meshes', help='Render the binary meshes converted with fleet/meshformat.py instead of the .obj meshes they are up to date with.',\
+        default=False, action='store_true')
+    parser.add_argument('--native_ply', help='Render the .ply meshes, read natively, instead of their .obj conversions (no convert_gibson.py run needed).',\
+        default=False, action='store_true')
+    parser.add_argument('--weld', help='Have the render scripts merge coincident vertices and drop degenerate and duplicate faces when importing the scenes.',\
+        default=False, action='store_true')
+    parser.add_argument('--texture_cache', type=str, help='Local folder of the downscaled textures prepared with fleet/textures.py (full size textures if not given).',\
+        default=None)
+    parser.add_argument('--texture_budget', type=float, help='Memory budget (MB) of the textures of each job, coarser levels are used beyond it.',\
+        default=textures.DEFAULT_BUDGET)
+    parser.add_argument('--lod', type=float, help='Render the level-of-detail meshes built with fleet/lod.py for this depth error bound (fraction of the distance to the nearest pose), where they are up to date.',\
+        default=None)
     return parser.parse_known_args(args)
 
-COMMAND = (
-    "{0} --background --python {1} -- " # use blender's exe and render script's path
-    "--samples {2} --input_file {3} --output_path {4} " # 
-    "--camera_path {5} --device_type {6} --dataset gibsonv2 " 
-    "--width {7} --normal_map --raw --depth --angles 0 " 
-    "--log_sheet {8} --positions center --cameras spherical " # use primary render group flag
-    #"--log_sheet {8} --positions center right left up down --cameras spherical " # use primary render group flag
-    )
-
-def render_mesh(t):
-    command, queue = t
-    gpu_id = queue.get()
-    try:
-        command += "--device_id 2 " #TODO: careful hardcoded GPU
-        print(command)
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=None, shell=True)
-        output = process.communicate()
-        print(output[0])
-    finally:
-        queue.put(gpu_id)
-
-def process(t):
-    command, queue = t
-    gpu_id = queue.get()
-    try:
-        command += "--device_id " + str(gpu_id)
-    finally:
-        queue.put(gpu_id)
+def get_render_arguments(args, mesh, mesh_name, pose_filename):
+    return [
+        "--samples", "256", "--input_file", mesh, "--output_path", os.path.join(args.rendered_path, mesh_name),
+        "--camera_path", os.path.dirname(pose_filename), "--dataset", "gibsonv2",
+        "--width", str(args.width), "--normal_map", "--raw", "--depth", "--angles", "0",
+        "--journal", args.rendered_meshes, "--positions", "center", "--cameras", "spherical",
+        # "--journal", args.rendered_meshes, "--positions", "center", "right", "left", "up", "down", "--cameras", "spherical",
+    ] + (["--scene_cache", args.scene_cache] if args.scene_cache else []) + (["--weld"] if args.weld else []) \
+        + (["--texture_cache", args.texture_cache, "--texture_budget", str(args.texture_budget)] if args.texture_cache else [])
 
 if __name__ == "__main__":
     if 'PROGRAMFILES' in os.environ.keys():
@@ -76,43 +112,39 @@ if __name__ == "__main__":
         )
         if nvidia_smi_path not in os.environ['PATH']:
             os.environ['PATH'] = os.environ['PATH'] + ";" + nvidia_smi_path
-    gpus = 1 # len(nvgpu.available_gpus(max_used_percent=30.0))
     args, unknown = parse_arguments(sys.argv)
     meshes_root = os.path.join(args.gibson, "meshes")
     poses_root = os.path.join(args.gibson, args.split)
     print("Working on GibsonV2 meshes @ %s" % meshes_root)    
-    rendered_meshes = [] 
-    if args.rendered_meshes is not None and os.path.exists(args.rendered_meshes):
-        data = pyexcel.get_sheet(file_name=args.rendered_meshes)
-        if next(data.columns(), None) is not None:
-            rendered_meshes.extend(data.column_at(0))
-    commands = []
+    rendered_meshes = journal.load_completed(args.rendered_meshes)
+    jobs = []
     mesh_poses = {}
-    for mesh in glob.glob(os.path.join(meshes_root, '*.obj')):
+    dataset_manifest = manifest.Manifest(args.manifest)
+    for mesh in [os.path.join(meshes_root, f) for f in dataset_manifest.get_files(meshes_root) if f.endswith('.ply' if args.native_ply else '.obj')]:
         mesh_name = os.path.basename(mesh).split('_')[0]
         pose_filename = os.path.join(poses_root, mesh_name, 'camera_poses.csv')
-        if os.path.exists(pose_filename) and mesh_name not in rendered_meshes:
+        if dataset_manifest.exists(pose_filename) and mesh_name not in rendered_meshes:
             mesh_poses.update({mesh: pose_filename})
-            cmd = COMMAND.format(
-                    args.blender, #1
-                    args.render_script, #2
-                    256, #3
-                    mesh, #4
-                    os.path.join(args.rendered_path, mesh_name), #5
-                    os.path.dirname(pose_filename), #6
-                    'GPU', #7
-                    args.width, #8
-                    args.rendered_meshes, #9,
-                )
-            commands.extend([cmd])
+            input_file = meshformat.find_binary(mesh) if args.binary_meshes else mesh
+            if args.lod is not None:
+                from fleet import lod # only then
+                input_file = lod.find_lod(mesh, pose_filename, args.lod)
+            jobs.append(executor.Job(mesh_name, get_render_arguments(args, input_file, mesh_name, pose_filename)))
         else:
             print(f"Skipping {mesh_name}.")
 
-    pool = multiprocessing.Pool(processes=gpus)
-    m = multiprocessing.Manager()
-    q = m.Queue()
-    for gpu_ids in range(gpus):
-        q.put(gpu_ids)    
-    pool.map(render_mesh, zip(commands, itertools.repeat(q, len(commands))))
-    pool.close()
-    pool.join()
\ No newline at end of file
+    memory_watchdog = watchdog.MemoryWatchdog(args.memory_interval, args.min_free_memory * 1024.0) \
+        if args.memory_interval > 0 else None
+    scheduler = devices.DeviceScheduler(max_used_percent=30.0, jobs_per_gpu=args.jobs_per_gpu,
+        cpu_workers=args.cpu_workers, cpu_threads=args.cpu_threads, affinity=args.persistent,
+        host_memory=memory_watchdog.get_budget() if memory_watchdog is not None else None)
+    cost_model = cost.CostModel(args.timings, dataset_manifest)
+    jobs = cost_model.order(jobs, scheduler.get_concurrency(), 
+        args.max_shards if args.max_shards is not None else scheduler.get_concurrency())
+    dataset_manifest.save()
+    render_executor = executor.Executor(args.blender, args.render_script, scheduler,
+        log_path=args.log_path, timeout=args.timeout, retries=args.retries, persistent=args.persistent,
+        cost_model=cost_model, job_queue=jobqueue.JobQueue(args.queue, args.lease) if args.queue else None,
+        staging=staging.StagingCache(args.staging_path, args.staging_size) if args.staging_path else None,
+        watchdog=memory_watchdog)
+    render_executor.run(jobs)
@@ -5,8 +5,7 @@ from math import radians
 import sys
 import os
 import argparse
-
-import pyexcel
+import time
 
 def get_dataset(dataset):
     if dataset == 'suncg':
@@ -36,9 +35,13 @@ def import_modules(module_path, verbose):
     if verbose:
         print("Adding module path: %s" % module_path)
     sys.path.append(os.path.dirname(module_path))
+    sys.path.append(os.path.dirname(os.path.dirname(module_path))) # for the shared fleet modules
     import deleters
     import utils
     import engine
+    import checkpoint
+    import scenecache
+    import meshloader
     import dataset
     import colour
     import semantics
@@ -46,10 +49,14 @@ def import_modules(module_path, verbose):
     import matterport3d
     import stanford2d3d
     import airsim
+    import cropping
     import imp # force a reload
     imp.reload(deleters)
     imp.reload(utils)
     imp.reload(engine)
+    imp.reload(checkpoint)
+    imp.reload(scenecache)
+    imp.reload(meshloader)
     imp.reload(dataset)
     imp.reload(colour)
     imp.reload(semantics)
@@ -57,6 +64,7 @@ def import_modules(module_path, verbose):
     imp.reload(matterport3d)
     imp.reload(stanford2d3d)
     imp.reload(airsim)
+    imp.reload(cropping)
     
 def print_arguments(args):
     print("Supplied arguments:")
@@ -76,11 +84,12 @@ def parse_arguments(args):
         default='..\\..\\Data\\Matterport3D\\Data\\1pXnuDYAj8r\\1pXnuDYAj8r\\matterport_mesh\\2e84c97e728d46babd3270f4e1a0ae3a\\2e84c97e728d46babd3270f4e1a0ae3a.obj')
     parser.add_argument('--output_path', help='The path where the rendered output will be saved at.',\
         default="..\\..\\Data\\test_renders\\renders\\")
-    parser.add_argument('--camera_path', help='The path where the camera position will be parsed from.',\
-        default="..\\..\\Data\\test_renders\\poses\\test\\1pXnuDYAj8r\\2019-12-24-13-30-23\\airsim_rec_blender.txt")
+    parser.add_argument('--camera_path', help='The path(s) where the camera positions will be parsed from, rendered in sequence.',\
+        default=["..\\..\\Data\\test_renders\\poses\\test\\1pXnuDYAj8r\\2019-12-24-13-30-23\\airsim_rec_blender.txt"], nargs='+')
     parser.add_argument('--samples', help='Number of samples to be used when ray-tracing.', type=int, default=256)
     parser.add_argument('--device_type', help='Compute device type.', default='GPU', choices=['CPU', 'GPU'])
     parser.add_argument('--device_id', help='Compute device ID.', default=1, type=int)
+    parser.add_argument('--threads', help='Render threads when rendering on the CPU.', default=None, type=int)
     parser.add_argument('--width', help='Rendered images width.', default=320, type=int)
     parser.add_argument('--height', help='Rendered images height.', default=180, type=int)
     parser.add_argument('--dataset', help='Which dataset this sample belongs to.', \
@@ -96,38 +105,35 @@ def parse_arguments(args):
     parser.add_argument('--normal_map', help='Render and save normal map.', default=True, action='store_true')    
     parser.add_argument('-f','--flow', help='Render and save optical flow map.', default=True, action='store_true')
     parser.add_argument('-m','--mask', help='Render and save occlusion mask.', default=False, action='store_true')
-    parser.add_argument('--log_sheet', help='The path where processing information will be logged at.',\
-        default="..\\..\\Data\\test_renders\\drone.xlsx")    
+    parser.add_argument('--journal', '--log_sheet', dest='journal', help='The .jsonl journal where processing information will be appended to '
+        '(--log_sheet is a deprecated alias, a legacy .xlsx sheet gets a .jsonl journal beside it).',\
+        default="..\\..\\Data\\test_renders\\drone.jsonl")    
+    parser.add_argument('--shard', help='Render only the poses of shard i out of N, given as i/N (poses are dealt round robin).', default=None)
+    parser.add_argument('--pose_range', help='Render only the poses with an index within [START, END).', default=None, nargs=2, type=int)
+    parser.add_argument('--weld', help='Merge coincident vertices and drop degenerate and duplicate faces when importing the scene.', default=False, action='store_true')
+    parser.add_argument('--scene_cache', help='Folder of the prepared .blend scenes, opened instead of importing and preparing the scene again.', default=None)
+    parser.add_argument('--texture_cache', help='Folder of the downscaled textures (prepared with fleet/textures.py), a level picked for the output resolution.', default=None)
+    parser.add_argument('--texture_budget', help='Memory budget (MB) of the scene textures, coarser levels picked beyond it.', default=2048.0, type=float)
+    parser.add_argument('--crop', help='Delete the faces out of reach of the camera frustum (--far_dist deep) from every position of the trajectories before rendering.', default=False, action='store_true')
+    parser.add_argument('--worker', help='Keep the scene loaded and render the jobs streamed through stdin.', default=False, action='store_true')
     return parser.parse_known_args(args)
     
-if __name__ == "__main__":
-    arguments_vector, module_path, in_blender = init_script()    
-    args, unknown = parse_arguments(arguments_vector)
-    if args.verbose:
-        print_arguments(args)
-    import_modules(module_path, args.verbose)
-    import deleters
-    import utils
-    import engine
-    import dataset
-    import colour
-    import semantics
-    import suncg
-    import matterport3d
-    import stanford2d3d
-    import airsim
-    
+def load_scene(args):
     deleters.delete_all()
     deleters.delete_materials()
 
     dataset = get_dataset(args.dataset)
-    dataset.import_model(args.scene_model)        
+    texture_variants = textures.get_variants(args.scene_model, args.texture_cache, max(args.width, args.height), args.texture_budget) \
+        if args.texture_cache else None
+    scenecache.load(dataset, args.scene_model, args.scene_cache, get_preparations(args), texture_variants)
+    if args.crop: # after the cache, which holds the whole scene
+        cropping.crop_to_trajectories(args.camera_path, (args.far_dist, args.ego_fov_h, args.width, args.height))
     base_filename = dataset.get_instance_name(args.scene_model)
     
     render_engine = engine.Cycles28(
         args.device_type, args.device_id, args.samples, 
         args.depth, args.normals or args.normal_map, 
-        False, args.raw, args.flow)
+        False, args.raw, args.flow, threads=args.threads)
     nodes, links, compositor = render_engine.get_scene_nodes()
 
     output_nodes = []
@@ -156,16 +162,33 @@ if __name__ == "__main__":
         flow_map_out = dataset.get_flow_map_output(args.output_path, base_filename, \
             nodes, links, compositor)
         output_nodes.append(engine.OutputNode(flow_map_out, base_filename, 'flow_map'))
+    return dataset, render_engine, output_nodes
+
+def render_trajectory(args, camera_path, dataset, render_engine, output_nodes, in_blender):
+    camera_positions = airsim.load_camera_tuples(camera_path)
     
-    if in_blender:
-        print("Running from inside blender ...")
-    
-    camera_positions = airsim.load_camera_tuples(args.camera_path)
-    
-    trajectory_date = os.path.basename(os.path.dirname(args.camera_path))
+    trajectory_date = os.path.basename(os.path.dirname(camera_path))
+    job_name = journal.get_shard_name(trajectory_date, args.shard, args.pose_range)
+    scene_name = dataset.get_instance_name(args.scene_model)
+    if args.journal and job_name in journal.load_completed(args.journal): # e.g. a rerun of a batch of dates
+        print("Skipping %s, already rendered." % job_name)
+        return
+    started = time.time()
+    if args.journal:
+        journal.Journal(args.journal).append(job_name, 'started', scene=scene_name)
+    progress = checkpoint.Checkpoint(checkpoint.get_checkpoint_path(args.output_path, job_name))
+    if progress.completed:
+        print("Resuming %s, %d poses already rendered." % (job_name, len(progress.completed)))
+    def on_stop():
+        if args.journal:
+            journal.Journal(args.journal).append(job_name, 'interrupted', scene=scene_name, 
+                duration=time.time() - started, poses=len(progress.completed))
 
     camera_pos_index = 0
     for ego_pos_rot_t, ego_pos_rot_tp1, exo_pos_rot in camera_positions:        
+        if camera_pos_index in progress or not checkpoint.is_assigned(camera_pos_index, args.shard, args.pose_range):
+            camera_pos_index += 1
+            continue
         camera = render_engine.get_camera('perspective', args.width, args.height)
         camera.data.stereo.convergence_distance = args.far_dist
         camera.data.clip_start = 0.1
@@ -192,18 +215,85 @@ if __name__ == "__main__":
         bpy.context.scene.camera = camera
         
         for fid in range(2):
+            checkpoint.stop.check(on_stop)
             for node in output_nodes:                
                 node.prepare_render("egocentric", fid, trajectory_date, camera_pos_index)
             bpy.context.scene.frame_set(fid)
             bpy.ops.render.render(write_still=True)
+        progress.add(camera_pos_index)
         camera_pos_index += 1
 
         if in_blender and camera_pos_index >= 3:
             break
 
-    if args.log_sheet:
-        print("Updating %s" % args.log_sheet)
-        data = pyexcel.get_sheet(file_name=args.log_sheet)
-        count = len(data.to_array())
-        data[count, 0] = trajectory_date
-        data.save_as(args.log_sheet)
+    if args.journal:
+        print("Updating %s" % args.journal)
+        journal.Journal(args.journal).append(job_name, 'done', scene=scene_name, 
+            duration=time.time() - started, poses=len(progress.completed), outputs=2 * len(progress.completed) * len(output_nodes))
+    progress.clear()
+
+def get_preparations(args):
+    """The scene preparations of the passes, cached along with the scene."""
+    return (['emission'] if args.raw else []) + (['normals'] if args.normals and not args.color else []) \
+        + (['geometry'] if not (args.color or args.raw or args.normals) else []) \
+        + (['weld'] if args.weld else [])
+
+def get_scene_key(args):
+    return (args.scene_model, args.dataset, args.samples, args.width, args.height, 
+        args.color, args.raw, args.depth, args.normals, args.normal_map, args.flow, args.weld, args.texture_cache, args.texture_budget,
+        tuple(args.camera_path) + (args.far_dist, args.ego_fov_h) if args.crop else None) # a cropped scene only serves its trajectories
+
+def run_worker(arguments_vector):
+    scene = { 'key': None }
+    def render_job(job_vector):
+        job_args, _ = parse_arguments(arguments_vector + job_vector)
+        key = get_scene_key(job_args)
+        if key != scene['key']:
+            print("Loading scene %s" % job_args.scene_model)
+            scene['key'] = None # invalidated until fully loaded
+            scene['contents'] = load_scene(job_args)
+            scene['key'], scene['output_path'] = key, job_args.output_path
+        dataset, render_engine, output_nodes = scene['contents']
+        if job_args.output_path != scene['output_path']:
+            for node in output_nodes:
+                node.rebase(scene['output_path'], job_args.output_path)
+            scene['output_path'] = job_args.output_path
+        with checkpoint.stop.rendering():
+            for camera_path in job_args.camera_path:
+                render_trajectory(job_args, camera_path, dataset, render_engine, output_nodes, False)
+    worker.serve(render_job)
+
+if __name__ == "__main__":
+    arguments_vector, module_path, in_blender = init_script()    
+    args, unknown = parse_arguments(arguments_vector)
+    if args.verbose:
+        print_arguments(args)
+    import_modules(module_path, args.verbose)
+    import deleters
+    import utils
+    import engine
+    import checkpoint
+    import scenecache
+    import dataset
+    import colour
+    import semantics
+    import suncg
+    import matterport3d
+    import stanford2d3d
+    import airsim
+    import cropping
+    from fleet import worker
+    from fleet import journal
+    from fleet import textures
+
+    if not in_blender:
+        checkpoint.stop.install()
+    if args.worker:
+        run_worker(arguments_vector)
+    else:
+        dataset, render_engine, output_nodes = load_scene(args)
+        if in_blender:
+            print("Running from inside blender ...")
+        with checkpoint.stop.rendering():
+            for camera_path in args.camera_path:
+                render_trajectory(args, camera_path, dataset, render_engine, output_nodes, in_blender)
@@ -5,8 +5,7 @@ from math import radians
 import sys
 import os
 import argparse
-
-import pyexcel
+import time
 
 def get_dataset(dataset):
     if dataset == 'suncg':
@@ -38,9 +37,13 @@ def import_modules(module_path, verbose):
     if verbose:
         print("Adding module path: %s" % module_path)
     sys.path.append(os.path.dirname(module_path))
+    sys.path.append(os.path.dirname(os.path.dirname(module_path))) # for the shared fleet modules
     import deleters
     import utils
     import engine
+    import checkpoint
+    import scenecache
+    import meshloader
     import dataset
     import colour
     import semantics
@@ -52,6 +55,9 @@ def import_modules(module_path, verbose):
     imp.reload(deleters)
     imp.reload(utils)
     imp.reload(engine)
+    imp.reload(checkpoint)
+    imp.reload(scenecache)
+    imp.reload(meshloader)
     imp.reload(dataset)
     imp.reload(colour)
     imp.reload(semantics)
@@ -91,6 +97,7 @@ def parse_arguments(args):
     parser.add_argument('--emission', help='Light emission value.', type=float, default=250.0)
     parser.add_argument('--device_type', help='Compute device.', default='GPU', choices=['CPU', 'GPU'])
     parser.add_argument('--device_id', help='Compute device ID.', default=2)
+    parser.add_argument('--threads', help='Render threads when rendering on the CPU.', default=None, type=int)
     parser.add_argument('--width', help='Rendered images width.', default=512, type=int)
     parser.add_argument('--dataset', help='Which dataset this sample belongs to.', \
         default='gibsonv2', \
@@ -112,39 +119,33 @@ def parse_arguments(args):
         default=[], nargs='*', type=int) # called like: --angles 0 90 180 270
     parser.add_argument('--cameras', help='Camera types that will be used to render content.', \
         default=[], nargs='*', choices=['spherical', 'perspective']) # called like --cameras spherical perspective
-    parser.add_argument('--log_sheet', help='The path where processing information will be logged at.',\
-        default="..\\..\\Data\\test_renders\\test.xlsx")
+    parser.add_argument('--journal', '--log_sheet', dest='journal', help='The .jsonl journal where processing information will be appended to '
+        '(--log_sheet is a deprecated alias, a legacy .xlsx sheet gets a .jsonl journal beside it).',\
+        default="..\\..\\Data\\test_renders\\test.jsonl")
     parser.add_argument('--suncg_lights', help='The path that the SunCG light metadata json file is located at.',\
         default="..\\..\\Data\\SunCG\\code\\suncgModelLights.json")
+    parser.add_argument('--shard', help='Render only the poses of shard i out of N, given as i/N (poses are dealt round robin).', default=None)
+    parser.add_argument('--pose_range', help='Render only the poses with an index within [START, END).', default=None, nargs=2, type=int)
+    parser.add_argument('--weld', help='Merge coincident vertices and drop degenerate and duplicate faces when importing the scene.', default=False, action='store_true')
+    parser.add_argument('--scene_cache', help='Folder of the prepared .blend scenes, opened instead of importing and preparing the scene again.', default=None)
+    parser.add_argument('--texture_cache', help='Folder of the downscaled textures (prepared with fleet/textures.py), a level picked for the output resolution.', default=None)
+    parser.add_argument('--texture_budget', help='Memory budget (MB) of the scene textures, coarser levels picked beyond it.', default=2048.0, type=float)
+    parser.add_argument('--worker', help='Keep the scene loaded and render the jobs streamed through stdin.', default=False, action='store_true')
     return parser.parse_known_args(args)
     
-if __name__ == "__main__":
-    arguments_vector, module_path, in_blender = init_script()    
-    args, unknown = parse_arguments(arguments_vector)
-    if args.verbose:
-        print_arguments(args)
-    import_modules(module_path, args.verbose)
-    import deleters
-    import utils
-    import engine
-    import dataset
-    import colour
-    import semantics
-    import suncg
-    import matterport3d
-    import stanford2d3d
-    import gibsonv2
-    
+def load_scene(args):
     deleters.delete_all()
     deleters.delete_materials()
 
     dataset = get_dataset(args.dataset)
-    dataset.import_model(args.input_file)        
+    texture_variants = textures.get_variants(args.input_file, args.texture_cache, args.width, args.texture_budget) \
+        if args.texture_cache else None
+    scenecache.load(dataset, args.input_file, args.scene_cache, get_preparations(args), texture_variants)
     base_filename = dataset.get_instance_name(args.input_file)    
 
     render_engine = engine.Cycles28(args.device_type, args.device_id, 
         args.samples, args.depth, args.normals or args.normal_map,
-        args.labels or args.pretty_labels, args.raw, False,
+        args.labels or args.pretty_labels, args.raw, False, threads=args.threads,
     )
     nodes, links, compositor = render_engine.get_scene_nodes()
 
@@ -182,18 +183,32 @@ if __name__ == "__main__":
         pretty_semantic_map_out = dataset.get_pretty_semantic_map_output(args.labels_path, \
             args.output_path, base_filename, nodes, links, compositor)
         output_nodes.append(engine.OutputNode(pretty_semantic_map_out, base_filename, 'pretty_semantic_map'))
-    
-    if in_blender:
-        print("Running from inside blender ...")
-        args.cameras = ['spherical']        
-        args.angles = [0]
-        args.positions = ['center']
-    
+    return dataset, render_engine, output_nodes, base_filename
+
+def render_positions(args, dataset, render_engine, output_nodes, base_filename, in_blender):
     camera_positions = dataset.get_camera_position_generator(args.camera_path)\
         if os.path.isdir(args.camera_path) else [dataset.get_camera_position(args.camera_path)]
     
-    camera_pos_index = 0
+    job_name = journal.get_shard_name(base_filename, args.shard, args.pose_range)
+    if args.journal and job_name in journal.load_completed(args.journal): # e.g. a rerun of the job
+        print("Skipping %s, already rendered." % job_name)
+        return
+    started = time.time()
+    if args.journal:
+        journal.Journal(args.journal).append(job_name, 'started', scene=base_filename)
+    progress = checkpoint.Checkpoint(checkpoint.get_checkpoint_path(args.output_path, job_name))
+    if progress.completed:
+        print("Resuming %s, %d positions already rendered." % (job_name, len(progress.completed)))
+    def on_stop():
+        if args.journal:
+            journal.Journal(args.journal).append(job_name, 'interrupted', scene=base_filename, 
+                duration=time.time() - started, poses=len(progress.completed))
+
+    camera_pos_index, renders = 0, 0
     for camera_center_pos in camera_positions:
+        if camera_pos_index in progress or not checkpoint.is_assigned(camera_pos_index, args.shard, args.pose_range):
+            camera_pos_index += 1
+            continue
         for camera_type in args.cameras:
             dataset.set_render_settings()
             camera = render_engine.get_camera(camera_type, args.width, args.width // 2)
@@ -205,19 +220,86 @@ if __name__ == "__main__":
 
             for angle in args.angles:
                 for position in args.positions:
+                    checkpoint.stop.check(on_stop)
                     print("Rendering with {0} camera in {1} position at {2} angle.".format(camera_type, position, angle))
                     for node in output_nodes:
                         node.prepare_render(position, angle, camera_type, camera_pos_index)
                     camera.rotation_euler = dataset.get_camera_rotation(angle)
                     camera.location = camera_center_pos + dataset.get_camera_offset(position, args.eye_dist, angle)
                     bpy.ops.render.render(write_still=True)
+                    renders += 1
+        progress.add(camera_pos_index)
         camera_pos_index += 1        
         if in_blender and camera_pos_index >= 2:
             break
 
-    if args.log_sheet:
-        print("Updating %s" % args.log_sheet)
-        data = pyexcel.get_sheet(file_name=args.log_sheet)
-        count = len(data.to_array())
-        data[count, 0] = base_filename
-        data.save_as(args.log_sheet)
+    if args.journal:
+        print("Updating %s" % args.journal)
+        journal.Journal(args.journal).append(job_name, 'done', scene=base_filename, 
+            duration=time.time() - started, poses=len(progress.completed), outputs=renders * len(output_nodes))
+    progress.clear()
+
+def get_preparations(args):
+    """The scene preparations of the passes, cached along with the scene."""
+    return (['emission'] if args.raw else []) + (['normals'] if args.normals and not args.color else []) \
+        + (['geometry'] if not (args.color or args.raw or args.normals) else []) \
+        + (['weld'] if args.weld else [])
+
+def get_scene_key(args):
+    return (args.input_file, args.dataset, args.samples, args.width, args.labels_path, args.color, 
+        args.raw, args.depth, args.normals, args.normal_map, args.labels, args.pretty_labels, args.weld, args.texture_cache, args.texture_budget)
+
+def run_worker(arguments_vector):
+    scene = { 'key': None }
+    def render_job(job_vector):
+        job_args, _ = parse_arguments(arguments_vector + job_vector)
+        key = get_scene_key(job_args)
+        if key != scene['key']:
+            print("Loading scene %s" % job_args.input_file)
+            scene['key'] = None # invalidated until fully loaded
+            scene['contents'] = load_scene(job_args)
+            scene['key'], scene['output_path'] = key, job_args.output_path
+        dataset, render_engine, output_nodes, base_filename = scene['contents']
+        if job_args.output_path != scene['output_path']:
+            for node in output_nodes:
+                node.rebase(scene['output_path'], job_args.output_path)
+            scene['output_path'] = job_args.output_path
+        with checkpoint.stop.rendering():
+            render_positions(job_args, dataset, render_engine, output_nodes, base_filename, False)
+    worker.serve(render_job)
+
+if __name__ == "__main__":
+    arguments_vector, module_path, in_blender = init_script()    
+    args, unknown = parse_arguments(arguments_vector)
+    if args.verbose:
+        print_arguments(args)
+    import_modules(module_path, args.verbose)
+    import deleters
+    import utils
+    import engine
+    import checkpoint
+    import scenecache
+    import dataset
+    import colour
+    import semantics
+    import suncg
+    import matterport3d
+    import stanford2d3d
+    import gibsonv2
+    from fleet import worker
+    from fleet import journal
+    from fleet import textures
+
+    if not in_blender:
+        checkpoint.stop.install()
+    if args.worker:
+        run_worker(arguments_vector)
+    else:
+        dataset, render_engine, output_nodes, base_filename = load_scene(args)
+        if in_blender:
+            print("Running from inside blender ...")
+            args.cameras = ['spherical']        
+            args.angles = [0]
+            args.positions = ['center']
+        with checkpoint.stop.rendering():
+            render_positions(args, dataset, render_engine, output_nodes, base_filename, in_blender)
@@ -5,8 +5,7 @@ from math import radians
 import sys
 import os
 import argparse
-
-import pyexcel
+import time
 
 def get_dataset(dataset):
     if dataset == 'suncg':
@@ -43,10 +42,14 @@ def import_modules(module_path, verbose):
     if verbose:
         print("Adding module path: %s" % module_path)
     sys.path.append(os.path.dirname(module_path))
+    sys.path.append(os.path.dirname(os.path.dirname(module_path))) # for the shared fleet modules
     import deleters
     import enablers
     import utils
     import engine
+    import checkpoint
+    import scenecache
+    import meshloader
     import dataset
     import colour
     import semantics
@@ -54,12 +57,16 @@ def import_modules(module_path, verbose):
     import matterport3d
     import stanford2d3d
     import airsim
+    import cropping
     import dji
     import imp # force a reload
     imp.reload(deleters)
     imp.reload(enablers)
     imp.reload(utils)
     imp.reload(engine)
+    imp.reload(checkpoint)
+    imp.reload(scenecache)
+    imp.reload(meshloader)
     imp.reload(dataset)
     imp.reload(colour)
     imp.reload(semantics)
@@ -67,6 +74,7 @@ def import_modules(module_path, verbose):
     imp.reload(matterport3d)
     imp.reload(stanford2d3d)
     imp.reload(airsim)
+    imp.reload(cropping)
     imp.reload(dji)
     
 def print_arguments(args):
@@ -89,11 +97,12 @@ def parse_arguments(args):
         default='..\\..\\Data\\test_renders\\drone\\DJI_real_.fbx')        
     parser.add_argument('--output_path', help='The path where the rendered output will be saved at.',\
         default="..\\..\\Data\\test_renders\\")
-    parser.add_argument('--camera_path', help='The path where the camera position will be parsed from.',\
-        default="..\..\\Data\\test_renders\\poses\\test\\1pXnuDYAj8r\\2019-12-24-13-30-23\\airsim_rec_blender.txt")
+    parser.add_argument('--camera_path', help='The path(s) where the camera positions will be parsed from, rendered in sequence.',\
+        default=["..\..\\Data\\test_renders\\poses\\test\\1pXnuDYAj8r\\2019-12-24-13-30-23\\airsim_rec_blender.txt"], nargs='+')
     parser.add_argument('--samples', help='Number of samples to be used when ray-tracing.', type=int, default=256)
     parser.add_argument('--device_type', help='Compute device type.', default='GPU', choices=['CPU', 'GPU'])
     parser.add_argument('--device_id', help='Compute device ID.', default=1, type=int)
+    parser.add_argument('--threads', help='Render threads when rendering on the CPU.', default=None, type=int)
     parser.add_argument('--width', help='Rendered images width.', default=320, type=int)
     parser.add_argument('--height', help='Rendered images height.', default=240, type=int)
     parser.add_argument('--drone', help='Which drone model to use.', \
@@ -102,6 +111,7 @@ def parse_arguments(args):
         default='matterport3d', choices=['matterport3d', 'stanford2d3d', 'gibson'])
     parser.add_argument('--exo_fov_h', help='Exocentric camera horizontal field-of-view (in degrees).', default=64.69, type=float)
     parser.add_argument('--far_dist', help='Convergence (far plane) distance.', default=8.0, type=float)
+    parser.add_argument('--exo_clip_end', help='Exocentric camera far clipping distance.', default=100.0, type=float)
     primary_render_group = parser.add_mutually_exclusive_group()
     primary_render_group.add_argument('-c','--color', help='Render and save color image.', default=False, action='store_true')
     primary_render_group.add_argument('-r','--raw', help='Render and save emission image.', default=True, action='store_true')
@@ -112,37 +122,41 @@ def parse_arguments(args):
     parser.add_argument('-m','--mask', help='Render and save occlusion mask.', default=True, action='store_true')
     parser.add_argument('-s','--silhouette', help='Render and save drone silhouette mask.', default=True, action='store_true')
     parser.add_argument('--combined', help='Render and save a combined image using the original scene color and the relit drone composited on it.', default=True, action='store_true')
-    parser.add_argument('--log_sheet', help='The path where processing information will be logged at.',\
-        default="..\\..\\Data\\test_renders\\pilot.xlsx")    
+    parser.add_argument('--journal', '--log_sheet', dest='journal', help='The .jsonl journal where processing information will be appended to '
+        '(--log_sheet is a deprecated alias, a legacy .xlsx sheet gets a .jsonl journal beside it).',\
+        default="..\\..\\Data\\test_renders\\pilot.jsonl")    
+    parser.add_argument('-e','--egocentric', help='Also render the drone\'s egocentric view of each tuple within the same session.', default=False, action='store_true')
+    parser.add_argument('--ego_output_path', help='The path where the rendered egocentric output will be saved at.',\
+        default="..\\..\\Data\\test_renders\\renders\\")
+    parser.add_argument('--ego_width', help='Rendered egocentric images width.', default=320, type=int)
+    parser.add_argument('--ego_height', help='Rendered egocentric images height.', default=180, type=int)
+    parser.add_argument('--ego_fov_h', help='Egocentric camera horizontal field-of-view (in degrees).', default=85.0, type=float)
+    parser.add_argument('--ego_journal', '--ego_log_sheet', dest='ego_journal', help='The .jsonl journal where egocentric processing information will be appended to '
+        '(--ego_log_sheet is a deprecated alias).',\
+        default="..\\..\\Data\\test_renders\\drone.jsonl")
+    parser.add_argument('--shard', help='Render only the poses of shard i out of N, given as i/N (poses are dealt round robin).', default=None)
+    parser.add_argument('--pose_range', help='Render only the poses with an index within [START, END).', default=None, nargs=2, type=int)
+    parser.add_argument('--weld', help='Merge coincident vertices and drop degenerate and duplicate faces when importing the scene.', default=False, action='store_true')
+    parser.add_argument('--scene_cache', help='Folder of the prepared .blend scenes, opened instead of importing and preparing the scene again.', default=None)
+    parser.add_argument('--texture_cache', help='Folder of the downscaled textures (prepared with fleet/textures.py), a level picked for the output resolution.', default=None)
+    parser.add_argument('--texture_budget', help='Memory budget (MB) of the scene textures, coarser levels picked beyond it.', default=2048.0, type=float)
+    parser.add_argument('--crop', help='Delete the faces out of reach of the camera frustums (--far_dist deep, --exo_clip_end for the exocentric camera) from every position of the trajectories before rendering. '
+        'With the default --exo_clip_end of 100m the exocentric frustum spans most scenes and little is cropped, lower it to crop.', default=False, action='store_true')
+    parser.add_argument('--worker', help='Keep the scene loaded and render the jobs streamed through stdin.', default=False, action='store_true')
     return parser.parse_known_args(args)
     
-if __name__ == "__main__":
-    arguments_vector, module_path, in_blender = init_script()    
-    args, unknown = parse_arguments(arguments_vector)
-    if args.verbose:
-        print_arguments(args)
-    import_modules(module_path, args.verbose)
-    import deleters
-    import enablers
-    import utils
-    import engine
-    import dataset
-    import colour
-    import semantics
-    import suncg
-    import matterport3d
-    import stanford2d3d
-    import airsim
-    import dji
-    
+def load_scene(args):
     deleters.delete_all()
     deleters.delete_materials()
 
     dataset = get_dataset(args.dataset)
-    dataset.import_model(args.scene_model)
+    texture_variants = textures.get_variants(args.scene_model, args.texture_cache, max(args.width, args.height, args.ego_width, args.ego_height), args.texture_budget) \
+        if args.texture_cache else None
+    scenecache.load(dataset, args.scene_model, args.scene_cache, get_preparations(args), texture_variants)
+    if args.crop: # after the cache, which holds the whole scene
+        ego_camera = (args.far_dist, args.ego_fov_h, args.ego_width, args.ego_height)
+        cropping.crop_to_trajectories(args.camera_path, (ego_camera, ego_camera, (args.exo_clip_end, args.exo_fov_h, args.width, args.height))) # ego t, t+1, exo
     base_filename = dataset.get_instance_name(args.scene_model)
-    
-    enablers.merge_all()
 
     drone = get_drone(args.drone)
     drone_model = drone.import_model(args.drone_model)
@@ -150,7 +164,7 @@ if __name__ == "__main__":
     render_engine = engine.Cycles28(
         args.device_type, args.device_id, args.samples,
         args.depth, args.normals or args.normal_map,
-        False, args.raw, args.flow, args.silhouette or args.mask
+        False, args.raw, args.flow, args.silhouette or args.mask, threads=args.threads
     )
     nodes, links, compositor = render_engine.get_scene_nodes()
 
@@ -192,25 +206,120 @@ if __name__ == "__main__":
             nodes, links, compositor)
         output_nodes.append(engine.OutputNode(combined_out, base_filename, 'combined'))
 
-    if in_blender:
-        print("Running from inside blender ...")
-    
-    camera_positions = airsim.load_camera_tuples(args.camera_path)
+    ego_output_nodes = []
+    if args.egocentric: # same passes as DroneRender.py, written next to the egocentric renders
+        if args.depth:
+            depth_out = dataset.get_depth_output(args.ego_output_path, base_filename, \
+                nodes, links, compositor)
+            ego_output_nodes.append(engine.OutputNode(depth_out, base_filename, 'depth'))
+        if args.raw:
+            emission_out = dataset.get_emission_output(args.ego_output_path, base_filename, \
+                nodes, links, compositor)
+            ego_output_nodes.append(engine.OutputNode(emission_out, base_filename, 'emission'))
+        if args.normal_map:
+            normal_map_out = dataset.get_normal_map_output(args.ego_output_path, base_filename, \
+                nodes, links, compositor)
+            ego_output_nodes.append(engine.OutputNode(normal_map_out, base_filename, 'normal_map'))
+        if args.flow:
+            flow_map_out = dataset.get_flow_map_output(args.ego_output_path, base_filename, \
+                nodes, links, compositor)
+            ego_output_nodes.append(engine.OutputNode(flow_map_out, base_filename, 'flow_map'))
+        for node in ego_output_nodes:
+            node.enable(False)
+    return dataset, drone, drone_model, render_engine, output_nodes, ego_output_nodes
+
+def render_egocentric(args, ego_pos_rot_t, ego_pos_rot_tp1, drone, render_engine, 
+    output_nodes, ego_output_nodes, trajectory_date, camera_pos_index, on_stop=None
+):
+    camera = render_engine.get_camera('perspective', args.ego_width, args.ego_height, name='Egocentric')
+    camera.data.stereo.convergence_distance = args.far_dist
+    camera.data.clip_start = 0.1
+    camera.data.clip_end = args.far_dist
+    camera.data.lens_unit = 'FOV'
+    camera.data.angle = radians(args.ego_fov_h)
+    camera.rotation_mode = 'QUATERNION'
+
+    bpy.context.scene.frame_set(0)
+    camera.location = ego_pos_rot_t[0]
+    camera.rotation_quaternion = ego_pos_rot_t[1]
+    camera.keyframe_insert('location',group="LocRot")
+    camera.keyframe_insert('rotation_quaternion',group="LocRot")
+
+    bpy.context.scene.frame_set(1)
+    camera.location = ego_pos_rot_tp1[0]
+    camera.rotation_quaternion = ego_pos_rot_tp1[1]
+    camera.keyframe_insert('location',group="LocRot")
+    camera.keyframe_insert('rotation_quaternion',group="LocRot")
+
+    bpy.context.scene.camera = camera
+    bpy.context.scene.render.resolution_x = args.ego_width
+    bpy.context.scene.render.resolution_y = args.ego_height
+    drone.hide()
+    for node in output_nodes:
+        node.enable(False)
+    for node in ego_output_nodes:
+        node.enable(True)
+
+    for fid in range(2):
+        checkpoint.stop.check(on_stop)
+        for node in ego_output_nodes:
+            node.prepare_render("egocentric", fid, trajectory_date, camera_pos_index)
+        bpy.context.scene.frame_set(fid)
+        bpy.ops.render.render(write_still=True)
 
-    trajectory_date = os.path.basename(os.path.dirname(args.camera_path))    
+    for node in ego_output_nodes:
+        node.enable(False)
+    for node in output_nodes:
+        node.enable(True)
+    drone.show()
+    bpy.context.scene.render.resolution_x = args.width
+    bpy.context.scene.render.resolution_y = args.height
+
+def render_trajectory(args, camera_path, dataset, drone, drone_model, render_engine, output_nodes, ego_output_nodes, in_blender):
+    camera_positions = airsim.load_camera_tuples(camera_path)
+
+    trajectory_date = os.path.basename(os.path.dirname(camera_path))    
+    job_name = journal.get_shard_name(trajectory_date, args.shard, args.pose_range)
+    scene_name = dataset.get_instance_name(args.scene_model)
+    completed = [journal.load_completed(path) for path in [args.journal, args.ego_journal if args.egocentric else None] if path]
+    if completed and all(job_name in c for c in completed): # e.g. a rerun of a batch of dates
+        print("Skipping %s, already rendered." % job_name)
+        return
+    started = time.time()
+    if args.journal:
+        journal.Journal(args.journal).append(job_name, 'started', scene=scene_name)
+    if args.egocentric and args.ego_journal:
+        journal.Journal(args.ego_journal).append(job_name, 'started', scene=scene_name)
+    progress = checkpoint.Checkpoint(checkpoint.get_checkpoint_path(args.output_path, 
+        job_name + ("_ego" if args.egocentric else "")))
+    if progress.completed:
+        print("Resuming %s, %d poses already rendered." % (job_name, len(progress.completed)))
+    def on_stop():
+        for journal_path in [args.journal, args.ego_journal if args.egocentric else None]:
+            if journal_path:
+                journal.Journal(journal_path).append(job_name, 'interrupted', scene=scene_name, 
+                    duration=time.time() - started, poses=len(progress.completed))
 
     drone_model.rotation_mode = 'QUATERNION'
 
     camera_pos_index = 0
     for ego_pos_rot_t, ego_pos_rot_tp1, exo_pos_rot in camera_positions:        
+        if camera_pos_index in progress or not checkpoint.is_assigned(camera_pos_index, args.shard, args.pose_range):
+            camera_pos_index += 1
+            continue
         camera = render_engine.get_camera('perspective', args.width, args.height)
         camera.data.stereo.convergence_distance = args.far_dist
         camera.data.lens_unit = 'FOV'
         camera.data.angle = radians(args.exo_fov_h)
+        camera.data.clip_end = args.exo_clip_end
         camera.rotation_mode = 'QUATERNION'
 
         drone.set_random_lighting()
 
+        if args.egocentric:
+            render_egocentric(args, ego_pos_rot_t, ego_pos_rot_tp1, drone, render_engine, 
+                output_nodes, ego_output_nodes, trajectory_date, camera_pos_index, on_stop)
+
         bpy.context.scene.frame_set(0)
         camera.location = exo_pos_rot[0]
         camera.rotation_quaternion = exo_pos_rot[1]
@@ -228,6 +337,7 @@ if __name__ == "__main__":
         bpy.context.scene.camera = camera
         
         for fid in range(2):
+            checkpoint.stop.check(on_stop)
             for node in output_nodes:                
                 node.prepare_render("exocentric", fid, trajectory_date, camera_pos_index)
             bpy.context.scene.frame_set(fid)
@@ -238,6 +348,7 @@ if __name__ == "__main__":
             drone.show()
 
             for fid in range(2):
+                checkpoint.stop.check(on_stop)
                 for node in output_nodes:                
                     node.prepare_render("drone", fid, trajectory_date, camera_pos_index)
                 bpy.context.scene.frame_set(fid)
@@ -245,14 +356,88 @@ if __name__ == "__main__":
                 
             enablers.show_all()
 
+        progress.add(camera_pos_index)
         camera_pos_index += 1
 
         if in_blender and camera_pos_index >= 2:
             break
 
-    if args.log_sheet:
-        print("Updating %s" % args.log_sheet)
-        data = pyexcel.get_sheet(file_name=args.log_sheet)
-        count = len(data.to_array())
-        data[count, 0] = trajectory_date
-        data.save_as(args.log_sheet)
+    duration, poses = time.time() - started, len(progress.completed)
+    if args.journal:
+        print("Updating %s" % args.journal)
+        journal.Journal(args.journal).append(job_name, 'done', scene=scene_name, duration=duration, 
+            poses=poses, outputs=2 * (1 + int(args.mask)) * poses * len(output_nodes))
+    if args.egocentric and args.ego_journal:
+        print("Updating %s" % args.ego_journal)
+        journal.Journal(args.ego_journal).append(job_name, 'done', scene=scene_name, duration=duration, 
+            poses=poses, outputs=2 * poses * len(ego_output_nodes))
+    progress.clear()
+
+def get_preparations(args):
+    """The scene preparations of the passes, cached along with the scene."""
+    return ['merge'] + (['emission'] if args.raw else []) + (['normals'] if args.normals and not args.color else []) \
+        + (['geometry'] if not (args.color or args.raw or args.normals or args.combined) else []) \
+        + (['weld'] if args.weld else [])
+
+def get_scene_key(args):
+    return (args.scene_model, args.dataset, args.drone_model, args.drone, args.samples, args.width, args.height, 
+        args.color, args.raw, args.depth, args.normals, args.normal_map, args.flow, args.mask, args.silhouette, args.combined,
+        args.egocentric, args.ego_output_path, args.weld, args.texture_cache, args.texture_budget,
+        tuple(args.camera_path) + (args.far_dist, args.exo_clip_end, args.ego_fov_h, args.exo_fov_h, args.ego_width, args.ego_height) if args.crop else None) # a cropped scene only serves its trajectories
+
+def run_worker(arguments_vector):
+    scene = { 'key': None }
+    def render_job(job_vector):
+        job_args, _ = parse_arguments(arguments_vector + job_vector)
+        key = get_scene_key(job_args)
+        if key != scene['key']:
+            print("Loading scene %s" % job_args.scene_model)
+            scene['key'] = None # invalidated until fully loaded
+            scene['contents'] = load_scene(job_args)
+            scene['key'], scene['output_path'] = key, job_args.output_path
+        dataset, drone, drone_model, render_engine, output_nodes, ego_output_nodes = scene['contents']
+        if job_args.output_path != scene['output_path']:
+            for node in output_nodes:
+                node.rebase(scene['output_path'], job_args.output_path)
+            scene['output_path'] = job_args.output_path
+        with checkpoint.stop.rendering():
+            for camera_path in job_args.camera_path:
+                render_trajectory(job_args, camera_path, dataset, drone, drone_model, render_engine, output_nodes, ego_output_nodes, False)
+    worker.serve(render_job)
+
+if __name__ == "__main__":
+    arguments_vector, module_path, in_blender = init_script()    
+    args, unknown = parse_arguments(arguments_vector)
+    if args.verbose:
+        print_arguments(args)
+    import_modules(module_path, args.verbose)
+    import deleters
+    import enablers
+    import utils
+    import engine
+    import checkpoint
+    import scenecache
+    import dataset
+    import colour
+    import semantics
+    import suncg
+    import matterport3d
+    import stanford2d3d
+    import airsim
+    import cropping
+    import dji
+    from fleet import worker
+    from fleet import journal
+    from fleet import textures
+
+    if not in_blender:
+        checkpoint.stop.install()
+    if args.worker:
+        run_worker(arguments_vector)
+    else:
+        dataset, drone, drone_model, render_engine, output_nodes, ego_output_nodes = load_scene(args)
+        if in_blender:
+            print("Running from inside blender ...")
+        with checkpoint.stop.rendering():
+            for camera_path in args.camera_path:
+                render_trajectory(args, camera_path, dataset, drone, drone_model, render_engine, output_nodes, ego_output_nodes, in_blender)
@@ -0,0 +1,91 @@
+import os
+import signal
+import sys
+import contextlib
+
+STOP_EXIT_CODE = 128 + signal.SIGTERM
+
+def is_assigned(index, shard=None, pose_range=None):
+    if shard:
+        shard_index, shard_count = (int(v) for v in shard.split('/'))
+        if index % shard_count != shard_index:
+            return False
+    if pose_range:
+        return pose_range[0] <= index < pose_range[1]
+    return True
+
+def get_checkpoint_path(output_path, name):
+    return os.path.join(output_path, "checkpoints", "%s.txt" % name)
+
+class Checkpoint(object):
+    '''
+        The pose indices of a render job that have all of their frames written,
+        appended one per line as they complete so that a restarted job resumes
+        from its first incomplete pose.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.completed = set()
+        self.torn = False
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                contents = f.read()
+            lines = contents.split('\n')
+            self.torn = lines[-1] != '' # an interrupted write, only whole lines count
+            for line in lines[:-1]:
+                if line.strip().isdigit():
+                    self.completed.add(int(line))
+
+    def __contains__(self, index):
+        return index in self.completed
+
+    def add(self, index):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write("%s%d\n" % ('\n' if self.torn else '', index))
+            f.flush()
+            os.fsync(f.fileno())
+        self.torn = False
+        self.completed.add(index)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.completed = set()
+
+class StopSignal(object):
+    '''
+        Defers SIGTERM while rendering, the frame in progress completes and the
+        render loop exits at the next check. Outside of rendering (e.g. a worker
+        waiting for jobs) the process exits right away.
+    '''
+    def __init__(self):
+        self.requested = False
+        self.active = False
+
+    def install(self):
+        signal.signal(signal.SIGTERM, self.__handle__)
+
+    def __handle__(self, signum, frame):
+        self.requested = True
+        if not self.active:
+            sys.exit(STOP_EXIT_CODE)
+        print("Stop requested, exiting after the current frame.", flush=True)
+
+    @contextlib.contextmanager
+    def rendering(self):
+        self.active = True
+        try:
+            yield self
+        finally:
+            self.active = False
+
+    def check(self, on_stop=None):
+        if self.requested:
+            if on_stop is not None:
+                on_stop()
+            sys.exit(STOP_EXIT_CODE)
+
+stop = StopSignal()
@@ -0,0 +1,76 @@
+import bpy
+import bmesh
+
+import numpy
+
+import airsim
+
+def get_frustum_reach(clip_end, fov, width, height):
+    """
+    The farthest a camera sees from its position, to the far corners of its frustum, the
+    field-of-view (in degrees) spanning the larger side of the image as Blender fits it.
+    """
+    tangent = numpy.tan(numpy.radians(fov) / 2.0)
+    return clip_end * numpy.sqrt(1.0 + tangent ** 2 + (tangent * min(width, height) / max(width, height)) ** 2)
+
+def get_trajectory_bounds(camera_paths, cameras):
+    """
+    The box around every drone and pilot position of the trajectories, each expanded
+    by the frustum reach of its camera (cameras, (clip_end, fov, width, height) for each
+    pose of a camera tuple or one for all).
+    """
+    positions = numpy.array([list(pose[0]) for camera_path in camera_paths
+        for camera_tuple in airsim.load_camera_tuples(camera_path) for pose in camera_tuple], dtype=numpy.float64).reshape(-1, 3)
+    cameras = [cameras] if numpy.ndim(cameras) == 1 else cameras
+    margins = numpy.resize(numpy.array([get_frustum_reach(*camera) for camera in cameras], dtype=numpy.float64), len(positions))[:, None] # tuples repeat
+    return (positions - margins).min(axis=0), (positions + margins).max(axis=0)
+
+def get_face_bounds(obj):
+    """The world space box of every face of a mesh object."""
+    mesh = obj.data
+    coordinates = numpy.zeros(len(mesh.vertices) * 3, dtype=numpy.float64)
+    mesh.vertices.foreach_get('co', coordinates)
+    matrix = numpy.array(obj.matrix_world, dtype=numpy.float64)
+    coordinates = coordinates.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    loop_vertices = numpy.zeros(len(mesh.loops), dtype=numpy.int32)
+    mesh.loops.foreach_get('vertex_index', loop_vertices)
+    loop_start = numpy.zeros(len(mesh.polygons), dtype=numpy.int32)
+    mesh.polygons.foreach_get('loop_start', loop_start)
+    corners = coordinates[loop_vertices]
+    return numpy.minimum.reduceat(corners, loop_start, axis=0), numpy.maximum.reduceat(corners, loop_start, axis=0)
+
+def crop(minimum, maximum):
+    """
+    Deletes the faces of the scene meshes that lie fully outside the box (their own
+    box not overlapping it), returning the triangles kept and the triangles before.
+    """
+    kept, total = 0, 0
+    for obj in [o for o in bpy.data.objects if o.type == 'MESH' and len(o.data.polygons)]:
+        mesh = obj.data
+        loop_total = numpy.zeros(len(mesh.polygons), dtype=numpy.int32)
+        mesh.polygons.foreach_get('loop_total', loop_total)
+        face_minimum, face_maximum = get_face_bounds(obj)
+        inside = (face_maximum >= minimum).all(axis=1) & (face_minimum <= maximum).all(axis=1)
+        triangles = loop_total - 2
+        total += int(triangles.sum())
+        kept += int(triangles[inside].sum())
+        if inside.all():
+            continue
+        if not inside.any():
+            bpy.data.objects.remove(obj, do_unlink=True)
+            continue
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        bm.faces.ensure_lookup_table()
+        bmesh.ops.delete(bm, geom=[bm.faces[i] for i in numpy.flatnonzero(~inside)], context='FACES')
+        bm.to_mesh(mesh)
+        bm.free()
+        mesh.update()
+    return kept, total
+
+def crop_to_trajectories(camera_paths, cameras):
+    minimum, maximum = get_trajectory_bounds(camera_paths, cameras)
+    kept, total = crop(minimum, maximum)
+    print("Cropped the scene to the trajectories (%s - %s), kept %d of %d triangles (%.1f%%)" % (
+        numpy.round(minimum, 2).tolist(), numpy.round(maximum, 2).tolist(), kept, total, 100.0 * kept / max(total, 1)))
+    return kept, total
@@ -8,7 +8,7 @@ class Dataset(object):
     def get_instance_name(self, filepath, id):
         raise NotImplementedError("Abstract class")
 
-    def import_model(self, filepath):
+    def import_model(self, filepath, textures=True, weld=False):
         raise NotImplementedError("Abstract class")
 
     def get_camera_position(self, filepath):
@@ -29,6 +29,15 @@ class Dataset(object):
     def get_color_output(self, output_path, base_filename, nodes, links, compositor):
         raise NotImplementedError("Abstract class")
 
+    def prepare_emission(self):
+        raise NotImplementedError("Abstract class")
+
+    def prepare_normals(self):
+        raise NotImplementedError("Abstract class")
+
+    def prepare_geometry(self):
+        raise NotImplementedError("Abstract class")
+
     def get_emission_output(self, output_path, base_filename, nodes, links, compositor):
         raise NotImplementedError("Abstract class")
 
@@ -1,5 +1,7 @@
 import bpy
 
+import os
+
 from math import radians
 
 class Cycles28(object):
@@ -13,7 +15,8 @@ class Cycles28(object):
         label_pass: bool=False,
         raw_pass: bool=False,
         flow_pass: bool=False,
-        object_pass: bool=False
+        object_pass: bool=False,
+        threads: int=None
     ):
         print(f"Setting device to {device_type}:{device_id}")
         bpy.context.scene.render.engine = 'CYCLES' 
@@ -31,7 +34,7 @@ class Cycles28(object):
         # bpy.context.preferences.addons['cycles'].preferences.devices[device_id].use = True
         #print(f"Setting device {device_id} to {bpy.context.preferences.addons['cycles'].preferences.devices[device_id].use}")
         bpy.context.scene.render.threads_mode = 'AUTO' if device_type == 'GPU' else 'FIXED'
-        bpy.context.scene.render.threads = 1 if device_type == 'GPU' else 4
+        bpy.context.scene.render.threads = 1 if device_type == 'GPU' else (threads or 4)
         bpy.context.scene.render.image_settings.color_mode = 'RGB'
         bpy.context.scene.render.image_settings.use_zbuffer = depth_pass
         bpy.context.scene.view_layers[0].use_pass_normal = normal_pass
@@ -46,7 +49,7 @@ class Cycles28(object):
         bpy.context.scene.cycles.debug_bvh_type = 'STATIC_BVH'
         bpy.data.scenes[0].cycles.samples = samples
         self.spherical_camera = None
-        self.perspective_camera = None
+        self.perspective_cameras = {}
         print(f"Blender Cycles Device set to {bpy.context.scene.cycles.device}")
 
     def get_scene_nodes(self):
@@ -57,7 +60,7 @@ class Cycles28(object):
         compositor = tree.nodes.new('CompositorNodeRLayers')
         return tree.nodes, tree.links, compositor
 
-    def get_camera(self, camera_type, render_width, render_height, fov_h=90.0):
+    def get_camera(self, camera_type, render_width, render_height, fov_h=90.0, name='Perspective'):
         if camera_type == 'spherical':
             if self.spherical_camera is None:
                 bpy.ops.object.camera_add(align='WORLD', enter_editmode=False, \
@@ -72,19 +75,20 @@ class Cycles28(object):
                 bpy.context.scene.render.resolution_y = render_width // 2
             return self.spherical_camera
         elif camera_type == 'perspective':
-            if self.perspective_camera is None:
+            if name not in self.perspective_cameras:
                 bpy.ops.object.camera_add(align='WORLD', enter_editmode=False, \
                     location=(0.0, 0.0, 0.0), rotation=(0.0, 0.0, 0.0))        
-                self.perspective_camera = bpy.context.object
-                self.perspective_camera.name = 'Perspective'
-                self.perspective_camera.data.name = self.perspective_camera.name
-                cam = bpy.data.cameras[self.perspective_camera.name]      
+                perspective_camera = bpy.context.object
+                perspective_camera.name = name
+                perspective_camera.data.name = perspective_camera.name
+                cam = bpy.data.cameras[perspective_camera.name]      
                 cam.type = 'PERSP'
                 cam.lens_unit = 'FOV'
                 cam.angle = radians(fov_h)
                 bpy.context.scene.render.resolution_x = render_width
                 bpy.context.scene.render.resolution_y = render_height
-            return self.perspective_camera
+                self.perspective_cameras[name] = perspective_camera
+            return self.perspective_cameras[name]
         else:
             return None
 
@@ -102,4 +106,11 @@ class OutputNode(object):
 
     def prepare_render(self, position_type, degrees, camera_type, index=0):
         self.output_layer.file_slots[0].path = "%d_%s_#_%s_%s_%d" \
-            % (index, camera_type, self.output_type, position_type, degrees)
\ No newline at end of file
+            % (index, camera_type, self.output_type, position_type, degrees)
+
+    def rebase(self, output_path, new_output_path):
+        self.output_layer.base_path = os.path.join(new_output_path, \
+            os.path.relpath(self.output_layer.base_path, output_path))
+
+    def enable(self, flag):
+        self.output_layer.mute = not flag
\ No newline at end of file
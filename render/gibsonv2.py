@@ -7,6 +7,7 @@ import bmesh
 from mathutils import Vector, Euler
 
 from dataset import Dataset
+import meshloader
 
 class GibsonV2(Dataset):
     def __init__(self):
@@ -15,11 +16,13 @@ class GibsonV2(Dataset):
     def __str__(self):
         return self.name
 
-    def import_model(self, filepath):
+    def import_model(self, filepath, textures=True, weld=False):
         _, ext = os.path.os.path.splitext(filepath)
-        if ext == '.obj':            
+        if ext == '.obj' and textures and not weld:
             bpy.ops.import_scene.obj("EXEC_DEFAULT", filepath=filepath,
                 axis_forward='Y', axis_up='Z')
+        elif ext in ('.obj', '.ply', meshloader.meshformat.EXTENSION): # PLYs (and welded and geometry-only meshes) read natively, without a MeshLab conversion
+            meshloader.load(filepath, axis_forward='Y', axis_up='Z', textures=textures, weld=weld)
         else:
             print("error loading incorrect matterport mesh, unknown extension: " + ext)
 
@@ -79,13 +82,19 @@ class GibsonV2(Dataset):
         links.new(compositor.outputs['Image'], image_out.inputs["color"])
         return image_out
 
-    def get_emission_output(self, output_path, base_filename, nodes, links, compositor):
+    def prepare_emission(self):
         for m in bpy.data.materials:
+            if m.get('emission_prepared'): # e.g. in a cached scene
+                continue
             m.node_tree.links.remove(m.node_tree.nodes["Image Texture"].outputs['Color'].links[0])
             m.node_tree.links.new(
                 m.node_tree.nodes["Image Texture"].outputs['Color'],
                 m.node_tree.nodes["Principled BSDF"].inputs['Emission']
             )
+            m['emission_prepared'] = True
+
+    def get_emission_output(self, output_path, base_filename, nodes, links, compositor):
+        self.prepare_emission()
         emission_out = nodes.new('CompositorNodeOutputFile')
         emission_out.format.file_format = 'PNG'
         emission_out.format.quality = 100
@@ -97,10 +106,11 @@ class GibsonV2(Dataset):
         links.new(compositor.outputs['Emit'], emission_out.inputs["emission"])
         return emission_out
 
-    def get_normals_output(self, output_path, base_filename, nodes, links, compositor):
-        meshes = [mesh for mesh in bpy.data.objects if mesh.type == 'MESH']
+    def prepare_normals(self):
+        meshes = [mesh for mesh in bpy.data.objects if mesh.type == 'MESH' and not mesh.data.get('normals_prepared')]
         bm = bmesh.new()     
         for mesh in meshes:
+            mesh.data['normals_prepared'] = True
             bm.from_mesh(mesh.data)
             bmesh.ops.recalc_face_normals(bm, faces=bm.faces)
             bm.to_mesh(mesh.data)
@@ -108,8 +118,9 @@ class GibsonV2(Dataset):
             mesh.data.update()
             mesh.data.use_auto_smooth = True
             for slot in mesh.material_slots:
-                if slot.material.node_tree.nodes.find("Diffuse Texture") > 0:
+                if slot.material.node_tree.nodes.find("Diffuse Texture") > 0 and not slot.material.get('normals_prepared'):
                     material = slot.material
+                    material['normals_prepared'] = True
                     material.node_tree.nodes.new('ShaderNodeMapping')          
                     material.node_tree.nodes['Mapping'].vector_type = 'NORMAL'
                     material.node_tree.nodes['Mapping'].rotation[0] = math.radians(0) # X
@@ -128,6 +139,12 @@ class GibsonV2(Dataset):
                         material.node_tree.nodes['Vector Transform'].outputs['Vector'],\
                         material.node_tree.nodes['Diffuse BSDF'].inputs['Color'])
         bm.free()
+
+    def prepare_geometry(self):
+        meshloader.strip_textures() # the images were not even loaded, see import_model()
+
+    def get_normals_output(self, output_path, base_filename, nodes, links, compositor):
+        self.prepare_normals()
         normals_out = nodes.new('CompositorNodeOutputFile')
         normals_out.format.file_format = 'OPEN_EXR'
         normals_out.format.color_depth = '32'
@@ -0,0 +1,202 @@
+import bpy
+
+import argparse
+import os
+import sys
+import time
+
+import numpy
+from bpy_extras.io_utils import axis_conversion
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # for the shared fleet modules
+
+from fleet import meshformat
+
+def get_material(entry, textures=True, layout='principled'):
+    """
+    A material wired like the ones the dataset passes rewire: those of the OBJ importer
+    (principled) or those of the Cycles material conversion (diffuse, a "Color Mult" of
+    the "Diffuse Texture" and the colour into a "Diffuse BSDF").
+    """
+    material = bpy.data.materials.new(entry['name'])
+    material.use_nodes = True
+    tree = material.node_tree
+    if 'diffuse' in entry:
+        material.diffuse_color = entry['diffuse'] + [entry.get('alpha', 1.0)]
+    color = entry.get('diffuse', [0.8, 0.8, 0.8]) + [1.0]
+    if layout == 'diffuse':
+        tree.nodes.remove(tree.nodes["Principled BSDF"])
+        coordinates = tree.nodes.new('ShaderNodeTexCoord') # named "Texture Coordinate"
+        mult = tree.nodes.new('ShaderNodeMixRGB')
+        mult.name = mult.label = "Color Mult"
+        mult.blend_type = 'MULTIPLY'
+        mult.inputs['Fac'].default_value = 1.0
+        mult.inputs['Color1'].default_value = [1.0, 1.0, 1.0, 1.0] # the texture, when there is one
+        mult.inputs['Color2'].default_value = color
+        bsdf = tree.nodes.new('ShaderNodeBsdfDiffuse') # named "Diffuse BSDF"
+        tree.links.new(mult.outputs['Color'], bsdf.inputs['Color'])
+        tree.links.new(bsdf.outputs['BSDF'], tree.nodes["Material Output"].inputs['Surface'])
+    else:
+        bsdf = tree.nodes["Principled BSDF"]
+        if 'diffuse' in entry:
+            bsdf.inputs['Base Color'].default_value = color
+    if 'texture' in entry and textures:
+        texture = tree.nodes.new('ShaderNodeTexImage') # named "Image Texture"
+        try:
+            texture.image = bpy.data.images.load(entry['texture'], check_existing=True)
+        except RuntimeError as e:
+            print("!!! - Could not load %s (%s)" % (entry['texture'], e))
+        if layout == 'diffuse':
+            texture.name = texture.label = "Diffuse Texture"
+            tree.links.new(coordinates.outputs['UV'], texture.inputs['Vector'])
+            tree.links.new(texture.outputs['Color'], mult.inputs['Color1'])
+        else:
+            tree.links.new(texture.outputs['Color'], bsdf.inputs['Base Color'])
+    return material
+
+def build(name, arrays, materials, axis_forward='-Z', axis_up='Y', textures=True, layout='principled'):
+    """
+    Builds a mesh object from the arrays of the binary layout with bulk foreach_set
+    calls, converting the axes like the OBJ importer does.
+    """
+    rotation = numpy.array(axis_conversion(from_forward=axis_forward, from_up=axis_up).to_3x3(), dtype=numpy.float32)
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(arrays['vertices']))
+    mesh.vertices.foreach_set('co', (arrays['vertices'] @ rotation.T).ravel())
+    mesh.loops.add(len(arrays['loop_vertices']))
+    mesh.loops.foreach_set('vertex_index', arrays['loop_vertices'])
+    mesh.polygons.add(len(arrays['loop_start']))
+    mesh.polygons.foreach_set('loop_start', arrays['loop_start'])
+    mesh.polygons.foreach_set('loop_total', arrays['loop_total'])
+    mesh.polygons.foreach_set('material_index', arrays['material_ids'].astype(numpy.int32))
+    if 'uvs' in arrays:
+        mesh.uv_layers.new(name='UVMap').data.foreach_set('uv', arrays['uvs'].ravel())
+    for entry in materials:
+        mesh.materials.append(get_material(entry, textures, layout) if entry else None)
+    mesh.validate(clean_customdata=False)
+    mesh.update(calc_edges=True)
+    if 'normals' in arrays and len(arrays['normals']) == len(mesh.loops): # unless validate dropped faces
+        mesh.polygons.foreach_set('use_smooth', numpy.ones(len(mesh.polygons), dtype=bool))
+        mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set(arrays['normals'] @ rotation.T)
+    if 'original_material_ids' in arrays: # side table of an atlased mesh
+        layer = mesh.polygon_layers_int.new(name='original_material')
+        layer.data.foreach_set('value', arrays['original_material_ids'].astype(numpy.int32))
+        mesh['material_names'] = [str(n) for n in arrays['material_names']]
+    obj = bpy.data.objects.new(name, mesh)
+    bpy.context.collection.objects.link(obj)
+    return obj
+
+def load(filepath, axis_forward='-Z', axis_up='Y', textures=True, weld=False, layout='principled'):
+    """
+    Loads a binary mesh, or a source mesh parsed natively (e.g. a PLY never converted),
+    its materials in the node layout of the dataset (see get_material()).
+    """
+    arrays, materials = meshformat.read_source(filepath)
+    if weld:
+        arrays, report = meshformat.weld(arrays)
+        print("Welded %s: %s" % (filepath, meshformat.format_report(report)))
+    return build(os.path.splitext(os.path.basename(filepath))[0], arrays, materials, axis_forward, axis_up, textures, layout)
+
+def remap_images(variants):
+    """Points the images at their downscaled variants, before their pixels are first loaded."""
+    for image in bpy.data.images:
+        variant = variants.get(os.path.normpath(bpy.path.abspath(image.filepath)))
+        if variant is not None:
+            image.filepath = variant
+
+def split_materials(get_label):
+    """
+    Splits the collapsed materials of atlased meshes back by label, into the fewest
+    materials that keep every face's label, each named after an original material
+    of its label so the label lookups by material name still work.
+    """
+    for mesh in bpy.data.meshes:
+        if 'material_names' not in mesh or mesh.get('materials_split') or 'original_material' not in mesh.polygon_layers_int:
+            continue
+        mesh['materials_split'] = True
+        names = list(mesh['material_names'])
+        labels = numpy.array([get_label(n) if n else -1 for n in names])
+        original = numpy.zeros(len(mesh.polygons), dtype=numpy.int32)
+        mesh.polygon_layers_int['original_material'].data.foreach_get('value', original)
+        current = numpy.zeros(len(mesh.polygons), dtype=numpy.int32)
+        mesh.polygons.foreach_get('material_index', current)
+        pairs, first, material_index = numpy.unique(numpy.stack([current, labels[original]], axis=1),
+            axis=0, return_index=True, return_inverse=True)
+        materials = list(mesh.materials)
+        mesh.materials.clear()
+        used = set()
+        for (slot, label), face in zip(pairs, first):
+            material = materials[slot]
+            if material is not None and label >= 0:
+                material = material.copy() if slot in used else material # the node tree is small, the atlas image shared
+                material.name = names[original[face]]
+            used.add(slot)
+            mesh.materials.append(material)
+        mesh.polygons.foreach_set('material_index', material_index.reshape(-1).astype(numpy.int32))
+        mesh.update()
+        for material in materials: # collapsed materials no face uses any more
+            if material is not None and material.users == 0:
+                bpy.data.materials.remove(material)
+
+def strip_textures():
+    """
+    Rewires every material to a plain diffuse shader of its colour and removes the
+    images, for the passes that only need the geometry. The material names, which
+    the label maps are looked up by, are kept.
+    """
+    for material in bpy.data.materials:
+        if material.get('geometry_prepared'): # e.g. in a cached scene
+            continue
+        material.use_nodes = True
+        tree = material.node_tree
+        tree.nodes.clear()
+        bsdf = tree.nodes.new('ShaderNodeBsdfDiffuse')
+        bsdf.inputs['Color'].default_value = material.diffuse_color
+        output = tree.nodes.new('ShaderNodeOutputMaterial')
+        tree.links.new(bsdf.outputs['BSDF'], output.inputs['Surface'])
+        material['geometry_prepared'] = True
+    for image in [i for i in bpy.data.images if i.type == 'IMAGE']: # not the render results
+        bpy.data.images.remove(image, do_unlink=True)
+
+def clear():
+    for collection in [bpy.data.objects, bpy.data.meshes, bpy.data.materials, bpy.data.images]:
+        for item in list(collection):
+            collection.remove(item, do_unlink=True)
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(description="Benchmarks loading the binary meshes, with and without their textures, against the OBJ importer.")
+    parser.add_argument('--scene_model', help='The .obj mesh(es), converted first when needed.', default=[], nargs='+')
+    parser.add_argument('--axis_forward', help='Forward axis of the meshes.', default='Y')
+    parser.add_argument('--axis_up', help='Up axis of the meshes.', default='Z')
+    parser.add_argument('--repeats', help='Loads of each mesh with each loader.', default=3, type=int)
+    return parser.parse_known_args(args)
+
+if __name__ == "__main__":
+    arguments_vector = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    args, unknown = parse_arguments(arguments_vector)
+    for scene_model in args.scene_model:
+        if not meshformat.is_converted(scene_model):
+            print("Converted %s in %.2fs" % (scene_model, meshformat.convert(scene_model)))
+        loaders = {
+            'obj': lambda: bpy.ops.import_scene.obj("EXEC_DEFAULT", filepath=scene_model,
+                axis_forward=args.axis_forward, axis_up=args.axis_up),
+            'binary': lambda: load(meshformat.get_binary_path(scene_model), args.axis_forward, args.axis_up),
+            'geometry': lambda: load(scene_model, args.axis_forward, args.axis_up, textures=False), # as the geometry-only passes import
+        }
+        timings = { name: [] for name in loaders }
+        for _ in range(args.repeats):
+            for name, loader in loaders.items():
+                clear()
+                start = time.time()
+                loader()
+                timings[name].append(time.time() - start)
+                faces = sum(len(o.data.polygons) for o in bpy.data.objects if o.type == 'MESH')
+                images = len([i for i in bpy.data.images if i.type == 'IMAGE'])
+                print("%s: %s loaded %d faces and %d images in %.2fs" % (scene_model, name, faces, images, timings[name][-1]))
+                if name == 'geometry' and images > 0:
+                    print("!!! - The geometry-only load of %s loaded %d images." % (scene_model, images))
+        best = { name: min(t) for name, t in timings.items() }
+        print("%s: obj %.2fs, binary %.2fs (%.1fx faster), geometry only %.2fs (%.1fx faster)" % (scene_model, best['obj'], best['binary'],
+            best['obj'] / max(best['binary'], 1e-6), best['geometry'], best['obj'] / max(best['geometry'], 1e-6)))
@@ -0,0 +1,146 @@
+import bpy
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # for the shared fleet modules
+
+import enablers
+import meshloader
+from fleet import staging
+from fleet import textures
+
+VERSION = 1 # bump when a preparation changes, invalidating the cached scenes
+SAMPLE_BYTES = 1 << 20 # hashed at both ends of every source file
+PREPARATIONS = ['merge', 'emission', 'normals', 'geometry', 'weld']
+
+def get_source_files(filepath):
+    return staging.get_scene_files(filepath) or [filepath]
+
+def get_external_textures(filepath, preparations, texture_variants=None):
+    """The full size textures a prepared scene references, those without a variant (see save())."""
+    if 'geometry' in preparations: # the images are removed
+        return []
+    return sorted(os.path.normpath(os.path.abspath(f)) for f in get_source_files(filepath) if f.lower().endswith(textures.TEXTURE_EXTENSIONS)
+        and os.path.normpath(os.path.abspath(f)) not in (texture_variants or {}))
+
+def get_key(dataset, filepath, preparations, texture_variants=None):
+    """
+    Content key of a prepared scene, from the sampled contents, sizes and mtimes of
+    its mesh, materials and textures rather than their paths, so staged copies of a
+    scene share its cached file, unless it references full size textures by path.
+    """
+    digest = hashlib.sha1(json.dumps([VERSION, bpy.app.version_string, str(dataset), sorted(preparations),
+        sorted(os.path.basename(v) for v in (texture_variants or {}).values()), # variants are named by content and level
+        get_external_textures(filepath, preparations, texture_variants)]).encode())
+    folder = os.path.dirname(filepath)
+    for filename in get_source_files(filepath):
+        stat = os.stat(filename)
+        digest.update(f"{os.path.relpath(filename, folder)}:{stat.st_size}:{int(stat.st_mtime)}".encode())
+        with open(filename, 'rb') as f:
+            digest.update(f.read(SAMPLE_BYTES))
+            if stat.st_size > 2 * SAMPLE_BYTES:
+                f.seek(-SAMPLE_BYTES, os.SEEK_END)
+                digest.update(f.read())
+    return digest.hexdigest()[:20]
+
+def get_cached_path(cache_path, dataset, filepath, preparations, texture_variants=None):
+    return os.path.join(cache_path, f"{dataset.get_instance_name(filepath)}_{get_key(dataset, filepath, preparations, texture_variants)}.blend")
+
+def prepare(dataset, filepath, preparations, texture_variants=None):
+    dataset.import_model(filepath, textures='geometry' not in preparations, weld='weld' in preparations)
+    if texture_variants:
+        meshloader.remap_images(texture_variants)
+    if 'merge' in preparations:
+        enablers.merge_all()
+    if 'emission' in preparations:
+        dataset.prepare_emission()
+    if 'normals' in preparations:
+        dataset.prepare_normals()
+    if 'geometry' in preparations:
+        dataset.prepare_geometry()
+
+def save(blend_path, texture_variants=None):
+    """
+    Writes the prepared scene, packing the downscaled variants only; the full size
+    textures stay external, referenced by absolute path (part of the key).
+    """
+    os.makedirs(os.path.dirname(blend_path), exist_ok=True)
+    variant_paths = set(os.path.normpath(v) for v in (texture_variants or {}).values())
+    for image in bpy.data.images:
+        if image.source == 'FILE' and image.packed_file is None \
+            and os.path.normpath(bpy.path.abspath(image.filepath)) in variant_paths:
+            image.pack()
+    bpy.ops.file.make_paths_absolute() # opened from the cache folder
+    temp_path = f"{blend_path}.{os.getpid()}.partial.blend" # a partial file never looks cached
+    bpy.ops.wm.save_as_mainfile(filepath=temp_path, copy=True)
+    os.replace(temp_path, blend_path)
+
+def load(dataset, filepath, cache_path=None, preparations=(), texture_variants=None):
+    """
+    Opens the prepared .blend of the scene from the cache, or imports and prepares
+    the scene, writing it to the cache when a cache path is given. The textures are
+    swapped for their downscaled variants when given (see fleet/textures.py).
+    Returns whether the scene was cached.
+    """
+    blend_path = get_cached_path(cache_path, dataset, filepath, preparations, texture_variants) if cache_path else None
+    if blend_path and os.path.exists(blend_path):
+        print("Opening prepared scene %s" % blend_path)
+        bpy.ops.wm.open_mainfile(filepath=blend_path)
+        return True
+    prepare(dataset, filepath, preparations, texture_variants)
+    if blend_path:
+        print("Caching prepared scene %s" % blend_path)
+        save(blend_path, texture_variants)
+    return False
+
+def get_dataset(dataset):
+    if dataset == 'suncg':
+        return suncg.SunCG()
+    if dataset == 'matterport3d':
+        return matterport3d.Matterport3D()
+    if dataset == 'stanford2d3d':
+        return stanford2d3d.Stanford2D3D()
+    if dataset == 'gibsonv2':
+        return gibsonv2.GibsonV2()
+    else:
+        print("!!! - Erroneous dataset selection.")
+
+def parse_arguments(args):
+    parser = argparse.ArgumentParser(description="Prepares scenes and writes them to the scene cache.")
+    parser.add_argument('--scene_model', '--input_file', dest='scene_model', help='The 3D scene file(s) to prepare.',\
+        default=[], nargs='+')
+    parser.add_argument('--dataset', help='Which dataset the scenes belong to.', \
+        default='matterport3d', choices=['suncg', 'matterport3d', 'stanford2d3d', 'gibsonv2'])
+    parser.add_argument('--scene_cache', help='Folder of the prepared .blend scenes.', default=None)
+    parser.add_argument('--preparations', help='Preparations applied to the scenes, as the render scripts do for their passes.',\
+        default=['emission'], nargs='*', choices=PREPARATIONS)
+    parser.add_argument('--texture_cache', help='Local folder of the downscaled textures, as given to the render scripts.', default=None)
+    parser.add_argument('--texture_budget', help='Memory budget (MB) of the textures, as given to the render scripts.',\
+        default=textures.DEFAULT_BUDGET, type=float)
+    parser.add_argument('--resolution', help='Largest output dimension of the render jobs, which picks the texture level.', default=None, type=int)
+    return parser.parse_known_args(args)
+
+if __name__ == "__main__":
+    arguments_vector = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    args, unknown = parse_arguments(arguments_vector) # device arguments are ignored
+    import deleters
+    import suncg
+    import matterport3d
+    import stanford2d3d
+    import gibsonv2
+    for scene_model in args.scene_model:
+        dataset = get_dataset(args.dataset)
+        texture_variants = textures.get_variants(scene_model, args.texture_cache, args.resolution, args.texture_budget) \
+            if args.texture_cache else None
+        if os.path.exists(get_cached_path(args.scene_cache, dataset, scene_model, args.preparations, texture_variants)):
+            print("Already cached %s" % scene_model)
+            continue
+        bpy.ops.wm.read_homefile() # the startup scene the render scripts clear
+        deleters.delete_all()
+        deleters.delete_materials()
+        load(dataset, scene_model, args.scene_cache, args.preparations, texture_variants)
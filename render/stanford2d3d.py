@@ -8,6 +8,7 @@ from mathutils import Vector
 from mathutils import Euler
 
 from dataset import Dataset
+import meshloader
 import utils
 
 class Stanford2D3D(Dataset):
@@ -17,7 +18,11 @@ class Stanford2D3D(Dataset):
     def __str__(self):
         return self.name
 
-    def import_model(self, filepath):
+    def import_model(self, filepath, textures=True, weld=False):
+        if filepath.endswith(meshloader.meshformat.EXTENSION) or weld or not textures: # welded and geometry-only meshes are read natively, the latter without their images
+            meshloader.load(filepath, axis_forward='-Z', axis_up='Y', textures=textures, weld=weld,
+                layout='diffuse') # the nodes prepare_emission() and prepare_normals() rewire
+            return
         bpy.ops.import_scene.obj("EXEC_DEFAULT", filepath=filepath, \
             axis_forward='-Z', axis_up='Y')
 
@@ -73,14 +78,20 @@ class Stanford2D3D(Dataset):
         links.new(compositor.outputs['Image'], image_out.inputs["color"])
         return image_out
 
-    def get_emission_output(self, output_path, base_filename, nodes, links, compositor):
+    def prepare_emission(self):
         for m in bpy.data.materials:
+            if m.get('emission_prepared'): # e.g. in a cached scene
+                continue
             if 'Color Mult' not in m.node_tree.nodes.keys():
                 continue
             m.node_tree.links.remove(m.node_tree.nodes["Color Mult"].outputs[0].links[0])
             emission = m.node_tree.nodes.new(type="ShaderNodeEmission")
             m.node_tree.links.new(m.node_tree.nodes["Color Mult"].outputs[0], emission.inputs[0])
             m.node_tree.links.new(emission.outputs[0], m.node_tree.nodes["Material Output"].inputs[0])
+            m['emission_prepared'] = True
+
+    def get_emission_output(self, output_path, base_filename, nodes, links, compositor):
+        self.prepare_emission()
         emission_out = nodes.new('CompositorNodeOutputFile')
         emission_out.format.file_format = 'PNG'
         emission_out.format.quality = 100
@@ -92,10 +103,11 @@ class Stanford2D3D(Dataset):
         links.new(compositor.outputs['Emit'], emission_out.inputs["raw"])
         return emission_out
 
-    def get_normals_output(self, output_path, base_filename, nodes, links, compositor):
-        meshes = [mesh for mesh in bpy.data.objects if mesh.type == 'MESH']
+    def prepare_normals(self):
+        meshes = [mesh for mesh in bpy.data.objects if mesh.type == 'MESH' and not mesh.data.get('normals_prepared')]
         bm = bmesh.new()     
         for mesh in meshes:
+            mesh.data['normals_prepared'] = True
             bm.from_mesh(mesh.data)
             bmesh.ops.recalc_face_normals(bm, faces=bm.faces)
             bm.to_mesh(mesh.data)
@@ -103,8 +115,9 @@ class Stanford2D3D(Dataset):
             mesh.data.update()
             mesh.data.use_auto_smooth = True
             for slot in mesh.material_slots:
-                if slot.material.node_tree.nodes.find("Diffuse Texture") > 0:
+                if slot.material.node_tree.nodes.find("Diffuse Texture") > 0 and not slot.material.get('normals_prepared'):
                     material = slot.material
+                    material['normals_prepared'] = True
                     material.node_tree.nodes.new('ShaderNodeMapping')          
                     material.node_tree.nodes['Mapping'].vector_type = 'NORMAL'
                     material.node_tree.nodes['Mapping'].rotation[0] = math.radians(0) # X
@@ -123,6 +136,12 @@ class Stanford2D3D(Dataset):
                         material.node_tree.nodes['Vector Transform'].outputs['Vector'],\
                         material.node_tree.nodes['Diffuse BSDF'].inputs['Color'])
         bm.free()
+
+    def prepare_geometry(self):
+        meshloader.strip_textures() # the images were not even loaded, see import_model()
+
+    def get_normals_output(self, output_path, base_filename, nodes, links, compositor):
+        self.prepare_normals()
         normals_out = nodes.new('CompositorNodeOutputFile')
         normals_out.format.file_format = 'OPEN_EXR'
         normals_out.format.color_depth = '32'
@@ -158,6 +177,7 @@ class Stanford2D3D(Dataset):
     def get_semantic_map_output(self, labels_path, output_path, base_filename, nodes, links, compositor):
         with open(labels_path) as f:
             categories = json.load(f)
+        meshloader.split_materials(lambda name: categories[name]['id']) # atlased meshes
         for material in bpy.data.materials:
             material.pass_index = categories[material.name]['id']
         # material id output
@@ -175,6 +195,7 @@ class Stanford2D3D(Dataset):
     def get_pretty_semantic_map_output(self, labels_path, output_path, base_filename, nodes, links, compositor):
         with open(labels_path) as f:
             categories = json.load(f)
+        meshloader.split_materials(lambda name: categories[name]['id']) # atlased meshes
         for material in bpy.data.materials:
             material.pass_index = categories[material.name]['id']        
         for material in bpy.data.materials: